@@ -10,29 +10,60 @@ CORRECCIONES v2.2:
   - UUID completo visible en HTML con scroll horizontal (no truncado)
   - Ceros mostrados como guion en HTML (no "0.0")
   - classify() unifica color+css+filtro en 1 sola funcion (1 solo .upper() por fila)
+  - StringIO para HTML (no concatenar string gigante en RAM)
   - idx_razones construido UNA vez -> O(1) por busqueda
   - is_cp calculado UNA vez por fila
-  - StringIO para HTML (no concatenar string gigante en RAM)
   - Regimen detectado dinamicamente por cliente (612/626/otros)
+
+PASO 3 EN UNA PASADA:
+  - clasificar_filas() calcula UNA vez por fila estatus, colores, UUID
+    relacionado y observacion (FilaReporte); Excel, HTML y DIOT solo
+    leen esos registros
+  - PPD pendiente = consulta a un set de UUID ya normalizados
+
+DATOS DEL PASO 2 EN MEMORIA:
+  - generar_reporte(..., validado=TablaValidado) usa las columnas que
+    dejo el motor (filas_desde_tabla); sin ella, o al ejecutar este
+    archivo directo, se lee el _validado.xlsx (leer_validado)
+
+FILAS POR COLUMNA (models/tabla_reporte.py):
+  - leer_validado / filas_desde_tabla devuelven una TablaReporte:
+    importes float64, catalogos como codigos, UUID/RFC internados
+  - detectar_regimen, construir_indice_razones, detectar_ppd y la DIOT
+    operan sobre columnas completas (bincount, factorize, pandas .str);
+    Excel y HTML leen cada fila con FilaVista (f['uuid'], f.get(...))
+
+DASHBOARD HTML SIN UNA <tr> POR FACTURA:
+  - generar_html ya no arma cada fila (con sus 14 <option>): escribe
+    las filas como JSON por columnas (datos_html) y reporte_template.js
+    pinta solo las que se ven al hacer scroll (scroll virtual)
 """
 
 import os
 import re
+import sys
+import json
+import math
 import time
-from io import StringIO
 from pathlib import Path
 import openpyxl
 from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
 from openpyxl.utils import get_column_letter
 from datetime import datetime
-
-USOS_VALIDOS    = {'G01', 'G02', 'G03'}
-METODOS_VALIDOS = {'PUE', 'PPD'}
-FORMAS_VALIDAS  = {'01', '02', '03', '04', '28'}
-LIMITE_EFECTIVO = 2000.0
-
-# Claves de Deducción Personal (Art. 147 LISR - CFDI 4.0)
-CLAVES_DEDUCCION_PERSONAL = {'D01','D02','D03','D04','D05','D06','D07','D08','D09','D10'}
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+
+# Raíz del proyecto en sys.path (también al ejecutarlo directo)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from models.resultado_validacion import indices_reporte
+from models.tabla_reporte import TablaReporte, FilaVista, CATALOGOS
+from models.reglas import Valor
+from models.conciliacion_ppd import conciliar_ppd, norm_uuid
+# Reglas del estatus: una sola tabla, compartida con el Paso 2
+from models.validaciones_fiscales import (
+    ESTATUS_REPORTE, estatus_reporte,
+    detectar_deduccion_personal, detectar_deduccion_personal_serie)
 
 _RE_UUID_FULL  = re.compile(
     r'[0-9A-Fa-f]{8}-[0-9A-Fa-f]{4}-[0-9A-Fa-f]{4}-[0-9A-Fa-f]{4}-[0-9A-Fa-f]{12}',
@@ -87,49 +118,17 @@ def extraer_codigo(val, n=3):
         return s.split('-')[0].strip()[:n].upper()
     return s[:n].upper()
 
-def detectar_deduccion_personal(conceptos: str, regimen: str = '612') -> bool:
+def marcar_deduccion_personal(filas):
     """
-    Detecta si el concepto contiene claves de deducción personal (D01-D10).
-    Solo aplica para Régimen 612.
-    
-    Args:
-        conceptos: String con descripción/conceptos del CFDI
-        regimen: Código de régimen (solo detecta si es 612)
-        
-    Returns:
-        True si es régimen 612 y contiene clave D01-D10
+    f['clave_personal'] = el concepto trae clave D01-D10.
+    UNA pasada por reporte; Excel, HTML y fórmulas solo leen la marca.
+    (El régimen 612 lo exige la tabla ESTATUS_REPORTE, no la marca.)
     """
-    # Solo aplica para régimen 612
-    if regimen != '612':
-        return False
-    
-    if not conceptos:
-        return False
-    
-    conceptos_upper = str(conceptos).upper()
-    
-    # Buscar cualquiera de las claves de deducción personal
-    for clave in CLAVES_DEDUCCION_PERSONAL:
-        if clave in conceptos_upper:
-            # Validar que sea la clave completa con separadores
-            if re.search(r'(\s|^|[|,;-])' + clave + r'(\s|$|[|,;.\)])', conceptos_upper):
-                return True
-    
-    return False
+    filas.marcar('clave_personal', detectar_deduccion_personal_serie(filas.columna('conceptos')))
 
 def safe_str(v):
     return str(v).strip() if v is not None else ''
 
-def norm_uuid(u):
-    return re.sub(r'[-\s]', '', str(u or '')).lower()
-
-def fmt_num(v):
-    try:
-        f = float(v)
-        return '$%s' % '{:,.2f}'.format(f) if f != 0 else '-'
-    except Exception:
-        return '-'
-
 def extraer_uuids_de_texto(texto):
     """Extrae UUIDs de texto libre. Busca UUID completo primero, luego sufijo 12 hex."""
     if not texto:
@@ -156,156 +155,127 @@ def classify(estatus):
     return                         ('FFFFFF','000000','no-ded','no-ded')
 
 
+def _num(v):
+    try:
+        return float(v) if v is not None else 0.0
+    except Exception:
+        return 0.0
+
+
+def _redondear(valores):
+    """round(x, 2) de Python por elemento (np.round redondea distinto en x.xx5)."""
+    return [round(x, 2) for x in valores]
+
+
+def _armar_filas(columnas, n):
+    """
+    TablaReporte del Paso 3 a partir de columnas de valores crudos.
+    columnas = {campo: lista de n valores o None si falta} (CAMPOS_REPORTE).
+    """
+    vacia = [None] * n
+
+    def col(campo):
+        valores = columnas.get(campo)
+        return vacia if valores is None else valores
+
+    def num(campo):
+        return np.fromiter(map(_num, col(campo)), dtype=np.float64, count=n)
+
+    def texto(campo):
+        return [safe_str(v) for v in col(campo)]
+
+    st, dc   = num('subtotal'), num('descuento')
+    iva0     = num('iva0')
+    iva_ex   = num('iva_ex')
+    ieps3    = num('ieps3')
+
+    # ── sub0: misma lógica que el motor, usando valores crudos ────
+    # No leer la columna SUB0% (es fórmula Excel sin caché en Python)
+    # Gasolina con IEPS: motor copia IEPS a IVA_0% e IVA_Exento
+    # Si iva0 == iva_ex > 0 → no duplicar, usar solo iva0
+    solo_iva0 = (iva0 > 0) & (np.abs(iva0 - iva_ex) < 0.02)
+    sub0 = _redondear(np.where(solo_iva0, iva0, iva0 + iva_ex).tolist())
+
+    # SUB2: SIEMPRE calcular desde valores crudos del CFDI
+    # IEPS 3% telefonía se suma a SUB1 igual que IEPS 8% dulces
+    # Formula garantizada: SUB1 = SubTotal - Descuento + IEPS3
+    #                      SUB2 = SUB1 - SUB0
+    sub1 = _redondear((st - dc + ieps3).tolist())
+    sub2 = [round(max(a - b, 0), 2) for a, b in zip(sub1, sub0)]
+
+    comentarios = texto('comentarios')
+    conceptos   = texto('conceptos')
+
+    # Si uuid_rel vacio, extraer de COMENTARIOS o CONCEPTOS
+    uuid_rel = texto('uuid_rel')
+    for i, rel in enumerate(uuid_rel):
+        if not rel:
+            for fuente in (comentarios[i], conceptos[i]):
+                encontrados = extraer_uuids_de_texto(fuente)
+                if encontrados:
+                    uuid_rel[i] = encontrados[0]
+                    break
+
+    importes = {campo: _redondear(num(campo).tolist())
+                for campo in ('subtotal', 'descuento', 'iva16', 'iva0', 'iva_ex', 'total')}
+    importes.update(ieps=num('ieps'), sub0=sub0, sub2=sub2)
+    textos = {campo: texto(campo) for campo in ('uuid', 'razon_em', 'razon_rec',
+                                                'complementos', 'rfc_em')}
+    textos.update(uuid_rel=uuid_rel, fecha=list(col('fecha')),
+                  conceptos=conceptos, comentarios=comentarios)
+    return TablaReporte(n, importes, {campo: texto(campo) for campo in CATALOGOS}, textos)
+
+
+def _indices(encabezados, columnas_disponibles):
+    ix = indices_reporte(encabezados)
+    # ── BÚSQUEDA ROBUSTA DE UUID ──────────────────────────────────
+    # 'uuid' / 'folio fiscal' / 'id cfdi' son alias; 'folio' solo si no hay otra
+    i_uuid = ix['uuid']
+    if i_uuid is not None:
+        print(f'  ✅ UUID encontrado como: "{encabezados[i_uuid].upper()}"')
+    else:
+        print(f'  ⚠️  ADVERTENCIA: Columna UUID NO encontrada')
+        print(f'  📋 Columnas disponibles: {", ".join(columnas_disponibles)}')
+    return ix
+
+
 def leer_validado(path):
-    """Lee _validado.xlsx. Extrae uuid_rel de COMENTARIOS si viene vacio."""
+    """
+    Lee _validado.xlsx → TablaReporte. Extrae uuid_rel de COMENTARIOS si
+    viene vacio.
+    """
     wb    = openpyxl.load_workbook(path, read_only=True, data_only=True)
     sheet = wb.active
     hraw  = {}
-    hnorm = {}
     for c in sheet[1]:
         if c.value is not None:
-            raw = str(c.value).strip()
-            hraw[c.column - 1] = raw
-            hnorm[raw.lower()] = c.column - 1
-
-    def gc(name):
-        n = name.strip().lower()
-        if n in hnorm:
-            return hnorm[n]
-        for k, v in hnorm.items():
-            if n in k or k in n:
-                return v
-        return None
-
-    # ── BÚSQUEDA ROBUSTA DE UUID ──────────────────────────────────
-    # Intenta múltiples variantes para encontrar UUID
-    i_uuid = None
-    for variant in ['uuid', 'folio fiscal', 'folio', 'id cfdi']:
-        i_uuid = gc(variant)
-        if i_uuid is not None:
-            print(f'  ✅ UUID encontrado como: "{variant.upper()}"')
-            break
-    
-    if i_uuid is None:
-        print(f'  ⚠️  ADVERTENCIA: Columna UUID NO encontrada')
-        print(f'  📋 Columnas disponibles: {", ".join(hraw.values())}')
-        i_uuid = None  # Permitir continuar pero sin UUID
-    
-    i_uuid_rel  = gc('uuids relacionados') or gc('uuid relacionado') or gc('folio fiscal relacionado')
-    i_fecha     = gc('fecha certificacion') or gc('fecha emision') or gc('fecha')
-    i_razon_em  = gc('razon emisor') or gc('nombre emisor') or gc('razon social')
-    i_razon_rec = gc('razon receptor') or gc('nombre receptor')
-    i_regimen   = gc('regimen receptor') or gc('regimen')
-    i_metodo    = gc('metodo pago') or gc('metodo de pago')
-    i_forma     = gc('forma pago') or gc('forma de pago')
-    i_uso       = gc('uso cfdi')
-    i_subtotal  = gc('subtotal')
-    i_descuento = gc('descuento')
-    i_iva16     = gc('iva trasladado 16%') or gc('iva 16%')
-    i_iva0      = gc('iva trasladado 0%')  or gc('iva 0%')
-    i_iva_ex    = gc('iva exento')
-    i_ieps      = gc('ieps trasladado') or gc('ieps')
-    i_ieps_nd   = gc('ieps trasladado no desglosado')
-    i_ieps_g    = gc('ieps trasladado')
-    i_ieps3     = gc('ieps trasladado 3%')
-    i_total     = gc('total')
-    i_conceptos = gc('conceptos') or gc('descripcion')
-    i_complem   = gc('complementos')
-    i_efecto    = gc('efecto')
-    i_sub0      = gc('sub0%')    or gc('sub0')
-    i_sub2      = gc('sub2-16%') or gc('sub2')
-    i_sub1      = gc('sub1-16%') or gc('sub1')
-    i_coment    = gc('comentarios') or gc('comentario') or gc('observaciones')
-    i_rfc_em    = gc('rfc emisor') or gc('rfc')
-
-    def rv(row, idx):
-        return row[idx] if (idx is not None and idx < len(row)) else None
-
-    def rnum(row, idx):
-        try:
-            v = rv(row, idx)
-            return float(v) if v is not None else 0.0
-        except Exception:
-            return 0.0
-
-    filas = []
-    for row in sheet.iter_rows(min_row=2, values_only=True):
-        if not any(row):
-            continue
-        st     = rnum(row, i_subtotal)
-        dc     = rnum(row, i_descuento)
-        iva16  = rnum(row, i_iva16)
-        iva0   = rnum(row, i_iva0)
-        iva_ex = rnum(row, i_iva_ex)
-        total  = rnum(row, i_total)
-        ieps_nd = rnum(row, i_ieps_nd)
-        ieps_g  = rnum(row, i_ieps_g)
-        ieps3   = rnum(row, i_ieps3) if i_ieps3 is not None else 0.0
-
-        # ── sub0: misma lógica que el motor, usando valores crudos ────
-        # No leer la columna SUB0% (es fórmula Excel sin caché en Python)
-        # Gasolina con IEPS: iva0 ya tiene el IEPS, iva_ex es el mismo valor
-        # → sumarlos duplicaría. Solo usar iva0.
-        ieps_activo = ieps_nd if ieps_nd > 0 else ieps_g
-        # Gasolina con IEPS: motor copia IEPS a IVA_0% e IVA_Exento
-        # Si iva0 == iva_ex > 0 → no duplicar, usar solo iva0
-        if iva0 > 0 and abs(iva0 - iva_ex) < 0.02:
-            sub0 = round(iva0, 2)
-        else:
-            sub0 = round(iva0 + iva_ex, 2)
-
-        # SUB2: SIEMPRE calcular desde valores crudos del CFDI
-        # IEPS 3% telefonía se suma a SUB1 igual que IEPS 8% dulces
-        # Formula garantizada: SUB1 = SubTotal - Descuento + IEPS3
-        #                      SUB2 = SUB1 - SUB0
-        sub1 = round(st - dc + ieps3, 2)
-        sub2 = round(max(sub1 - sub0, 0), 2)
-
-        uuid_rel_raw = safe_str(rv(row, i_uuid_rel))
-        comentarios  = safe_str(rv(row, i_coment))
-        conceptos    = safe_str(rv(row, i_conceptos))
-        rfc_em       = safe_str(rv(row, i_rfc_em))
-
-        # Si uuid_rel vacio, extraer de COMENTARIOS o CONCEPTOS
-        uuid_rel = uuid_rel_raw
-        if not uuid_rel:
-            for fuente in [comentarios, conceptos]:
-                encontrados = extraer_uuids_de_texto(fuente)
-                if encontrados:
-                    uuid_rel = encontrados[0]
-                    break
-
-        filas.append({
-            'uuid':         safe_str(rv(row, i_uuid)),
-            'uuid_rel':     uuid_rel,
-            'fecha':        rv(row, i_fecha),
-            'razon_em':     safe_str(rv(row, i_razon_em)),
-            'razon_rec':    safe_str(rv(row, i_razon_rec)),
-            'regimen':      safe_str(rv(row, i_regimen)),
-            'metodo':       safe_str(rv(row, i_metodo)),
-            'forma':        safe_str(rv(row, i_forma)),
-            'uso':          safe_str(rv(row, i_uso)),
-            'subtotal':     round(st, 2),
-            'descuento':    round(dc, 2),
-            'iva16':        round(iva16, 2),
-            'iva0':         round(iva0, 2),
-            'iva_ex':       round(iva_ex, 2),
-            'ieps':         rnum(row, i_ieps),
-            'total':        round(total, 2),
-            'sub0':         sub0,
-            'sub2':         sub2,
-            'conceptos':    conceptos,
-            'complementos': safe_str(rv(row, i_complem)),
-            'efecto':       safe_str(rv(row, i_efecto)),
-            'comentarios':  comentarios,
-            'rfc_em':       rfc_em,
-        })
+            hraw[c.column - 1] = str(c.value).strip()
+    encabezados = [hraw.get(i) for i in range(max(hraw, default=-1) + 1)]
 
+    # Esquema compartido con los motores (acentos, mayúsculas, alias)
+    ix    = _indices(encabezados, hraw.values())
+    crudas = [row for row in sheet.iter_rows(min_row=2, values_only=True) if any(row)]
     wb.close()
+    columnas = {campo: [row[i] if i < len(row) else None for row in crudas]
+                for campo, i in ix.items() if i is not None}
+    filas = _armar_filas(columnas, len(crudas))
+    del crudas
+
     print('  OK %d filas leidas - %d columnas' % (len(filas), len(hraw)))
     return filas
 
 
+def filas_desde_tabla(tabla):
+    """
+    Misma TablaReporte que leer_validado(), desde la TablaValidado que dejó el
+    motor en memoria (models/resultado_validacion.py): sin reabrir el xlsx.
+    """
+    _indices(tabla.encabezados, tabla.encabezados)
+    filas = _armar_filas(tabla.columnas, tabla.filas)
+    print('  OK %d filas en memoria - %d columnas' % (len(filas), len(tabla.encabezados)))
+    return filas
+
+
 NOMBRES_REGIMEN = {
     '612': 'Actividades Empresariales y Profesionales',
     '626': 'Regimen Simplificado de Confianza (RESICO)',
@@ -316,88 +286,75 @@ NOMBRES_REGIMEN = {
 }
 
 def detectar_regimen(filas):
+    # Filas por régimen distinto (bincount de los códigos del catálogo);
+    # las categorías van en orden de aparición → el empate lo gana el primero
+    codigos, categorias = filas.catalogos['regimen']
     conteo = {}
-    for f in filas:
-        cod = extraer_codigo(f.get('regimen', ''))
+    for valor, n in zip(categorias, np.bincount(codigos, minlength=len(categorias)).tolist()):
+        cod = extraer_codigo(valor)
         if cod and cod.isdigit() and len(cod) == 3:
-            conteo[cod] = conteo.get(cod, 0) + 1
+            conteo[cod] = conteo.get(cod, 0) + n
     if not conteo:
         return '612', NOMBRES_REGIMEN['612']
     dom = max(conteo, key=conteo.get)
     return dom, NOMBRES_REGIMEN.get(dom, 'Regimen %s' % dom)
 
 
-def es_complemento(f):
-    uso   = f.get('uso', '').upper()
-    efect = f.get('efecto', '').upper()
-    conc  = f.get('conceptos', '').upper()
-    comp  = f.get('complementos', '').upper()
-    return ('CP01' in uso or efect == 'PAGO' or (conc == 'PAGO' and comp == 'PAGO'))
+def _texto_es(filas, campo, valor):
+    """bool[n]: campo.upper() == valor, por columna."""
+    return pd.Series(filas.columna(campo), dtype=object).str.upper().eq(valor).to_numpy()
+
+def mascara_complementos(filas):
+    """bool[n]: CP01 en uso, efecto PAGO, o conceptos y complementos = PAGO."""
+    return (filas.por_categoria('uso', lambda v: 'CP01' in v.upper(), bool)
+            | filas.por_categoria('efecto', lambda v: v.upper() == 'PAGO', bool)
+            | (_texto_es(filas, 'conceptos', 'PAGO') & _texto_es(filas, 'complementos', 'PAGO')))
+
+def uuids_normalizados(filas):
+    """norm_uuid() de la columna uuid completa (Series de str)."""
+    return pd.Series(filas.columna('uuid'), dtype=object).str.replace(
+        r'[-\s]', '', regex=True).str.lower()
 
 def construir_indice_razones(filas):
-    """Dict {uuid_norm: razon} + {rfc: razon}. Incluye sufijo 12 chars."""
-    idx = {}
-    for f in filas:
-        uuid = f.get('uuid', '')
-        if not uuid:
-            continue
-        razon = f.get('razon_em', '')
-        un    = norm_uuid(uuid)
-        idx[un] = razon
-        if len(un) >= 12:
-            idx[un[-12:]] = razon
-        # Indexar por RFC para cruce cuando uuid_rel esta vacio
-        rfc = f.get('rfc_em', '').strip().upper()
-        if rfc:
-            idx['rfc:' + rfc] = razon
+    """
+    Dict {uuid_norm: razon} + {rfc: razon}. Incluye sufijo 12 chars.
+    Si una clave se repite gana la ultima fila.
+    """
+    con_uuid = pd.Series(filas.columna('uuid'), dtype=object).ne('').to_numpy()
+    un    = uuids_normalizados(filas)[con_uuid]
+    razon = pd.Series(filas.columna('razon_em'), dtype=object)[con_uuid]
+    idx   = dict(zip(un, razon))
+    largo = un.str.len().ge(12).to_numpy()
+    idx.update(zip(un[largo].str[-12:], razon[largo]))
+    # Indexar por RFC para cruce cuando uuid_rel esta vacio
+    rfc   = pd.Series(filas.columna('rfc_em'), dtype=object)[con_uuid].str.strip().str.upper()
+    hay   = rfc.ne('').to_numpy()
+    idx.update(zip('rfc:' + rfc[hay], razon[hay]))
     return idx
 
-def detectar_ppd(filas):
+def detectar_ppd(filas, es_cp):
     """
-    UUIDs PPD sin CP01. Cruce en 2 niveles:
+    Cruce CP01 ↔ PPD (models/conciliacion_ppd.py), una consulta por CP01:
       Nivel 1: uuid_rel explicito (cuando el motor lo llena)
       Nivel 2: RFC emisor + total identico (cuando uuid_rel esta vacio)
-    Retorna (ppd_pendientes, mapa_cp01_a_uuid_ppd)
+      Nivel 3: parcialidades del mismo RFC
+    es_cp = mascara_complementos(filas).
+    Retorna ResultadoConciliacion (.pendientes, .cp01_a_ppd, .ambiguos...)
     """
-    # Todos los PPD: {uuid_norm: fila_completa}
-    ppd_map = {}
-    for f in filas:
-        if extraer_codigo(f.get('metodo', '')) == 'PPD' and f.get('uuid'):
-            ppd_map[norm_uuid(f['uuid'])] = f
-
-    cubiertos   = set()   # uuid_norm de PPDs con CP01
-    cp01_a_ppd  = {}      # uuid_norm(cp01) -> uuid_original(ppd)
-
-    for f in filas:
-        if not es_complemento(f):
-            continue
-
-        # NIVEL 1: uuid_rel explicito en el _validado
-        rel = f.get('uuid_rel', '').strip()
-        if rel:
-            rel_n    = norm_uuid(rel)
-            rel_tail = rel_n[-12:] if len(rel_n) >= 12 else rel_n
-            for uid_n, ppd_f in ppd_map.items():
-                if uid_n == rel_n or uid_n.endswith(rel_tail):
-                    cubiertos.add(uid_n)
-                    cp01_a_ppd[norm_uuid(f['uuid'])] = ppd_f['uuid']
-            continue
-
-        # NIVEL 2: uuid_rel vacio → cruzar por RFC emisor + total igual
-        rfc_cp01   = f.get('rfc_em', '').strip().upper()
-        total_cp01 = round(float(f.get('total', 0)), 2)
-        if not rfc_cp01:
-            continue
-        for uid_n, ppd_f in ppd_map.items():
-            rfc_ppd   = ppd_f.get('rfc_em', '').strip().upper()
-            total_ppd = round(float(ppd_f.get('total', 0)), 2)
-            if rfc_cp01 == rfc_ppd and total_cp01 == total_ppd:
-                cubiertos.add(uid_n)
-                cp01_a_ppd[norm_uuid(f['uuid'])] = ppd_f['uuid']
-                break  # un CP01 cubre un PPD
-
-    ppd_pendientes = {ppd_map[n]['uuid'] for n in ppd_map if n not in cubiertos}
-    return ppd_pendientes, cp01_a_ppd
+    uuid, rfc = filas.columna('uuid'), filas.columna('rfc_em')
+    rel, total = filas.columna('uuid_rel'), filas.columna('total')
+    # un CP01 con metodo PPD es el pago, no la factura pagada
+    es_ppd = (filas.por_categoria('metodo', extraer_codigo, clave='codigo') == 'PPD') \
+             & ~es_cp & pd.Series(uuid, dtype=object).ne('').to_numpy()
+
+    complementos = []
+    for i in np.flatnonzero(es_cp).tolist():
+        # un CP01 de Pagos 2.0 puede pagar varios PPD: "UUID1, UUID2"
+        r = rel[i].strip()
+        complementos.append((uuid[i], rfc[i], float(total[i]),
+                             (extraer_uuids_de_texto(r) or [r]) if r else []))
+    ppds = [(uuid[i], rfc[i], float(total[i])) for i in np.flatnonzero(es_ppd).tolist()]
+    return conciliar_ppd(ppds, complementos)
 
 def resolver_uuid_rel(f, idx_razones, cp01_a_ppd=None):
     """
@@ -407,9 +364,9 @@ def resolver_uuid_rel(f, idx_razones, cp01_a_ppd=None):
     """
     rel = f.get('uuid_rel', '').strip()
 
-    # NIVEL 1: uuid_rel explicito
+    # NIVEL 1: uuid_rel explicito (si son varios, se muestra el primero)
     if rel:
-        rel_n    = norm_uuid(rel)
+        rel_n    = norm_uuid((extraer_uuids_de_texto(rel) or [rel])[0])
         rel_tail = rel_n[-12:] if len(rel_n) >= 12 else rel_n
         razon    = idx_razones.get(rel_n) or idx_razones.get(rel_tail, '')
         display  = rel_tail.upper()
@@ -430,81 +387,122 @@ def resolver_uuid_rel(f, idx_razones, cp01_a_ppd=None):
     return '', ''
 
 
-def calc_estatus(f, is_cp, ppd_pend, idx_razones):
+def _campos_estatus(f):
+    """
+    Valores de la fila (FilaVista) en el orden de CAMPOS_ESTATUS
+    (validaciones_fiscales); los codigos salen ya extraidos por categoria.
+    """
+    t, i    = f.tabla, f.i
+    codigo  = lambda campo: t.por_categoria(campo, extraer_codigo, clave='codigo')[i]
+    return (codigo('uso'), codigo('metodo'),
+            t.por_categoria('forma', lambda v: extraer_codigo(v, 2), clave='codigo2')[i],
+            codigo('regimen'), f.get('total') or 0,
+            f.get('sub2') or 0, f.get('iva16') or 0, f.get('sub0') or 0,
+            f['clave_personal'] if 'clave_personal' in f
+            else detectar_deduccion_personal(f.get('conceptos', '')))
+
+
+def calc_estatus(f, is_cp, ppd_pendiente):
     if is_cp:
         # ESTATUS = solo "COMPLEMENTO" limpio (sin monto, sin redundancia)
         # El detalle (uuid_rel, razon, saldo) va SOLO en columna OBS
         return 'COMPLEMENTO'
 
-    uuid_n = norm_uuid(f.get('uuid', ''))
-    if any(norm_uuid(p) == uuid_n for p in ppd_pend):
+    if ppd_pendiente:
         return 'PENDIENTE'
 
-    uso   = f.get('uso', '');   metodo = f.get('metodo', '')
-    forma = f.get('forma', ''); total  = f.get('total', 0)
-    sub2  = f.get('sub2', 0);  iva16  = f.get('iva16', 0)
-    sub0  = f.get('sub0', 0)
-    regimen = f.get('regimen', '')
-    conceptos = f.get('conceptos', '')
-
-    # ── DETECCIÓN DE DEDUCCIÓN PERSONAL (D01-D10) ──────────────────
-    # Si está en régimen 612 y tiene claves D01-D10
-    fp = extraer_codigo(forma, 2)
-    if detectar_deduccion_personal(conceptos, extraer_codigo(regimen)):
-        if fp == '01':
-            return 'DED PERSONAL NO DEDUCIBLE POR QUE LO PAGA EN EFECTIVO'
-        return 'DED PERSONAL'
-
-    u  = extraer_codigo(uso)
-    m  = extraer_codigo(metodo)
-
-    if u in ('S01', 'CN0'):
-        return 'NO DEDUCIBLE'
-
-    u_ok = u in USOS_VALIDOS
-    m_ok = m in METODOS_VALIDOS
-    # Forma 99 = "Por definir" → válida SOLO para PPD (es temporal hasta que llega el CP01)
-    f_ok = fp in FORMAS_VALIDAS or (fp == '99' and m == 'PPD')
-
-    if u_ok and m_ok and f_ok:
-        if fp == '01' and total >= LIMITE_EFECTIVO:
-            return 'NO DEDUCIBLE: Efectivo >= $2,000'
-        if u == 'G02':
-            return 'EGRESO'
-        if   sub2 > 0 and iva16 > 0 and sub0 == 0: suf = '16%'
-        elif sub2 > 0 and iva16 > 0 and sub0 > 0:  suf = '16 Y 0%'
-        elif sub2 == 0 and iva16 == 0 and sub0 > 0: suf = '0%'
-        else:                                        suf = 'NO DEDUCIBLE'
-        return ('EFE ' if fp == '01' else 'DED ') + suf
-
-    err = []
-    if not u_ok: err.append('USO (%s) INVALIDO' % u)
-    if not m_ok: err.append('METODO (%s) INVALIDO' % m)
-    if not f_ok: err.append('FORMA (%s) INVALIDA' % fp)
-    return 'ERROR: ' + ' | '.join(err)
-
-
-def formula_estatus(rn):
-    L = LIMITE_EFECTIVO
-    return (
-        '=IF(OR(LEFT(K%(r)s,3)="S01",LEFT(K%(r)s,3)="CN0"),"NO DEDUCIBLE",'
-        'IF(NOT(ISERROR(MATCH(LEFT(K%(r)s,3),{"D01","D02","D03","D04","D05","D06","D07","D08","D09","D10"},0))),'
-        'IF(AND(NOT(ISERROR(MATCH(LEFT(I%(r)s,3),{"PUE","PPD"},0))),NOT(ISERROR(MATCH(LEFT(J%(r)s,2),{"01","02","03","04","28"},0)))),'
-        'IF(LEFT(J%(r)s,2)="01","DED PERSONAL NO DEDUCIBLE POR QUE LO PAGA EN EFECTIVO","DED PERSONAL"),'
-        '"ERROR: "&IF(ISERROR(MATCH(LEFT(I%(r)s,3),{"PUE","PPD"},0)),"METODO INVALIDO | ","")&IF(ISERROR(MATCH(LEFT(J%(r)s,2),{"01","02","03","04","28"},0)),"FORMA INVALIDA","")),'
-        'IF(AND(NOT(ISERROR(MATCH(LEFT(K%(r)s,3),{"G01","G02","G03"},0))),NOT(ISERROR(MATCH(LEFT(I%(r)s,3),{"PUE","PPD"},0))),NOT(ISERROR(MATCH(LEFT(J%(r)s,2),{"01","02","03","04","28"},0)))),'
-        'IF(AND(LEFT(J%(r)s,2)="01",H%(r)s>=%(L)s),"NO DEDUCIBLE: Efectivo >= $2,000",'
-        'IF(LEFT(K%(r)s,3)="G02","EGRESO",'
-        'IF(LEFT(J%(r)s,2)="01",'
-        '"EFE "&IF(AND(E%(r)s>0,F%(r)s>0,G%(r)s=0),"16%%",IF(AND(E%(r)s>0,F%(r)s>0,G%(r)s>0),"16 Y 0%%",IF(AND(E%(r)s=0,F%(r)s=0,G%(r)s>0),"0%%","NO DEDUCIBLE"))),'
-        '"DED "&IF(AND(E%(r)s>0,F%(r)s>0,G%(r)s=0),"16%%",IF(AND(E%(r)s>0,F%(r)s>0,G%(r)s>0),"16 Y 0%%",IF(AND(E%(r)s=0,F%(r)s=0,G%(r)s>0),"0%%","NO DEDUCIBLE")))))),'
-        '"ERROR: "&IF(ISERROR(MATCH(LEFT(K%(r)s,3),{"G01","G02","G03","D01","D02","D03","D04","D05","D06","D07","D08","D09","D10"},0)),"USO INVALIDO | ","")&'
-        'IF(ISERROR(MATCH(LEFT(I%(r)s,3),{"PUE","PPD"},0)),"METODO INVALIDO | ","")&'
-        'IF(ISERROR(MATCH(LEFT(J%(r)s,2),{"01","02","03","04","28"},0)),"FORMA INVALIDA",""))))'
-    ) % {'r': rn, 'L': L}
-
-
-def generar_excel(filas, ppd_pend, cp01_a_ppd, idx_razones, out, mes='', reg_cod='612', reg_nombre=''):
+    # DED PERSONAL (D01-D10) → S01/CN0 → ERROR → efectivo → EGRESO → DED/EFE + tasa
+    return estatus_reporte(*_campos_estatus(f))
+
+
+def grupo_estatus(eu):
+    """Clave de stats para un estatus en mayusculas."""
+    if   'COMPLEMENTO'  in eu: return 'comp'
+    elif 'PENDIENTE'    in eu: return 'pend'
+    elif 'DED PERSONAL' in eu: return 'ded_personal'
+    elif 'NO DED' in eu or 'ERROR' in eu: return 'no_ded'
+    elif 'EGRESO'       in eu: return 'egreso'
+    elif 'EFE'          in eu: return 'efe'
+    return 'ded'
+
+
+@dataclass
+class FilaReporte:
+    """Resultado de clasificar una fila: lo que leen Excel, HTML y DIOT."""
+    f:             FilaVista  # fila de la TablaReporte (fecha, razon, forma...)
+    es_cp:         bool
+    ppd_pendiente: bool
+    estatus:       str
+    bg:            str
+    fg:            str
+    css:           str
+    flt:           str
+    grupo:         str      # clave de stats (grupo_estatus)
+    en_diot:       bool     # deducible → entra a la DIOT
+    rfc:           str
+    rel:           str      # CP01: 12 chars del PPD relacionado ('' si no hay)
+    razon_rel:     str      # CP01: razon social del PPD relacionado
+    obs:           str      # COMPLEMENTOS / OBSERVACIONES de la hoja
+    sub2:          float
+    iva16:         float
+    sub0:          float
+    total:         float
+
+
+def clasificar_filas(filas, es_cp, ppd_pend, cp01_a_ppd, idx_razones):
+    """UNA pasada de Paso 3: [FilaReporte] en el orden de `filas` (TablaReporte)."""
+    ppd_norms = {norm_uuid(p) for p in ppd_pend}
+    pendiente = ~es_cp & uuids_normalizados(filas).isin(ppd_norms).to_numpy()
+    registros = []
+    for f, is_cp, ppd_p in zip(filas, es_cp.tolist(), pendiente.tolist()):
+        estatus = calc_estatus(f, is_cp, ppd_p)
+        bg, fg, css, flt = classify(estatus)
+        eu = estatus.upper()
+
+        if is_cp:
+            display, razon = resolver_uuid_rel(f, idx_razones, cp01_a_ppd)
+            obs = ('Complemento parcialidad 1 - factura %s' % display) if display else 'Complemento CP01'
+            if razon: obs += ' (%s)' % razon[:30]
+            obs += ' saldo insoluto $%s' % '{:,.2f}'.format(f.get('total', 0))
+        else:
+            display, razon = '', ''
+            obs = 'PPD sin complemento CP01 - pasa al siguiente mes' if ppd_p else ''
+
+        # DIOT: solo deducibles — excluir NO DED, PENDIENTE, COMPLEMENTO, EGRESO, ERROR
+        en_diot = (any(k in eu for k in ('DED', 'EFE'))
+                   and not any(k in eu for k in ('NO DED', 'NO DEDUCIBLE', 'ERROR')))
+
+        registros.append(FilaReporte(
+            f=f, es_cp=is_cp, ppd_pendiente=ppd_p, estatus=estatus,
+            bg=bg, fg=fg, css=css, flt=flt, grupo=grupo_estatus(eu), en_diot=en_diot,
+            rfc=f.get('rfc_em', '').strip().upper(), rel=display, razon_rel=razon, obs=obs,
+            sub2=f.get('sub2', 0), iva16=f.get('iva16', 0),
+            sub0=f.get('sub0', 0), total=f.get('total', 0)))
+    return registros
+
+
+def formula_estatus(rn, f):
+    """
+    Fórmula viva de ESTATUS, generada de la MISMA tabla que calc_estatus.
+    Régimen y clave D01-D10 del concepto no están en la hoja: entran
+    como valores fijos y las ramas que no aplican no se escriben.
+    """
+    r = str(rn)
+    campos = _campos_estatus(f)
+    return ESTATUS_REPORTE.formula({
+        'uso':    'LEFT(K%s,3)' % r,
+        'metodo': 'LEFT(I%s,3)' % r,
+        'forma':  'LEFT(J%s,2)' % r,
+        'total':  'H' + r,
+        'sub2':   'E' + r,
+        'iva16':  'F' + r,
+        'sub0':   'G' + r,
+        'regimen':        Valor(campos[3]),
+        'clave_personal': Valor(campos[8]),
+    })
+
+
+def generar_excel(registros, out, mes='', reg_cod='612', reg_nombre=''):
     print('  Generando Excel...')
     wb  = openpyxl.Workbook()
     sh  = wb.active
@@ -557,51 +555,33 @@ def generar_excel(filas, ppd_pend, cp01_a_ppd, idx_razones, out, mes='', reg_cod
 
     stats = {k:0 for k in ['total','ded','ded_personal','no_ded','pend','egreso','efe','comp',
                              'monto_ded','monto_no_ded','monto_pend']}
-    ppd_norms = {norm_uuid(p) for p in ppd_pend}
+    # Grupo de stats → monto que suma (comp y egreso solo cuentan)
+    monto_de = {'pend': 'monto_pend', 'no_ded': 'monto_no_ded', 'ded_personal': 'monto_ded',
+                'efe': 'monto_ded', 'ded': 'monto_ded'}
 
     rn = RH + 1
-    for f in filas:
-        is_cp   = es_complemento(f)
-        estatus = calc_estatus(f, is_cp, ppd_pend, idx_razones)
-        bg, fg, _, _ = classify(estatus)
-        eu = estatus.upper()
-
-        if is_cp:
-            display, razon = resolver_uuid_rel(f, idx_razones, cp01_a_ppd)
-            saldo = f.get('total', 0)
-            obs   = ('Complemento parcialidad 1 - factura %s' % display) if display else 'Complemento CP01'
-            if razon: obs += ' (%s)' % razon[:30]
-            obs  += ' saldo insoluto $%s' % '{:,.2f}'.format(saldo)
-        elif norm_uuid(f.get('uuid','')) in ppd_norms:
-            obs = 'PPD sin complemento CP01 - pasa al siguiente mes'
-        else:
-            obs = ''
+    for r in registros:
+        f, is_cp, estatus = r.f, r.es_cp, r.estatus
+        bg, fg = r.bg, r.fg
 
         stats['total'] += 1
-        if   'COMPLEMENTO' in eu: stats['comp']      += 1
-        elif 'PENDIENTE'   in eu: stats['pend']      += 1; stats['monto_pend']   += f['total']
-        elif 'DED PERSONAL' in eu: stats['ded_personal'] += 1; stats['monto_ded'] += f['total']
-        elif 'NO DED' in eu or 'ERROR' in eu:
-                                   stats['no_ded']   += 1; stats['monto_no_ded'] += f['total']
-        elif 'EGRESO'      in eu: stats['egreso']    += 1
-        elif 'EFE'         in eu: stats['efe']       += 1; stats['monto_ded']    += f['total']
-        else:                      stats['ded']      += 1; stats['monto_ded']    += f['total']
+        stats[r.grupo] += 1
+        if r.grupo in monto_de:
+            stats[monto_de[r.grupo]] += r.total
 
         # CP01 → amarillo en _validado (igual que imagen de referencia)
         if is_cp:
             cf = 'FFFF00'  # Amarillo para CP01
-        elif norm_uuid(f.get('uuid','')) in ppd_norms:
+        elif r.ppd_pendiente:
             cf = 'FFFF00'  # Amarillo tambien para PPD relacionado
         else:
             cf = 'FFFFFF' if (rn-RH-1)%2==0 else 'F8F9FA'
 
         # UUID relacionado: display de 12 chars del PPD
-        display_rel, _ = resolver_uuid_rel(f, idx_razones, cp01_a_ppd) if is_cp else ('', '')
-
-        vals = [f['uuid'], display_rel or f['uuid_rel'],f['fecha'],f['razon_em'],
-                f['sub2'] or None,f['iva16'] or None,
-                f['sub0'] or None,f['total'] or None,
-                f['metodo'],f['forma'],f['uso'],None,obs]
+        vals = [f['uuid'], r.rel or f['uuid_rel'],f['fecha'],f['razon_em'],
+                r.sub2 or None,r.iva16 or None,
+                r.sub0 or None,r.total or None,
+                f['metodo'],f['forma'],f['uso'],None,r.obs]
 
         for ci, val in enumerate(vals, 1):
             c = sh.cell(row=rn, column=ci, value=val)
@@ -615,7 +595,7 @@ def generar_excel(filas, ppd_pend, cp01_a_ppd, idx_razones, out, mes='', reg_cod
             else: c.fill=mk(cf)
 
         ec = sh.cell(row=rn, column=12)
-        ec.value = estatus if (is_cp or 'PENDIENTE' in eu) else formula_estatus(rn)
+        ec.value = estatus if r.grupo in ('comp', 'pend') else formula_estatus(rn, f)
         ec.fill=mk(bg); ec.font=Font(bold=True,color=fg,size=9,name='Calibri')
         ec.alignment=ct; ec.border=bd
         sh.row_dimensions[rn].height = 28
@@ -642,81 +622,76 @@ _OPCIONES = [
     'OTRO MES', 'MES ANTERIOR'
 ]
 
-def generar_html(filas, ppd_pend, cp01_a_ppd, idx_razones, out, mes='', stats=None, reg_cod='612', reg_nombre=''):
-    print('  Generando HTML...')
-    s         = stats or {}
-    total_f   = s.get('total', len(filas))
-    ppd_norms = {norm_uuid(p) for p in ppd_pend}
-    now_str   = datetime.now().strftime('%d/%m/%Y %H:%M')
-    n_ded=s.get('ded',0); n_efe=s.get('efe',0); n_no_ded=s.get('no_ded',0)
-    n_pend=s.get('pend',0); n_egreso=s.get('egreso',0); n_comp=s.get('comp',0)
-    m_ded=s.get('monto_ded',0); m_no_ded=s.get('monto_no_ded',0); m_pend=s.get('monto_pend',0)
+# Columnas del JSON del dashboard que se guardan como posicion en un catalogo
+_CAMPOS_CATALOGO = ('fecha', 'razon', 'rfc', 'metodo', 'forma', 'uso', 'estatus', 'css', 'flt')
 
-    buf = StringIO()
-    for i, f in enumerate(filas, 1):
-        is_cp   = es_complemento(f)
-        estatus = calc_estatus(f, is_cp, ppd_pend, idx_razones)
-        bg, fg, css, flt = classify(estatus)
+def _fecha_corta(fecha_raw):
+    """dd/mm/aaaa para el HTML (datetime o texto 'aaaa-mm-dd hh:mm')."""
+    try:
+        if hasattr(fecha_raw, 'strftime'):
+            return fecha_raw.strftime('%d/%m/%Y')
+        s = str(fecha_raw or '').split(' ')[0]
+        if '-' in s:
+            p = s.split('-')
+            return f"{p[2]}/{p[1]}/{p[0]}" if len(p)==3 else s
+        return s[:10]
+    except Exception:
+        return str(fecha_raw or '')[:10]
 
-        opts = ''.join(
-            '<option value="%s"%s>%s</option>' % (op, ' selected' if op==estatus else '', op)
-            for op in _OPCIONES
-        )
-        if estatus not in _OPCIONES:
-            opts += '<option value="%s" selected>%s</option>' % (estatus, estatus)
-        sel = '<select class="se %s" data-original="%s" onchange="ce(this)">%s</select>' % (css, estatus, opts)
+def _importe_json(v):
+    v = float(v or 0.0)
+    return v if math.isfinite(v) else 0.0   # JSON no admite NaN / inf
 
-        uuid_full = f['uuid']
-        uuid_disp = uuid_full.upper()
+def datos_html(registros):
+    """
+    Filas del dashboard como JSON por columnas (lo lee reporte_template.js).
+    Los textos que se repiten (fecha, razon, RFC, catalogos, estatus) van
+    una vez en 'catalogos' y cada fila guarda su posicion:
 
-        if is_cp:
-            display, razon = resolver_uuid_rel(f, idx_razones, cp01_a_ppd)
-            saldo = f.get('total', 0)
-            rel_disp = display if display else '–'
-            if display:
-                obs_txt = 'Complemento parcialidad 1 - factura %s' % display
-                if razon: obs_txt += ' (%s)' % razon[:30]
-            else:
-                obs_txt = 'Complemento CP01'
-            obs_txt += ' saldo insoluto $%s' % '{:,.2f}'.format(saldo)
-            obs_html = '<span class="cb" contenteditable="true" title="Clic para editar">%s</span>' % obs_txt
-        elif norm_uuid(f.get('uuid','')) in ppd_norms:
-            rel_raw  = f['uuid_rel']
-            rel_disp = (rel_raw[-12:].upper() if len(rel_raw)>=12 else rel_raw.upper()) if rel_raw else '–'
-            obs_html = '<span class="pb" contenteditable="true">PPD sin CP01 - siguiente mes</span>'
+      {"opciones": [...], "catalogos": {"razon": [...], ...},
+       "uuid": [...], "razon": [0, 0, 3, ...], "sub2": [1200.5, ...], ...}
+
+      tipo: 0 normal, 1 complemento CP01, 2 PPD pendiente
+    """
+    uuid, uuid_rel, rel, obs, tipo = [], [], [], [], []
+    sub2, iva16, sub0 = [], [], []
+    catalogos = {campo: {} for campo in _CAMPOS_CATALOGO}
+    codigos   = {campo: [] for campo in _CAMPOS_CATALOGO}
+
+    for r in registros:
+        f = r.f
+        rel_raw = f['uuid_rel']
+        if r.es_cp:
+            rel.append(r.rel or '–')
         else:
-            rel_raw  = f['uuid_rel']
-            rel_disp = (rel_raw[-12:].upper() if len(rel_raw)>=12 else rel_raw.upper()) if rel_raw else '–'
-            obs_html = '<span class="ob-txt" contenteditable="true">-</span>'
-
-        fecha_raw = f['fecha']
-        try:
-            if hasattr(fecha_raw, 'strftime'):
-                fecha_str = fecha_raw.strftime('%d/%m/%Y')
-            else:
-                s = str(fecha_raw or '').split(' ')[0]
-                if '-' in s:
-                    p = s.split('-')
-                    fecha_str = f"{p[2]}/{p[1]}/{p[0]}" if len(p)==3 else s
-                else:
-                    fecha_str = s[:10]
-        except Exception:
-            fecha_str = str(fecha_raw or '')[:10]
-
-        fc_cls = ' fc' if is_cp else ''
-        tpl_row = ReportTemplateManager.get_sub_template('tpl-row')
-        buf.write(tpl_row.format(
-            flt=flt, fc_cls=fc_cls, rfc=f.get('rfc_em','').strip().upper(),
-            uuid_full=uuid_full, i=i, uuid_disp=uuid_disp,
-            uuid_rel=f.get('uuid_rel', ''), rel_disp=rel_disp,
-            fecha_str=fecha_str, razon_em=f.get('razon_em', ''),
-            sub2=f.get('sub2', 0), iva16=f.get('iva16', 0), sub0=f.get('sub0', 0),
-            total=fmt_num(f.get('total', 0)), metodo=f.get('metodo', ''),
-            forma=f.get('forma', ''), uso=f.get('uso', ''),
-            sel=sel, obs_html=obs_html
-        ) + '\n')
-
-    fs = buf.getvalue(); buf.close()
+            rel.append((rel_raw[-12:].upper() if len(rel_raw)>=12 else rel_raw.upper())
+                       if rel_raw else '–')
+        uuid.append(f['uuid']); uuid_rel.append(rel_raw)
+        obs.append(r.obs if r.es_cp else '')
+        tipo.append(1 if r.es_cp else 2 if r.ppd_pendiente else 0)
+        sub2.append(_importe_json(r.sub2)); iva16.append(_importe_json(r.iva16))
+        sub0.append(_importe_json(r.sub0))
+        for campo, valor in (('fecha', _fecha_corta(f['fecha'])), ('razon', f['razon_em']),
+                             ('rfc', r.rfc), ('metodo', f['metodo']), ('forma', f['forma']),
+                             ('uso', f['uso']), ('estatus', r.estatus), ('css', r.css),
+                             ('flt', r.flt)):
+            codigos[campo].append(catalogos[campo].setdefault(valor, len(catalogos[campo])))
+
+    datos = {'opciones': _OPCIONES,
+             'catalogos': {campo: list(valores) for campo, valores in catalogos.items()},
+             'uuid': uuid, 'uuid_rel': uuid_rel, 'rel': rel, 'obs': obs, 'tipo': tipo,
+             'sub2': sub2, 'iva16': iva16, 'sub0': sub0}
+    datos.update(codigos)
+    # '</' escapado: el JSON va dentro de <script>
+    return json.dumps(datos, ensure_ascii=False, separators=(',', ':')).replace('</', '<\\/')
+
+def generar_html(registros, out, mes='', stats=None, reg_cod='612', reg_nombre=''):
+    print('  Generando HTML...')
+    s         = stats or {}
+    total_f   = s.get('total', len(registros))
+    now_str   = datetime.now().strftime('%d/%m/%Y %H:%M')
+    n_ded=s.get('ded',0); n_efe=s.get('efe',0); n_no_ded=s.get('no_ded',0)
+    n_pend=s.get('pend',0)
 
     css_out = re.sub(r'\.html$', '', out, flags=re.IGNORECASE) + '.css'
     js_out  = re.sub(r'\.html$', '', out, flags=re.IGNORECASE) + '.js'
@@ -728,8 +703,8 @@ def generar_html(filas, ppd_pend, cp01_a_ppd, idx_razones, out, mes='', stats=No
     template = ReportTemplateManager.get_html_template()
     html = template.format(
         mes=mes, reg_cod=reg_cod, reg_nombre=reg_nombre, now=now_str,
-        tf=total_f, nn=n_no_ded, np=n_pend, nd2=(n_ded+n_efe), fs=fs,
-        diot_html=generar_diot_html(filas, ppd_pend, idx_razones, mes),
+        tf=total_f, nn=n_no_ded, np=n_pend, nd2=(n_ded+n_efe), datos=datos_html(registros),
+        diot_html=generar_diot_html(registros, mes),
         css_name=css_name, js_name=js_name
     )
 
@@ -738,7 +713,7 @@ def generar_html(filas, ppd_pend, cp01_a_ppd, idx_razones, out, mes='', stats=No
     print('  HTML: %s' % out)
 
 
-def generar_diot_html(filas, ppd_pend, idx_razones, mes):
+def generar_diot_html(registros, mes):
     """
     Genera la sección HTML de la DIOT (Informativa de Operaciones con Terceros).
     Agrupa por RFC emisor, solo facturas deducibles (DED + EFE).
@@ -746,49 +721,35 @@ def generar_diot_html(filas, ppd_pend, idx_razones, mes):
     FIX v2.4: acumula sub2/iva16/sub0 sin round() intermedio para evitar
     deriva de centavos al sumar N facturas. Se redondea solo al mostrar.
     """
-    # Acumular por RFC — sin redondeo intermedio (float64 nativo)
-    proveedores = {}
-    for f in filas:
-        is_cp   = es_complemento(f)
-        estatus = calc_estatus(f, is_cp, ppd_pend, idx_razones).upper()
-
-        # Solo deducibles — excluir NO DED, PENDIENTE, COMPLEMENTO, EGRESO, ERROR
-        if not any(k in estatus for k in ('DED', 'EFE')):
-            continue
-        if any(k in estatus for k in ('NO DED', 'NO DEDUCIBLE', 'ERROR')):
-            continue
-
-        rfc   = f.get('rfc_em', '').strip().upper() or 'SIN RFC'
-        razon = f.get('razon_em', '').strip() or rfc
-
-        if rfc not in proveedores:
-            proveedores[rfc] = {
-                'razon': razon,
-                'rfc':   rfc,
-                'sub2':  0.0,
-                'iva16': 0.0,
-                'sub0':  0.0,
-                'total': 0.0,
-            }
-        p = proveedores[rfc]
-        # Usar float() sin round() — acumular con máxima precisión
-        p['sub2']  += float(f.get('sub2',  0.0) or 0.0)
-        p['iva16'] += float(f.get('iva16', 0.0) or 0.0)
-        p['sub0']  += float(f.get('sub0',  0.0) or 0.0)
-        p['total'] += float(f.get('total', 0.0) or 0.0)
-
-    if not proveedores:
+    # Solo deducibles (r.en_diot se calcula en clasificar_filas)
+    diot = [r for r in registros if r.en_diot]
+    if not diot:
         return ''
 
-    # Redondear acumulados a 2 decimales (solo al final, no por fila)
-    for p in proveedores.values():
-        p['sub2']  = round(p['sub2'],  2)
-        p['iva16'] = round(p['iva16'], 2)
-        p['sub0']  = round(p['sub0'],  2)
-        p['total'] = round(p['total'], 2)
+    # Agrupar por RFC: factorize (orden de aparición) + bincount por importe.
+    # bincount suma fila por fila en float64, sin redondeo intermedio
+    rfcs = [r.rfc or 'SIN RFC' for r in diot]
+    grupo, unicos = pd.factorize(pd.Series(rfcs, dtype=object))
+    primera = np.unique(grupo, return_index=True)[1]   # 1a fila de cada RFC
+
+    def acumulado(campo):
+        pesos = np.fromiter((float(getattr(r, campo) or 0.0) for r in diot),
+                            dtype=np.float64, count=len(diot))
+        # Redondear a 2 decimales solo al final, no por fila
+        return [round(v, 2) for v in np.bincount(grupo, pesos, len(unicos)).tolist()]
+
+    sumas = {campo: acumulado(campo) for campo in ('sub2', 'iva16', 'sub0', 'total')}
+    proveedores = [{
+        'razon': diot[i].f.get('razon_em', '').strip() or rfc,
+        'rfc':   rfc,
+        'sub2':  sumas['sub2'][g],
+        'iva16': sumas['iva16'][g],
+        'sub0':  sumas['sub0'][g],
+        'total': sumas['total'][g],
+    } for g, (rfc, i) in enumerate(zip(unicos.tolist(), primera.tolist()))]
 
     # Ordenar por razón social
-    filas_diot = sorted(proveedores.values(), key=lambda x: x['razon'])
+    filas_diot = sorted(proveedores, key=lambda x: x['razon'])
 
     # Totales
     tot_sub2  = sum(p['sub2']  for p in filas_diot)
@@ -824,7 +785,11 @@ def generar_diot_html(filas, ppd_pend, idx_razones, mes):
     return tpl_wrap.format(mes=mes.upper(), rows=rows)
 
 
-def generar_reporte(validado_path, mes_reporte=''):
+def generar_reporte(validado_path, mes_reporte='', validado=None):
+    """
+    validado_path = _validado.xlsx (nombra las salidas; se lee solo si
+    no llega `validado`, la TablaValidado del motor — ver main_controller).
+    """
     t0 = time.time()
     print('\n' + '='*60)
     print('  GENERADOR DE REPORTE FISCAL - ReaDesF1.8 v2.2')
@@ -839,19 +804,33 @@ def generar_reporte(validado_path, mes_reporte=''):
     xlsx_out = base + '_reporte.xlsx'
     html_out = base + '_reporte.html'
 
-    filas               = leer_validado(validado_path)
+    filas               = (filas_desde_tabla(validado) if validado is not None
+                           else leer_validado(validado_path))
+    marcar_deduccion_personal(filas)
     reg_cod, reg_nombre = detectar_regimen(filas)
     idx_razones         = construir_indice_razones(filas)
-    ppd_pend, cp01_a_ppd = detectar_ppd(filas)
+    es_cp               = mascara_complementos(filas)
+    conciliacion        = detectar_ppd(filas, es_cp)
+    ppd_pend, cp01_a_ppd = conciliacion.pendientes, conciliacion.cp01_a_ppd
 
     print('  Regimen: %s - %s' % (reg_cod, reg_nombre))
     print('  PPD pendientes (sin CP01): %d' % len(ppd_pend))
-    print('  CP01 cruzados por RFC+total: %d' % len(cp01_a_ppd))
-
-    stats = generar_excel(filas, ppd_pend, cp01_a_ppd, idx_razones,
-                          xlsx_out, mes_reporte, reg_cod, reg_nombre)
-    generar_html(filas, ppd_pend, cp01_a_ppd, idx_razones,
-                 html_out, mes_reporte, stats, reg_cod, reg_nombre)
+    print('  CP01 cruzados con su PPD: %d' % len(cp01_a_ppd))
+    if conciliacion.parcialidades:
+        print('  PPD pagados en parcialidades: %d' % len(conciliacion.parcialidades))
+    if conciliacion.ambiguos:
+        print('  CP01 con cruce ambiguo: %d' % len(conciliacion.ambiguos))
+        for uuid, nivel, motivo, candidatos in conciliacion.ambiguos[:10]:
+            print('    %s (nivel %d, %s): %s' % (
+                norm_uuid(uuid)[-12:].upper(), nivel, motivo,
+                ', '.join(norm_uuid(c)[-12:].upper() for c in candidatos[:5])
+                + (' ...' if len(candidatos) > 5 else '')))
+        if len(conciliacion.ambiguos) > 10:
+            print('    ... y %d mas' % (len(conciliacion.ambiguos) - 10))
+
+    registros = clasificar_filas(filas, es_cp, ppd_pend, cp01_a_ppd, idx_razones)
+    stats = generar_excel(registros, xlsx_out, mes_reporte, reg_cod, reg_nombre)
+    generar_html(registros, html_out, mes_reporte, stats, reg_cod, reg_nombre)
 
     t = time.time() - t0
     print('\n' + '='*60)
@@ -864,7 +843,6 @@ def generar_reporte(validado_path, mes_reporte=''):
 
 
 if __name__ == '__main__':
-    import sys
     if len(sys.argv) >= 2:
         path = sys.argv[1]
         mes  = sys.argv[2] if len(sys.argv) >= 3 else ''
@@ -81,7 +81,7 @@ import time
 from seguridad          import ConfiguracionSeguridad, LogAuditoria
 from models.analizador_sistema import analizar_y_decidir
 
-REGEX_XLSX = re.compile(r'\.xlsx$', re.IGNORECASE)
+REGEX_EXTENSION = re.compile(r'\.(xlsx|xlsm|csv|txt|parquet|pq|arrow|ipc|feather)$', re.IGNORECASE)
 
 # ══════════════════════════════════════════════════════════════════
 # ENCABEZADO
@@ -113,8 +113,8 @@ def main():
     file_path = conf['file_path']
     mes_reporte = conf['mes']
     ConfiguracionSeguridad.CREAR_LOG_AUDITORIA = conf['log']
-    desktop_path = os.path.dirname(file_path)
-    file_name = os.path.basename(file_path)
+    desktop_path = os.path.dirname(os.path.normpath(file_path))
+    file_name = os.path.basename(os.path.normpath(file_path))
 
     print(f"\n  ✅ Archivo    : {file_path}")
     print(f"  ✅ Mes        : {mes_reporte}")
@@ -131,14 +131,14 @@ def main():
     analisis = analizar_y_decidir(file_path)
     log.registrar_inicio(file_path, analisis.motor)
 
-    base_name   = REGEX_XLSX.sub('', str(file_name))
+    base_name   = REGEX_EXTENSION.sub('', str(file_name))
     suffix      = "_ANONIMIZADO_validado" if ConfiguracionSeguridad.MODO_ANONIMIZAR else "_validado"
     output_path = os.path.join(str(desktop_path), f"{base_name}{suffix}.xlsx")
 
     t_inicio = time.time()
-    stats    = {}
+    resultado = None
 
-    iconos = {'TURBO': '🚀', 'CHUNKS': '📦', 'SEGURO': '🔧', 'MÍNIMO': '🐢'}
+    iconos = {'TURBO': '🚀', 'CHUNKS': '📦', 'SEGURO': '🔧', 'MÍNIMO': '🐢', 'CFDI': '🧾'}
     print(f"\n  {iconos.get(analisis.modo, '⚙️')} Motor: "
           f"{analisis.motor.upper()} — {analisis.modo}\n")
 
@@ -146,22 +146,34 @@ def main():
     try:
         if analisis.motor == 'pandas':
             from models.motores.motor_pandas import procesar_con_pandas
-            stats = procesar_con_pandas(file_path, output_path, analisis.modo)
+            resultado = procesar_con_pandas(file_path, output_path, analisis.modo)
 
         elif analisis.motor == 'pandas_chunks':
             from models.motores.motor_chunks import procesar_con_chunks
-            stats = procesar_con_chunks(file_path, output_path, analisis.chunk_size)
+            resultado = procesar_con_chunks(file_path, output_path, analisis.chunk_size,
+                                        procesos=analisis.procesos)
+
+        elif analisis.motor == 'cfdi_xml':
+            from models.motores.motor_cfdi import procesar_con_cfdi
+            resultado = procesar_con_cfdi(file_path, output_path, analisis.chunk_size)
 
         else:
             from models.motores.motor_openpyxl import procesar_con_openpyxl
-            stats = procesar_con_openpyxl(file_path, output_path, analisis.modo)
+            resultado = procesar_con_openpyxl(file_path, output_path, analisis.modo)
 
     except MemoryError:
-        print("\n⚠️  MEMORIA INSUFICIENTE — cambiando a openpyxl automáticamente...")
-        from models.motores.motor_openpyxl import procesar_con_openpyxl
-        stats = procesar_con_openpyxl(file_path, output_path, 'SEGURO')
-        analisis.motor = 'openpyxl (fallback)'
-        analisis.modo  = 'SEGURO'
+        if analisis.motor == 'cfdi_xml':
+            # Carpeta XML: no hay Excel para openpyxl → bloques chicos, 1 proceso
+            print("\n⚠️  MEMORIA INSUFICIENTE — reintentando con bloques de 1,000 y un proceso...")
+            from models.motores.motor_cfdi import procesar_con_cfdi
+            resultado = procesar_con_cfdi(file_path, output_path, 1000, workers=1)
+            analisis.chunk_size = 1000
+        else:
+            print("\n⚠️  MEMORIA INSUFICIENTE — cambiando a openpyxl automáticamente...")
+            from models.motores.motor_openpyxl import procesar_con_openpyxl
+            resultado = procesar_con_openpyxl(file_path, output_path, 'SEGURO')
+            analisis.motor = 'openpyxl (fallback)'
+            analisis.modo  = 'SEGURO'
 
     except Exception as e:
         print(f"\n❌ Error en Paso 2: {e}")
@@ -170,6 +182,7 @@ def main():
         mostrar_mensaje_final("Error en Proceso", f"Ocurrió un error en la validación:\n\n{e}", "error")
         raise SystemExit(1)
 
+    stats        = resultado.stats
     t_validacion = time.time() - t_inicio
     velocidad    = analisis.filas_reales / t_validacion if t_validacion > 0 else 0
     log.registrar_fin(output_path, analisis.filas_reales, t_validacion, analisis.motor)
@@ -196,8 +209,13 @@ def main():
     print(f"    S01 (sin efectos)  : {stats.get('s01', 0):,}")
     print(f"    Efectivo >$2,000   : {stats.get('ef_mayor', 0):,}")
 
+    if stats.get('conceptos_unicos'):
+        filas, unicos = stats['conceptos_filas'], stats['conceptos_unicos']
+        print(f"\n  🔁 Conceptos clasificados: {unicos:,} distintos de {filas:,} filas "
+              f"({filas / unicos:.1f}× menos trabajo)")
+
     # ══════════════════════════════════════════════════════════════════
-    # PASO 3 — GENERAR REPORTES HTML + EXCEL desde _validado.xlsx
+    # PASO 3 — GENERAR REPORTES HTML + EXCEL (datos del Paso 2 en memoria)
     # ══════════════════════════════════════════════════════════════════
 
     print("\n" + "─" * 70)
@@ -206,7 +224,8 @@ def main():
 
     try:
         from controllers.generador_reporte import generar_reporte
-        generar_reporte(output_path, mes_reporte=mes_reporte)
+        # Columnas ya en memoria (motores pandas/chunks): sin releer el _validado.xlsx
+        generar_reporte(output_path, mes_reporte=mes_reporte, validado=resultado.tabla)
 
     except ImportError:
         msg = (
@@ -276,7 +295,7 @@ def main():
     print(f"  🚗 Motor usado       : {analisis.motor.upper()} — {analisis.modo}")
     print(f"  🖥️  RAM disponible    : {analisis.ram_disponible_gb:.1f} GB")
 
-    if analisis.motor == 'pandas_chunks':
+    if analisis.motor in ('pandas_chunks', 'cfdi_xml'):
         bloques = -(-analisis.filas_reales // analisis.chunk_size)
         print(f"  📦 Bloques proc.     : {bloques} × {analisis.chunk_size:,} filas")
 
@@ -11,6 +11,7 @@ MOTORES:
   📦 CHUNKS       — pandas por bloques    (RAM ≥ 4GB, >30k filas)
   🔧 SEGURO       — openpyxl optimizado   (RAM 2-4GB)
   🐢 MÍNIMO       — openpyxl conservador  (RAM < 2GB)
+  🧾 CFDI         — carpeta de XML CFDI 4.0 (ProcessPool + chunks)
 
 TABLA DE DECISIÓN:
   Filas      RAM        Motor
@@ -21,12 +22,25 @@ TABLA DE DECISIÓN:
   > 30k      < 4 GB     openpyxl  MÍNIMO
   > 30k      ≥ 4 GB     chunks    CHUNKS
   cualquiera < 2 GB     openpyxl  MÍNIMO
+  carpeta    cualquiera cfdi_xml  CFDI
+
+METADATOS (sondeo, sin abrir el libro):
+  • filas/columnas de <dimension> o contando <row en el ZIP
+  • RAM estimada para TURBO (celdas + sharedStrings): si no cabe
+    holgada en la RAM disponible → CHUNKS aunque sean < 30k filas
+  • bloque ajustado al ancho: hojas con muchas columnas → bloques menores
+  • encabezados: aviso temprano si faltan columnas clave
+
+PARALELO (solo CHUNKS):
+  núcleos ≥ 4 y filas ≥ 100,000 → la preparación de cada bloque se
+  reparte en varios procesos (motores/clasificacion_paralela.py)
 """
 
 import os
+import importlib.util
 import multiprocessing
 import platform
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 try:
     import psutil
@@ -34,11 +48,8 @@ try:
 except ImportError:
     PSUTIL_OK = False
 
-try:
-    import openpyxl
-    OPENPYXL_OK = True
-except ImportError:
-    OPENPYXL_OK = False
+# Solo para el resumen: el conteo de filas ya no abre el libro (sondear)
+OPENPYXL_OK = importlib.util.find_spec('openpyxl') is not None
 
 
 @dataclass
@@ -50,11 +61,14 @@ class ResultadoAnalisis:
     archivo_mb:        float
     filas_reales:      int
     columnas:          int
-    motor:             str    # 'pandas' | 'openpyxl' | 'pandas_chunks'
-    modo:              str    # 'TURBO' | 'CHUNKS' | 'SEGURO' | 'MÍNIMO'
+    motor:             str    # 'pandas' | 'openpyxl' | 'pandas_chunks' | 'cfdi_xml'
+    modo:              str    # 'TURBO' | 'CHUNKS' | 'SEGURO' | 'MÍNIMO' | 'CFDI'
     razon:             str
     pandas_disponible: bool
     chunk_size:        int    # tamaño de bloque para motor chunks
+    encabezados:       list  = field(default_factory=list)
+    shared_strings_mb: float = 0.0
+    procesos:          int   = 1      # procesos de clasificación (CHUNKS)
 
 
 def analizar_sistema() -> tuple:
@@ -70,21 +84,30 @@ def analizar_sistema() -> tuple:
     return ram_total, ram_disp, multiprocessing.cpu_count(), so
 
 
+# Columnas sin las que la validación no tiene sentido (aviso temprano)
+COLUMNAS_CLAVE = ('UUID', 'Conceptos', 'Total', 'Forma pago',
+                  'Regimen receptor', 'Uso CFDI')
+
+
 def analizar_archivo(file_path: str) -> tuple:
+    """Tamaño + Metadatos del formato (sondeo, sin leer las celdas)."""
+    from models.lectores import obtener_lector, Metadatos
     archivo_mb = os.path.getsize(file_path) / (1024 * 1024)
-    filas      = max(100, int(archivo_mb * 1000))
-    columnas   = 20
 
-    if OPENPYXL_OK:
-        try:
-            wb    = openpyxl.load_workbook(file_path, read_only=True)
-            sh    = wb.active
-            filas = max(0, (sh.max_row or 1) - 1)
-            columnas = sh.max_column or 20
-            wb.close()
-        except Exception as e:
-            print(f"  ⚠️  No se pudieron contar filas: {e}")
-    return archivo_mb, filas, columnas
+    try:
+        meta = obtener_lector(file_path).sondear(file_path)
+    except Exception as e:
+        print(f"  ⚠️  No se pudieron contar filas: {e}")
+        meta = Metadatos(max(100, int(archivo_mb * 1000)), 20, fuente='estimado')
+    return archivo_mb, meta
+
+
+def analizar_carpeta_cfdi(carpeta: str) -> tuple:
+    """Carpeta de XML: cada XML es un comprobante (= una fila)."""
+    from models.lectores import LECTOR_CFDI
+    from models.lector_cfdi import listar_xml
+    archivo_mb = sum(os.path.getsize(r) for r in listar_xml(carpeta)) / (1024 * 1024)
+    return archivo_mb, LECTOR_CFDI.sondear(carpeta)
 
 
 def verificar_pandas() -> bool:
@@ -99,23 +122,40 @@ def calcular_chunk_size(ram_gb: float, columnas: int) -> int:
     """
     Calcula el tamaño óptimo de bloque según RAM disponible.
     Más RAM → bloques más grandes → menos iteraciones.
+    Calibrado para ~20 columnas: hojas más anchas → bloques menores
+    (mismas celdas por bloque).
     """
     if ram_gb >= 8:
-        return 10000
+        base = 10000
     elif ram_gb >= 4:
-        return 5000
+        base = 5000
     elif ram_gb >= 2:
-        return 2000
+        base = 2000
     else:
-        return 1000
+        base = 1000
+    if columnas > 20:
+        base = max(500, base * 20 // columnas // 500 * 500)
+    return base
+
+
+# RAM de pandas TURBO (read_excel + columnas internas), aprox. por celda,
+# más la tabla de sharedStrings ya como objetos Python
+BYTES_POR_CELDA_TURBO = 600
+FACTOR_SHARED_STRINGS = 4
+
+
+def estimar_ram_turbo_gb(filas: int, columnas: int, shared_mb: float) -> float:
+    return (filas * max(columnas, 20) * BYTES_POR_CELDA_TURBO
+            + shared_mb * FACTOR_SHARED_STRINGS * 1024 * 1024) / (1024 ** 3)
 
 
 def elegir_motor(ram_gb: float, archivo_mb: float,
-                 filas: int, pandas_ok: bool) -> tuple:
+                 filas: int, pandas_ok: bool,
+                 columnas: int = 20, shared_mb: float = 0.0) -> tuple:
     """
     Retorna: (motor, modo, razon, chunk_size)
     """
-    chunk_size = calcular_chunk_size(ram_gb, 20)
+    chunk_size = calcular_chunk_size(ram_gb, columnas)
 
     if not pandas_ok:
         return ('openpyxl', 'SEGURO', chunk_size,
@@ -133,6 +173,12 @@ def elegir_motor(ram_gb: float, archivo_mb: float,
         return ('openpyxl', 'SEGURO', chunk_size,
                 f'RAM moderada ({ram_gb:.1f} GB) — openpyxl optimizado')
 
+    ram_turbo = estimar_ram_turbo_gb(filas, columnas, shared_mb)
+    if filas <= 30000 and ram_gb >= 4.0 and ram_turbo > ram_gb / 2:
+        return ('pandas_chunks', 'CHUNKS', chunk_size,
+                f'{filas:,} filas × {columnas} columnas necesitarían ~{ram_turbo:.1f} GB '
+                f'en TURBO — chunks de {chunk_size:,} filas')
+
     if filas <= 30000 and ram_gb >= 4.0:
         return ('pandas', 'TURBO', chunk_size,
                 f'RAM suficiente ({ram_gb:.1f} GB) + {filas:,} filas — pandas TURBO')
@@ -149,6 +195,18 @@ def elegir_motor(ram_gb: float, archivo_mb: float,
     return ('openpyxl', 'SEGURO', chunk_size, 'Configuración no clasificada — modo seguro')
 
 
+NUCLEOS_MIN_PARALELO = 4
+FILAS_MIN_PARALELO   = 100000
+MAX_PROCESOS         = 8
+
+
+def elegir_procesos(cpu: int, filas: int, motor: str) -> int:
+    """Procesos para preparar bloques en paralelo (1 = en el principal)."""
+    if motor != 'pandas_chunks' or cpu < NUCLEOS_MIN_PARALELO or filas < FILAS_MIN_PARALELO:
+        return 1
+    return min(cpu, MAX_PROCESOS)
+
+
 def analizar_y_decidir(file_path: str) -> ResultadoAnalisis:
 
     print("\n╔" + "═" * 68 + "╗")
@@ -168,11 +226,23 @@ def analizar_y_decidir(file_path: str) -> ResultadoAnalisis:
     print(f"║    Estado RAM     : {estado_ram}".ljust(69) + "║")
 
     print("╠" + "═" * 68 + "╣")
-    print("║  📁 ARCHIVO:".ljust(69) + "║")
-    arch_mb, filas, cols = analizar_archivo(file_path)
+    es_carpeta = os.path.isdir(file_path)
+    print(("║  📁 CARPETA XML:" if es_carpeta else "║  📁 ARCHIVO:").ljust(69) + "║")
+    if es_carpeta:
+        arch_mb, meta = analizar_carpeta_cfdi(file_path)
+    else:
+        arch_mb, meta = analizar_archivo(file_path)
+    filas, cols = meta.filas, meta.columnas
     print(f"║    Tamaño         : {arch_mb:.2f} MB".ljust(69) + "║")
-    print(f"║    Filas          : {filas:,}".ljust(69) + "║")
+    print(f"║    Filas          : {filas:,}  ({meta.fuente})".ljust(69) + "║")
     print(f"║    Columnas       : {cols}".ljust(69) + "║")
+    if meta.shared_strings_mb:
+        print(f"║    sharedStrings  : {meta.shared_strings_mb:.2f} MB".ljust(69) + "║")
+    if meta.encabezados:
+        from models.esquema_columnas import compilar_esquema
+        faltan = compilar_esquema(meta.encabezados).faltantes(COLUMNAS_CLAVE)
+        if faltan:
+            print(f"║    ⚠️  Faltan     : {', '.join(faltan)}"[:68].ljust(69) + "║")
 
     estado_arch = ("🟢 Pequeño  (<5k filas)"   if filas < 5000
                    else "🟡 Mediano  (5k-30k)"  if filas <= 30000
@@ -185,12 +255,21 @@ def analizar_y_decidir(file_path: str) -> ResultadoAnalisis:
     print(f"║    pandas  : {'✅' if pandas_ok else '❌ pip install pandas'}".ljust(69) + "║")
     print(f"║    psutil  : {'✅' if PSUTIL_OK  else '⚠️  pip install psutil'}".ljust(69) + "║")
     print(f"║    openpyxl: {'✅' if OPENPYXL_OK else '❌ pip install openpyxl'}".ljust(69) + "║")
-
-    motor, modo, chunk_size, razon = elegir_motor(ram_disp, arch_mb, filas, pandas_ok)
-
-    iconos = {'TURBO':'🚀','CHUNKS':'📦','SEGURO':'🔧','MÍNIMO':'🐢'}
+    from models.lectores import PYARROW_OK
+    print(f"║    pyarrow : {'✅' if PYARROW_OK else '➖ opcional (Parquet/Arrow)'}".ljust(69) + "║")
+
+    motor, modo, chunk_size, razon = elegir_motor(
+        ram_disp, arch_mb, filas, pandas_ok, cols, meta.shared_strings_mb)
+    if es_carpeta:
+        motor, modo = 'cfdi_xml', 'CFDI'
+        razon = (f'Carpeta con {filas:,} XML CFDI — parseo en paralelo '
+                 f'({cpu} procesos) y validación por bloques de {chunk_size:,}')
+    procesos = elegir_procesos(cpu, filas, motor)
+
+    iconos = {'TURBO':'🚀','CHUNKS':'📦','SEGURO':'🔧','MÍNIMO':'🐢','CFDI':'🧾'}
     vel    = {'TURBO':'~20,000 fact/min','CHUNKS':'~15,000 fact/min',
-              'SEGURO':'~5,000 fact/min','MÍNIMO':'~2,000 fact/min'}
+              'SEGURO':'~5,000 fact/min','MÍNIMO':'~2,000 fact/min',
+              'CFDI':'~15,000 fact/min'}
 
     print("╠" + "═" * 68 + "╣")
     print(f"║  {iconos.get(modo,'⚙️')} MOTOR: {motor.upper()} — MODO {modo}".ljust(69) + "║")
@@ -206,10 +285,12 @@ def analizar_y_decidir(file_path: str) -> ResultadoAnalisis:
     if linea:
         print(f"║    {linea:<64}║")
 
-    if motor == 'pandas_chunks':
+    if motor in ('pandas_chunks', 'cfdi_xml'):
         print(f"║    Tamaño de bloque: {chunk_size:,} filas".ljust(69) + "║")
         bloques = -(-filas // chunk_size)
         print(f"║    Bloques totales : ~{bloques}".ljust(69) + "║")
+    if procesos > 1:
+        print(f"║    Procesos        : {procesos} (clasificación en paralelo)".ljust(69) + "║")
 
     print(f"║    Velocidad est. : {vel.get(modo,'N/D')}".ljust(69) + "║")
     print("╚" + "═" * 68 + "╝\n")
@@ -220,4 +301,6 @@ def analizar_y_decidir(file_path: str) -> ResultadoAnalisis:
         archivo_mb=arch_mb, filas_reales=filas, columnas=cols,
         motor=motor, modo=modo, razon=razon,
         pandas_disponible=pandas_ok, chunk_size=chunk_size,
+        encabezados=meta.encabezados, shared_strings_mb=meta.shared_strings_mb,
+        procesos=procesos,
     )
@@ -0,0 +1,209 @@
+"""
+cache_conceptos.py — Caché persistente de clasificación de conceptos
+ReaDesF1.9
+
+Mes a mes se repiten los mismos conceptos ('MAGNA', 'DIESEL', el mismo
+fertilizante). La clasificación (máscara CAT_* de validaciones_fiscales)
+de cada concepto ya visto se guarda en disco; un mes nuevo solo paga por
+los conceptos que nunca se habían visto.
+
+  concepto ──→ normalizar ──→ ¿en memoria? ──sí──→ bits
+  ('MAGNA ')   ('magna')          │ no
+                                  ↓
+                           índice → bits ──→ memoria + pendientes
+                                                  │ guardar()
+                                                  ↓
+                          cache_lectura/conceptos.sqlite
+                          ┌──────────┬──────┬─────┐
+                          │ texto    │ bits │ uso │  uso = nº de corrida
+                          └──────────┴──────┴─────┘  (LRU)
+
+  • Acotada: ConfiguracionSeguridad.CACHE_CONCEPTOS_MAX entradas, en
+    disco y en memoria; se descartan las usadas hace más corridas.
+  • Firma de las palabras del catálogo: si cambian, la caché se vacía sola
+    al abrirse (nunca responde con reglas viejas).
+  • Al abrir se carga completa en memoria (es chica); durante la
+    corrida no hay consultas a SQLite, solo escrituras por lotes.
+  • Procesos de clasificación en paralelo: reciben una copia en
+    memoria (semilla) y devuelven lo que aprendieron (tomar_nuevos);
+    solo el proceso principal escribe en disco.
+
+Línea de comandos (desde la raíz del proyecto):
+  python -m models.cache_conceptos            → resumen
+  python -m models.cache_conceptos purgar     → vaciar
+"""
+
+import os
+import sys
+import sqlite3
+import hashlib
+from collections import OrderedDict
+
+from seguridad import ConfiguracionSeguridad
+
+# Subir si cambia cómo se calculan los bits (no solo las palabras)
+VERSION_CONCEPTOS = 2
+
+ARCHIVO_CONCEPTOS = 'conceptos.sqlite'
+
+# Pendientes de escribir antes de bajar un lote a disco
+_LOTE_GUARDADO = 10000
+
+
+def ruta_cache_conceptos() -> str:
+    return os.path.join(ConfiguracionSeguridad.CACHE_DIRECTORY, ARCHIVO_CONCEPTOS)
+
+
+def normalizar_concepto(texto) -> str:
+    """Clave de la caché: minúsculas, sin espacios en los extremos."""
+    return str(texto).lower().strip()
+
+
+def firma_categorias(categorias: dict) -> str:
+    """Hash de {bit: palabras} — cambia con cualquier palabra agregada o quitada."""
+    h = hashlib.sha256(f'v{VERSION_CONCEPTOS}'.encode())
+    for bit in sorted(categorias):
+        h.update(f'|{bit}:'.encode())
+        for palabra in sorted(categorias[bit]):
+            h.update(palabra.encode('utf-8') + b'\0')
+    return h.hexdigest()
+
+
+class CacheConceptos:
+    """
+    texto normalizado → bits, con LRU acotado en memoria y en disco.
+    ruta=None → solo en memoria (caché desactivada, SQLite no disponible
+    o proceso de trabajo con `semilla` = exportar() del principal).
+    """
+
+    def __init__(self, firma: str, ruta: str = None, maximo: int = 100000,
+                 semilla: dict = None):
+        self.firma    = firma
+        self.maximo   = max(1, int(maximo))
+        self.aciertos = 0
+        self.nuevos   = 0
+        self._ruta    = ruta
+        self._mem     = OrderedDict()   # más reciente al final
+        self._pend    = {}              # nuevos aún no escritos
+        self._usados  = set()           # conocidos tocados (LRU en disco)
+        self._corrida = 1
+        if semilla:
+            self._mem.update(semilla)
+        if ruta:
+            try:
+                self._cargar()
+            except sqlite3.Error as e:
+                print(f"  ⚠️  Caché de conceptos no disponible ({e}) — solo en memoria")
+                self._ruta = None
+
+    # ── Disco ───────────────────────────────────────────────────
+    def _conectar(self) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(self._ruta) or '.', exist_ok=True)
+        con = sqlite3.connect(self._ruta, timeout=30)
+        con.execute('CREATE TABLE IF NOT EXISTS meta (clave TEXT PRIMARY KEY, valor TEXT)')
+        con.execute('CREATE TABLE IF NOT EXISTS conceptos ('
+                    'texto TEXT PRIMARY KEY, bits INTEGER NOT NULL, '
+                    'uso INTEGER NOT NULL) WITHOUT ROWID')
+        con.execute('CREATE INDEX IF NOT EXISTS conceptos_uso ON conceptos (uso)')
+        return con
+
+    def _cargar(self):
+        con = self._conectar()
+        try:
+            meta = dict(con.execute('SELECT clave, valor FROM meta'))
+            with con:
+                if meta.get('firma') != self.firma:
+                    # Cambiaron las palabras clave → todo lo guardado es viejo
+                    con.execute('DELETE FROM conceptos')
+                    con.execute("INSERT OR REPLACE INTO meta VALUES ('firma', ?)", (self.firma,))
+                    meta['corrida'] = '0'
+                self._corrida = int(meta.get('corrida', 0)) + 1
+                con.execute("INSERT OR REPLACE INTO meta VALUES ('corrida', ?)",
+                            (str(self._corrida),))
+            filas = con.execute('SELECT texto, bits FROM conceptos '
+                                'ORDER BY uso DESC LIMIT ?', (self.maximo,)).fetchall()
+        finally:
+            con.close()
+        for texto, bits in reversed(filas):
+            self._mem[texto] = bits
+
+    def guardar(self) -> None:
+        """Baja a disco los conceptos nuevos y el último uso de los conocidos."""
+        if not self._ruta or not (self._pend or self._usados):
+            self._pend.clear()
+            self._usados.clear()
+            return
+        try:
+            con = self._conectar()
+            try:
+                with con:
+                    con.executemany('INSERT OR REPLACE INTO conceptos VALUES (?, ?, ?)',
+                                    ((t, b, self._corrida) for t, b in self._pend.items()))
+                    con.executemany('UPDATE conceptos SET uso = ? WHERE texto = ?',
+                                    ((self._corrida, t) for t in self._usados))
+                    con.execute('DELETE FROM conceptos WHERE texto IN (SELECT texto FROM '
+                                'conceptos ORDER BY uso DESC LIMIT -1 OFFSET ?)', (self.maximo,))
+            finally:
+                con.close()
+        except sqlite3.Error as e:
+            print(f"  ⚠️  No se pudo guardar la caché de conceptos ({e})")
+        self._pend.clear()
+        self._usados.clear()
+
+    # ── Consulta ────────────────────────────────────────────────
+    def obtener(self, texto: str):
+        """bits del concepto ya normalizado, o None si nunca se vio."""
+        bits = self._mem.get(texto)
+        if bits is None:
+            return None
+        self._mem.move_to_end(texto)
+        self.aciertos += 1
+        if self._ruta:
+            self._usados.add(texto)
+            if len(self._usados) >= _LOTE_GUARDADO:
+                self.guardar()
+        return bits
+
+    def agregar(self, texto: str, bits: int) -> None:
+        self._mem[texto] = bits
+        if len(self._mem) > self.maximo:
+            self._mem.popitem(last=False)
+        self.nuevos += 1
+        self._pend[texto] = bits
+        if self._ruta and len(self._pend) >= _LOTE_GUARDADO:
+            self.guardar()
+
+    # ── Procesos de trabajo ─────────────────────────────────────
+    def exportar(self) -> dict:
+        """Copia texto → bits para sembrar la caché de otro proceso."""
+        return dict(self._mem)
+
+    def tomar_nuevos(self) -> dict:
+        """Conceptos agregados desde la última llamada (y los olvida)."""
+        nuevos, self._pend = self._pend, {}
+        return nuevos
+
+    def __contains__(self, texto: str) -> bool:
+        return texto in self._mem
+
+    def __len__(self) -> int:
+        return len(self._mem)
+
+
+if __name__ == '__main__':
+    ruta = ruta_cache_conceptos()
+    orden = sys.argv[1] if len(sys.argv) >= 2 else 'resumen'
+    if not os.path.exists(ruta):
+        print(f'  (sin caché de conceptos en {ruta})')
+    elif orden == 'purgar':
+        os.remove(ruta)
+        print(f'  🗑️  {ruta} borrada')
+    elif orden == 'resumen':
+        con = sqlite3.connect(ruta)
+        n, = con.execute('SELECT COUNT(*) FROM conceptos').fetchone()
+        meta = dict(con.execute('SELECT clave, valor FROM meta'))
+        con.close()
+        print(f"  🗂️  {n:,} conceptos · corrida {meta.get('corrida', '?')} · "
+              f"firma {meta.get('firma', '')[:12]} · {os.path.getsize(ruta) / 1024:,.0f} KB")
+    else:
+        print(__doc__)
@@ -0,0 +1,360 @@
+"""
+cache_lectura.py — Caché de lectura direccionada por contenido
+ReaDesF1.9
+
+Parsear un .xlsx (o una carpeta de XML) es lo más lento del proceso.
+Si el archivo NO cambió, volver a ejecutar no debería re-parsearlo:
+
+  ┌──────────────┐  SHA-256  ┌───────────────────────┐
+  │ origen       │ ────────→ │ clave = hash + lector │
+  └──────────────┘           │         + versión     │
+                             └──────────┬────────────┘
+                     existe ┌───────────┴───────────┐ no existe
+                            ↓                       ↓
+              cache_lectura/CLAVE.arrow     lector normal (xlsx/csv/XML)
+              (Arrow IPC, memory_map)       → se guarda mientras se lee
+                            └───────────┬───────────┘
+                                        ↓
+                          mismos DataFrames para los motores
+
+  • La clave es el CONTENIDO (no nombre ni fecha): renombrar o copiar
+    el archivo sigue acertando; cambiar una celda ya no.
+  • Lector.version entra en la clave → un lector corregido invalida
+    lo viejo sin borrar nada a mano.
+  • Tamaño acotado (ConfiguracionSeguridad.CACHE_MAX_MB): al guardar se
+    borran las entradas usadas hace más tiempo (LRU; el último uso es
+    el mtime del .arrow, que se toca en cada acierto).
+  • Guardado atómico (.tmp → rename): una lectura interrumpida no deja
+    entradas a medias.
+
+Requiere pyarrow (opcional); sin él la caché simplemente no se usa.
+
+Línea de comandos (desde la raíz del proyecto):
+  python -m models.cache_lectura                 → listar entradas
+  python -m models.cache_lectura purgar          → borrar todo
+  python -m models.cache_lectura purgar CLAVE    → borrar entradas por prefijo
+  python -m models.cache_lectura recortar MB     → dejar como máximo MB
+"""
+
+import os
+import sys
+import json
+from dataclasses import replace
+from datetime import datetime
+
+import pandas as pd
+
+from models.lectores import Lector, PYARROW_OK
+from seguridad import ConfiguracionSeguridad, hash_sha256
+
+if PYARROW_OK:
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+
+# Subir si cambia el formato de lo guardado (esquema, metadatos)
+VERSION_CACHE = 1
+
+_EXT_DATOS = '.arrow'
+_EXT_META  = '.json'
+
+
+class _CacheNoAplicable(Exception):
+    """Bloque que no cabe en el esquema del primero → no se cachea."""
+
+
+def _directorio() -> str:
+    return ConfiguracionSeguridad.CACHE_DIRECTORY
+
+
+def _activa(lector: Lector) -> bool:
+    return (PYARROW_OK and lector.cacheable
+            and ConfiguracionSeguridad.USAR_CACHE_LECTURA)
+
+
+def clave_cache(ruta: str, lector: Lector) -> str:
+    """hash del contenido + lector + versión del lector + versión de la caché."""
+    return f'{hash_sha256(ruta)}-{lector.nombre}-v{lector.version}-c{VERSION_CACHE}'
+
+
+def _rutas(clave: str):
+    base = os.path.join(_directorio(), clave)
+    return base + _EXT_DATOS, base + _EXT_META
+
+
+# ══════════════════════════════════════════════════════════════════
+# ESQUEMA — texto o número por columna, fijado con el primer bloque
+# ══════════════════════════════════════════════════════════════════
+
+def _esquema(df: pd.DataFrame):
+    campos = []
+    for c in df.columns:
+        tipo = pd.api.types.infer_dtype(df[c], skipna=True)
+        if tipo in ('string', 'empty'):
+            campos.append(pa.field(c, pa.string()))
+        elif tipo == 'integer':
+            campos.append(pa.field(c, pa.int64()))
+        elif tipo in ('floating', 'mixed-integer-float'):
+            campos.append(pa.field(c, pa.float64()))
+        else:
+            raise _CacheNoAplicable(f'columna "{c}" con tipos mezclados ({tipo})')
+    return pa.schema(campos)
+
+
+def _a_tabla(df: pd.DataFrame, esquema):
+    if list(df.columns) != esquema.names:
+        raise _CacheNoAplicable('columnas distintas entre bloques')
+    try:
+        return pa.Table.from_pandas(df, schema=esquema, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+        raise _CacheNoAplicable(str(e))
+
+
+def _opciones_ipc():
+    # zstd si está compilado en pyarrow: textos fiscales comprimen ~5-10x
+    if pa.Codec.is_available('zstd'):
+        return ipc.IpcWriteOptions(compression='zstd')
+    return ipc.IpcWriteOptions()
+
+
+class _EscritorCache:
+    """Entrada nueva: bloques → CLAVE.arrow.tmp; confirmar() la publica."""
+
+    def __init__(self, clave: str, ruta_origen: str, lector: Lector):
+        os.makedirs(_directorio(), exist_ok=True)
+        self.clave  = clave
+        self.origen = os.path.abspath(ruta_origen)
+        self.lector = lector
+        self.datos, self.meta = _rutas(clave)
+        self.tmp    = self.datos + '.tmp'
+        self.writer = None
+        self.esquema = None
+        self.filas  = 0
+
+    def agregar(self, df: pd.DataFrame) -> None:
+        if self.writer is None:
+            self.esquema = _esquema(df)
+            self.writer  = ipc.new_file(self.tmp, self.esquema, options=_opciones_ipc())
+        tabla = _a_tabla(df, self.esquema)
+        self.writer.write_table(tabla)
+        self.filas += len(df)
+
+    def confirmar(self) -> None:
+        if self.writer is None:
+            return
+        self.writer.close()
+        self.writer = None
+        os.replace(self.tmp, self.datos)
+        meta = {
+            'origen':   self.origen,
+            'lector':   self.lector.nombre,
+            'version':  self.lector.version,
+            'filas':    self.filas,
+            'bytes':    os.path.getsize(self.datos),
+            'creado':   datetime.now().isoformat(timespec='seconds'),
+        }
+        with open(self.meta, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=1)
+        recortar(ConfiguracionSeguridad.CACHE_MAX_MB * 1024 * 1024)
+
+    def descartar(self) -> None:
+        if self.writer is not None:
+            try:
+                self.writer.close()
+            except Exception:
+                pass
+            self.writer = None
+        if os.path.exists(self.tmp):
+            os.remove(self.tmp)
+
+
+# ══════════════════════════════════════════════════════════════════
+# LECTURA
+# ══════════════════════════════════════════════════════════════════
+
+def _tabla_cacheada(clave: str):
+    """Tabla Arrow de la entrada (mapeada en memoria) o None."""
+    datos, _ = _rutas(clave)
+    if not os.path.exists(datos):
+        return None
+    try:
+        with pa.memory_map(datos, 'r') as fuente:
+            tabla = ipc.open_file(fuente).read_all()
+    except (pa.ArrowInvalid, OSError):
+        # Entrada dañada: se borra y se vuelve a leer el origen
+        _borrar(clave)
+        return None
+    os.utime(datos)   # último uso → orden LRU
+    print(f"  ⚡ Caché de lectura: {tabla.num_rows:,} filas sin re-parsear "
+          f"({clave[:12]}…)")
+    return tabla
+
+
+def _a_pandas(tabla) -> pd.DataFrame:
+    return tabla.to_pandas().astype(object)
+
+
+def leer_bloques_cacheado(lector: Lector, ruta: str, chunk_size: int = 5000,
+                          fuente=None):
+    """
+    Igual que lector.leer_bloques(ruta, chunk_size) pero desde la caché
+    si el contenido ya se leyó antes. En un fallo, los bloques se guardan
+    conforme se entregan; la entrada solo se publica si se leyeron todos.
+    fuente = generador alternativo (p. ej. leer_bloques_cfdi con workers).
+    """
+    fuente = fuente or lector.leer_bloques
+    if not _activa(lector):
+        yield from fuente(ruta, chunk_size)
+        return
+
+    clave = clave_cache(ruta, lector)
+    tabla = _tabla_cacheada(clave)
+    if tabla is not None:
+        # Re-cortar a chunk_size exacto: los bloques coinciden con los de
+        # una lectura normal (importa para el punto de control de chunks)
+        for inicio in range(0, tabla.num_rows, chunk_size):
+            yield _a_pandas(tabla.slice(inicio, chunk_size))
+        return
+
+    escritor = _EscritorCache(clave, ruta, lector)
+    completo = False
+    try:
+        for df in fuente(ruta, chunk_size):
+            if escritor is not None:
+                try:
+                    escritor.agregar(df)
+                except _CacheNoAplicable as e:
+                    print(f"  ⚠️  Caché de lectura omitida: {e}")
+                    escritor.descartar()
+                    escritor = None
+            yield df
+        completo = True
+    finally:
+        if escritor is not None:
+            if completo:
+                escritor.confirmar()
+            else:
+                escritor.descartar()
+
+
+def leer_todo_cacheado(lector: Lector, ruta: str) -> pd.DataFrame:
+    """Igual que lector.leer_todo(ruta), desde la caché si ya se leyó."""
+    if not _activa(lector):
+        return lector.leer_todo(ruta)
+
+    clave = clave_cache(ruta, lector)
+    tabla = _tabla_cacheada(clave)
+    if tabla is not None:
+        return _a_pandas(tabla)
+
+    df = lector.leer_todo(ruta)
+    escritor = _EscritorCache(clave, ruta, lector)
+    try:
+        escritor.agregar(df)
+        escritor.confirmar()
+    except _CacheNoAplicable as e:
+        print(f"  ⚠️  Caché de lectura omitida: {e}")
+        escritor.descartar()
+    return df
+
+
+def con_cache(lector: Lector) -> Lector:
+    """Lector con leer_bloques / leer_todo pasando por la caché."""
+    if not lector.cacheable:
+        return lector
+    return replace(
+        lector,
+        leer_bloques=lambda r, chunk_size=5000: leer_bloques_cacheado(lector, r, chunk_size),
+        leer_todo=lambda r: leer_todo_cacheado(lector, r))
+
+
+# ══════════════════════════════════════════════════════════════════
+# MANTENIMIENTO — listar / purgar / recortar (LRU)
+# ══════════════════════════════════════════════════════════════════
+
+def entradas() -> list:
+    """Entradas de la caché, la usada más recientemente primero."""
+    directorio = _directorio()
+    if not os.path.isdir(directorio):
+        return []
+    lista = []
+    for nombre in os.listdir(directorio):
+        if not nombre.endswith(_EXT_DATOS):
+            continue
+        clave = nombre[:-len(_EXT_DATOS)]
+        datos, meta_ruta = _rutas(clave)
+        st = os.stat(datos)
+        meta = {}
+        if os.path.exists(meta_ruta):
+            try:
+                with open(meta_ruta, encoding='utf-8') as f:
+                    meta = json.load(f)
+            except (OSError, ValueError):
+                pass
+        lista.append({'clave': clave, 'bytes': st.st_size,
+                      'ultimo_uso': st.st_mtime, **{k: v for k, v in meta.items()
+                                                   if k != 'bytes'}})
+    lista.sort(key=lambda e: e['ultimo_uso'], reverse=True)
+    return lista
+
+
+def _borrar(clave: str) -> None:
+    for ruta in _rutas(clave):
+        if os.path.exists(ruta):
+            os.remove(ruta)
+
+
+def purgar(prefijo: str = '') -> int:
+    """Borra las entradas cuya clave empieza con prefijo ('' = todas)."""
+    borradas = 0
+    for e in entradas():
+        if e['clave'].startswith(prefijo):
+            _borrar(e['clave'])
+            borradas += 1
+    return borradas
+
+
+def recortar(max_bytes: int) -> int:
+    """Borra las entradas menos usadas hasta ocupar ≤ max_bytes."""
+    lista = entradas()
+    total = sum(e['bytes'] for e in lista)
+    borradas = 0
+    while lista and total > max_bytes:
+        e = lista.pop()   # la de uso más antiguo
+        _borrar(e['clave'])
+        total -= e['bytes']
+        borradas += 1
+    return borradas
+
+
+def _mostrar_entradas():
+    lista = entradas()
+    print('\n' + '='*60)
+    print(f'  CACHÉ DE LECTURA — {_directorio()}/')
+    print('='*60)
+    if not lista:
+        print('  (vacía)')
+    for e in lista:
+        uso = datetime.fromtimestamp(e['ultimo_uso']).strftime('%Y-%m-%d %H:%M')
+        print(f"  {e['clave'][:12]}…  {e.get('lector', '?'):<9}"
+              f"{e.get('filas', 0):>10,} filas  {e['bytes']/1024/1024:>8.1f} MB  "
+              f"usado {uso}")
+        if e.get('origen'):
+            print(f"      {e['origen']}")
+    total = sum(e['bytes'] for e in lista) / 1024 / 1024
+    print('-'*60)
+    print(f"  {len(lista)} entradas · {total:.1f} MB "
+          f"(máximo {ConfiguracionSeguridad.CACHE_MAX_MB} MB)")
+    print('='*60 + '\n')
+
+
+if __name__ == '__main__':
+    orden = sys.argv[1] if len(sys.argv) >= 2 else 'listar'
+    if orden == 'listar':
+        _mostrar_entradas()
+    elif orden == 'purgar':
+        prefijo = sys.argv[2] if len(sys.argv) >= 3 else ''
+        print(f'  🗑️  {purgar(prefijo)} entradas borradas')
+    elif orden == 'recortar' and len(sys.argv) >= 3:
+        print(f'  🗑️  {recortar(float(sys.argv[2]) * 1024 * 1024)} entradas borradas')
+    else:
+        print(__doc__)
@@ -0,0 +1,267 @@
+"""
+catalogo_palabras.py — Catálogo de palabras clave fuera del código
+ReaDesF1.9
+
+Agregar una marca de fertilizante ya no es editar validaciones_fiscales.py:
+las palabras viven en models/catalogo_palabras.json (versionado) y cada
+cliente puede ajustar las suyas en un JSON aparte.
+
+  catalogo_palabras.json          cliente.json (opcional)
+  {"version": 3,                  {"version": 1,
+   "categorias": {                 "agregar": {"insumo": ["nutrimax"]},
+     "insumo": {"Semillas": [..]}  "quitar":  {"dulce":  ["papas"]}}
+     "gasolina": [...], ...}}
+        └──────────────┬──────────────┘
+                       ↓ combinar → {categoría: palabras}
+                 huella = SHA-256 del contenido (+ versión del índice)
+                       ↓
+         ¿existe cache_lectura/indice_palabras_HUELLA.json?
+           sí → desde_bytes()              no → IndicePalabras(...) → .json
+
+  • Una categoría puede ser lista o {grupo: lista}; los grupos solo
+    ordenan el archivo (Fertilizantes, Semillas...), no cambian bits.
+  • El índice compilado (instantánea) se reusa entre corridas y entre
+    los procesos de clasificación en paralelo; guardado atómico. Es JSON,
+    no pickle: un archivo dañado o ajeno solo obliga a recompilar.
+  • CatalogoVivo.revisar(): durante una corrida mira los archivos cada
+    INTERVALO_REVISION segundos; si cambió la fecha pero no el
+    contenido (huella igual) no recompila nada.
+  • Ruta del JSON del cliente: ConfiguracionSeguridad.CATALOGO_CLIENTE.
+
+Línea de comandos (desde la raíz del proyecto):
+  python -m models.catalogo_palabras               → resumen
+  python -m models.catalogo_palabras compilar      → generar la instantánea
+  python -m models.catalogo_palabras compilar CLIENTE.json
+"""
+
+import os
+import sys
+import json
+import glob
+import time
+import hashlib
+
+from models.indice_palabras import IndicePalabras, VERSION_INDICE
+from seguridad import ConfiguracionSeguridad
+
+RUTA_CATALOGO = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             'catalogo_palabras.json')
+
+# Segundos mínimos entre dos revisiones de los archivos en una corrida
+INTERVALO_REVISION = 2.0
+
+_PREFIJO_INSTANTANEA = 'indice_palabras_'
+_EXT_INSTANTANEA     = '.json'
+_EXT_ANTERIORES      = ('.bin',)        # instantáneas pickle (VERSION_INDICE 1)
+
+
+# ══════════════════════════════════════════════════════════════════
+# LECTURA — base + ajustes del cliente
+# ══════════════════════════════════════════════════════════════════
+
+def _palabras(valor) -> set:
+    """Lista o {grupo: lista} → conjunto de palabras."""
+    if isinstance(valor, dict):
+        return {p for grupo in valor.values() for p in grupo}
+    return set(valor)
+
+
+def _leer_json(ruta: str) -> dict:
+    with open(ruta, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def leer_catalogo(ruta: str = RUTA_CATALOGO, cliente: str = None) -> tuple:
+    """
+    Retorna: ({categoría: set de palabras}, versión) con los ajustes del
+    cliente ya aplicados; versión = 'base' o 'base+cliente'.
+    """
+    base       = _leer_json(ruta)
+    categorias = {nombre: _palabras(v) for nombre, v in base['categorias'].items()}
+    version    = str(base.get('version', 0))
+    if cliente:
+        ajustes = _leer_json(cliente)
+        for nombre, palabras in ajustes.get('agregar', {}).items():
+            if nombre not in categorias:
+                raise ValueError(f'{cliente}: categoría desconocida "{nombre}"')
+            categorias[nombre] |= set(palabras)
+        for nombre, palabras in ajustes.get('quitar', {}).items():
+            if nombre not in categorias:
+                raise ValueError(f'{cliente}: categoría desconocida "{nombre}"')
+            categorias[nombre] -= set(palabras)
+        version += f"+{ajustes.get('version', 0)}"
+    return categorias, version
+
+
+def huella_categorias(categorias: dict) -> str:
+    """SHA-256 de {bit: palabras}: mismo contenido → misma instantánea."""
+    h = hashlib.sha256(f'i{VERSION_INDICE}'.encode())
+    for bit in sorted(categorias):
+        h.update(f'|{bit}:'.encode())
+        for palabra in sorted(categorias[bit]):
+            h.update(palabra.encode('utf-8') + b'\0')
+    return h.hexdigest()
+
+
+# ══════════════════════════════════════════════════════════════════
+# INSTANTÁNEA — índice compilado en disco
+# ══════════════════════════════════════════════════════════════════
+
+def ruta_instantanea(huella: str) -> str:
+    return os.path.join(ConfiguracionSeguridad.CACHE_DIRECTORY,
+                        f'{_PREFIJO_INSTANTANEA}{huella[:16]}{_EXT_INSTANTANEA}')
+
+
+def _cargar_instantanea(ruta: str):
+    try:
+        with open(ruta, 'rb') as f:
+            return IndicePalabras.desde_bytes(f.read())
+    except (OSError, ValueError):
+        return None     # no existe, vacía, dañada o de otra versión → compilar
+
+
+def _guardar_instantanea(indice: IndicePalabras, ruta: str) -> None:
+    """Atómico (.tmp → rename); borra las instantáneas de otros catálogos."""
+    try:
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        tmp = ruta + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(indice.a_bytes())
+        os.replace(tmp, ruta)
+        for ext in (_EXT_INSTANTANEA,) + _EXT_ANTERIORES:
+            patron = os.path.join(os.path.dirname(ruta), f'{_PREFIJO_INSTANTANEA}*{ext}')
+            for vieja in glob.glob(patron):
+                if vieja != ruta:
+                    os.remove(vieja)
+    except OSError:
+        pass            # sin carpeta de caché: se recompila en cada corrida
+
+
+def compilar(categorias: dict) -> tuple:
+    """{bit: palabras} → (IndicePalabras, huella, ¿se compiló ahora?)."""
+    huella = huella_categorias(categorias)
+    ruta   = ruta_instantanea(huella)
+    indice = _cargar_instantanea(ruta)
+    if indice is not None:
+        return indice, huella, False
+    indice = IndicePalabras(categorias)
+    _guardar_instantanea(indice, ruta)
+    return indice, huella, True
+
+
+# ══════════════════════════════════════════════════════════════════
+# CATÁLOGO VIVO — recarga durante la corrida
+# ══════════════════════════════════════════════════════════════════
+
+class CatalogoVivo:
+    """
+    bits:   {categoría del JSON: bit}, p. ej. {'gasolina': 1, ...}
+    fijas:  {bit: palabras} que no vienen del archivo ({16: {'|'}})
+    Expone .indice, .categorias ({bit: palabras}), .huella y .version.
+    """
+
+    def __init__(self, bits: dict, fijas: dict = None, cliente: str = None,
+                 ruta: str = RUTA_CATALOGO):
+        self.bits     = bits
+        self.fijas    = fijas or {}
+        self.cliente  = cliente or None
+        self.ruta     = ruta
+        self.indice   = None
+        self.categorias = {}
+        self.huella   = None
+        self.version  = None
+        self._estado  = None            # (mtime, tamaño) de los archivos
+        self._proxima = 0.0
+
+    def _archivos(self) -> tuple:
+        return (self.ruta, self.cliente) if self.cliente else (self.ruta,)
+
+    def _estado_archivos(self) -> tuple:
+        estado = []
+        for ruta in self._archivos():
+            try:
+                st = os.stat(ruta)
+                estado.append((st.st_mtime_ns, st.st_size))
+            except OSError:
+                estado.append(None)
+        return tuple(estado)
+
+    def _cargar(self) -> bool:
+        """Lee los archivos; recompila solo si la huella cambió."""
+        nombres, version = leer_catalogo(self.ruta, self.cliente)
+        desconocidas = set(nombres) - set(self.bits)
+        if desconocidas:
+            raise ValueError(f'{self.ruta}: categorías desconocidas {sorted(desconocidas)}')
+        categorias = dict(self.fijas)
+        for nombre, bit in self.bits.items():
+            categorias[bit] = categorias.get(bit, set()) | nombres.get(nombre, set())
+        if huella_categorias(categorias) == self.huella:
+            return False
+        self.indice, self.huella, _ = compilar(categorias)
+        self.categorias = categorias
+        self.version    = version
+        return True
+
+    def revisar(self) -> bool:
+        """
+        True solo si el índice cambió (no en la primera carga).
+        Un archivo a medio guardar o con errores deja el índice anterior.
+        """
+        if self.indice is None:
+            self._estado = self._estado_archivos()
+            self._cargar()
+            self._proxima = time.monotonic() + INTERVALO_REVISION
+            return False
+        ahora = time.monotonic()
+        if ahora < self._proxima:
+            return False
+        self._proxima = ahora + INTERVALO_REVISION
+        estado = self._estado_archivos()
+        if estado == self._estado:
+            return False
+        try:
+            cambio = self._cargar()
+        except (OSError, ValueError) as e:
+            print(f"  ⚠️  Catálogo de palabras sin recargar: {e}")
+            return False
+        self._estado = estado
+        if cambio:
+            print(f"  🔄 Catálogo de palabras recargado (v{self.version})")
+        return cambio
+
+
+# ══════════════════════════════════════════════════════════════════
+# LÍNEA DE COMANDOS
+# ══════════════════════════════════════════════════════════════════
+
+def _main(args: list) -> None:
+    from models.validaciones_fiscales import CATEGORIAS_ARCHIVO, CATEGORIAS_FIJAS
+    cliente = (args[1] if len(args) > 1 and args[0] == 'compilar'
+               else ConfiguracionSeguridad.CATALOGO_CLIENTE)
+    nombres, version = leer_catalogo(RUTA_CATALOGO, cliente)
+    categorias = dict(CATEGORIAS_FIJAS)
+    for nombre, bit in CATEGORIAS_ARCHIVO.items():
+        categorias[bit] = categorias.get(bit, set()) | nombres.get(nombre, set())
+
+    if args and args[0] == 'compilar':
+        t0 = time.perf_counter()
+        _, huella, nueva = compilar(categorias)
+        estado = 'compilada' if nueva else 'ya existía'
+        print(f"✅ Instantánea {estado} en {time.perf_counter() - t0:.3f}s: "
+              f"{ruta_instantanea(huella)}")
+        return
+
+    huella = huella_categorias(categorias)
+    ruta   = ruta_instantanea(huella)
+    print(f"📖 Catálogo v{version}: {RUTA_CATALOGO}")
+    if cliente:
+        print(f"   Ajustes del cliente: {cliente}")
+    for nombre, palabras in sorted(nombres.items()):
+        print(f"   {nombre:<10} {len(palabras):>4} palabras")
+    print(f"   Huella: {huella[:16]}")
+    print(f"   Instantánea: {ruta} "
+          f"({'lista' if os.path.exists(ruta) else 'pendiente — usar compilar'})")
+
+
+if __name__ == '__main__':
+    _main(sys.argv[1:])
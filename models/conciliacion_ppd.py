@@ -0,0 +1,178 @@
+"""
+conciliacion_ppd.py — Cruce CP01 ↔ PPD por índices hash
+ReaDesF1.9
+
+Paso 3 marca PENDIENTE cada PPD sin complemento de pago (CP01). Antes
+cada CP01 recorría TODOS los PPD (O(CP01 × PPD)): un mes con miles de
+complementos tardaba minutos. Ahora los PPD se indexan UNA vez y cada
+CP01 es una consulta:
+
+  PPD ──→ ppds       {uuid completo: PPD}
+      ──→ por_sufijo {últimos 12 hex: [PPD, ...]}
+      ──→ por_monto  {(RFC, total en centavos): [PPD, ...]}
+      ──→ por_rfc    {RFC: [PPD, ...]}
+
+  CP01 con uuid_rel ──→ Nivel 1: uuid completo, si no, sufijo de 12
+  CP01 sin uuid_rel ──→ Nivel 2: RFC + total idéntico
+                    ──→ Nivel 3: parcialidades — los CP01 de un RFC que
+                        no cuadraron suman EXACTO el total de un PPD
+                        (un solo PPD libre que solo alcanza a cubrirlos
+                        queda PENDIENTE y se reporta en .ambiguos)
+
+  • Un CP01 puede pagar varios PPD (Pagos 2.0) y un PPD puede tener
+    varios CP01 (parcialidades).
+  • Nivel 2 prefiere un PPD aún sin cubrir: dos CP01 del mismo RFC y
+    monto cubren dos PPD, no el mismo dos veces. Si quedan VARIOS sin
+    cubrir, ninguno se marca: el CP01 va a .ambiguos.
+  • Un CP01 nunca se cruza consigo mismo (ni por uuid ni por monto).
+  • Lo que no tiene una sola respuesta va en .ambiguos con sus
+    candidatos, en vez de elegirse en silencio.
+
+Entrada ya extraída por el generador de reporte (sin filas de Excel):
+  ppds:         [(uuid, rfc, total), ...]
+  complementos: [(uuid, rfc, total, [uuids relacionados]), ...]
+"""
+
+import re
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+# Sufijo que muestra el reporte y que basta para identificar un PPD
+LARGO_SUFIJO = 12
+
+_RE_SEPARADORES = re.compile(r'[-\s]')
+
+
+def norm_uuid(u) -> str:
+    return _RE_SEPARADORES.sub('', str(u or '')).lower()
+
+
+def _centavos(total) -> int:
+    try:
+        return int(round(round(float(total or 0), 2) * 100))
+    except (TypeError, ValueError):
+        return 0
+
+
+@dataclass
+class ResultadoConciliacion:
+    pendientes:    set  = field(default_factory=set)    # uuid original de PPD sin CP01
+    cp01_a_ppd:    dict = field(default_factory=dict)   # uuid_norm(CP01) → uuid original del PPD
+    parcialidades: dict = field(default_factory=dict)   # uuid PPD → [uuid CP01, ...] (≥ 2)
+    ambiguos:      list = field(default_factory=list)   # (uuid CP01, nivel, motivo, [uuid PPD])
+
+
+class ConciliadorPPD:
+    """Índices de los PPD del mes; conciliar() hace una pasada por los CP01."""
+
+    def __init__(self, ppds):
+        self.ppds       = {}                   # uuid_norm → (uuid, rfc, centavos)
+        for uuid, rfc, total in ppds:
+            if uuid:
+                self.ppds[norm_uuid(uuid)] = (uuid, str(rfc or '').strip().upper(),
+                                              _centavos(total))
+        self.por_sufijo = defaultdict(list)
+        self.por_monto  = defaultdict(list)
+        self.por_rfc    = defaultdict(list)
+        for n, (_, rfc, cent) in self.ppds.items():
+            if len(n) >= LARGO_SUFIJO:
+                self.por_sufijo[n[-LARGO_SUFIJO:]].append(n)
+            self.por_monto[(rfc, cent)].append(n)
+            self.por_rfc[rfc].append(n)
+
+    # ── Nivel 1 ─────────────────────────────────────────────────
+    def _por_referencia(self, rel_n: str, cp_n: str) -> tuple:
+        """(candidatos, ¿ambiguo?) para un UUID o sufijo relacionado; nunca el propio CP01."""
+        if rel_n in self.ppds and rel_n != cp_n:
+            return [rel_n], False
+        if len(rel_n) < LARGO_SUFIJO:
+            return [], False
+        candidatos = [n for n in self.por_sufijo.get(rel_n[-LARGO_SUFIJO:], ()) if n != cp_n]
+        return candidatos, len(candidatos) > 1
+
+    def conciliar(self, complementos) -> ResultadoConciliacion:
+        r         = ResultadoConciliacion()
+        cubiertos = set()
+        pagos     = defaultdict(list)          # uuid_norm PPD → [uuid CP01]
+        sin_rel   = []
+        vistos    = set()
+
+        for uuid, rfc, total, relacionados in complementos:
+            cp_n = norm_uuid(uuid)
+            if cp_n in vistos:                 # el mismo CP01 repetido en el archivo
+                continue
+            vistos.add(cp_n)
+            if not relacionados:
+                sin_rel.append((uuid, cp_n, str(rfc or '').strip().upper(),
+                                _centavos(total)))
+                continue
+            for rel in relacionados:
+                candidatos, ambiguo = self._por_referencia(norm_uuid(rel), cp_n)
+                if ambiguo:
+                    # mismo sufijo en varios PPD: se cubren todos (no se
+                    # marca PENDIENTE algo pagado) pero se reporta
+                    r.ambiguos.append((uuid, 1, 'sufijo repetido',
+                                       [self.ppds[n][0] for n in candidatos]))
+                for n in candidatos:
+                    cubiertos.add(n)
+                    if uuid not in pagos[n]:     # mismo UUID citado dos veces
+                        pagos[n].append(uuid)
+                if candidatos:
+                    r.cp01_a_ppd.setdefault(cp_n, self.ppds[candidatos[0]][0])
+
+        # ── Nivel 2: RFC + total idéntico ───────────────────────────
+        restantes = defaultdict(list)          # RFC → CP01 sin PPD de su monto
+        for uuid, cp_n, rfc, cent in sin_rel:
+            if not rfc:
+                continue
+            candidatos = [n for n in self.por_monto.get((rfc, cent), ()) if n != cp_n]
+            if not candidatos:
+                restantes[rfc].append((uuid, cp_n, cent))
+                continue
+            libres = [n for n in candidatos if n not in cubiertos]
+            if len(libres) > 1:
+                # no se elige uno en silencio: los PPD siguen PENDIENTES
+                r.ambiguos.append((uuid, 2, 'varios PPD con el mismo RFC y total',
+                                   [self.ppds[n][0] for n in libres]))
+                continue
+            if not libres:
+                r.ambiguos.append((uuid, 2, 'el PPD de ese RFC y total ya estaba cubierto',
+                                   [self.ppds[candidatos[0]][0]]))
+            n = libres[0] if libres else candidatos[0]
+            cubiertos.add(n)
+            pagos[n].append(uuid)
+            r.cp01_a_ppd[cp_n] = self.ppds[n][0]
+
+        # ── Nivel 3: parcialidades ──────────────────────────────────
+        for rfc, cps in restantes.items():
+            libres = [n for n in self.por_rfc.get(rfc, ()) if n not in cubiertos]
+            if not libres:
+                continue
+            suma   = sum(cent for _, _, cent in cps)
+            exacto = [n for n in libres if self.ppds[n][2] == suma]
+            if len(exacto) == 1:
+                n = exacto[0]
+            elif len(exacto) > 1:
+                uuids = [self.ppds[m][0] for m in exacto]
+                for uuid, _, _ in cps:
+                    r.ambiguos.append((uuid, 3, 'varios PPD suman lo mismo que sus parcialidades', uuids))
+                continue
+            elif len(libres) == 1 and self.ppds[libres[0]][2] > suma:
+                # ¿pago parcial? sin suma exacta no se da por cubierto
+                for uuid, _, _ in cps:
+                    r.ambiguos.append((uuid, 3, 'pago parcial sin suma exacta', [self.ppds[libres[0]][0]]))
+                continue
+            else:
+                continue                       # sin cruce: no es ambigüedad
+            cubiertos.add(n)
+            for uuid, cp_n, _ in cps:
+                pagos[n].append(uuid)
+                r.cp01_a_ppd[cp_n] = self.ppds[n][0]
+
+        r.pendientes    = {self.ppds[n][0] for n in self.ppds if n not in cubiertos}
+        r.parcialidades = {self.ppds[n][0]: cps for n, cps in pagos.items() if len(cps) > 1}
+        return r
+
+
+def conciliar_ppd(ppds, complementos) -> ResultadoConciliacion:
+    return ConciliadorPPD(ppds).conciliar(complementos)
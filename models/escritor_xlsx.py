@@ -0,0 +1,442 @@
+"""
+escritor_xlsx.py — Escritor XLSX en streaming (una sola pasada)
+ReaDesF1.9
+
+Reemplaza el ciclo de v1.8:
+
+  to_excel() → load_workbook() → estilos celda por celda → wb.save()
+             → _parchear_cache_formulas() (unzip + regex + re-zip)
+
+por UNA sola serialización: cada fila se convierte a XML y se
+escribe directo al ZIP del .xlsx. En cada celda va:
+
+  • valor         → <v>1234.5</v> / texto inline <is><t>..</t></is>
+  • fórmula viva  → <f>J2-K2</f><v>1234.5</v>   (CeldaFormula: el valor
+                    cacheado se escribe al crear la celda, sin parche)
+  • estilo        → s="N" (índice en styles.xml, registrado al vuelo)
+
+La RAM queda acotada por el buffer de filas, no por el archivo.
+styles.xml y el resto del paquete se escriben al cerrar.
+
+MODO POR BLOQUES (dir_bloques) — append-only con punto de control:
+
+  bloque 1 ──→ partes/bloque_00001.xml ─┐
+  bloque 2 ──→ partes/bloque_00002.xml ─┼─ cerrar() → ensambla el .xlsx
+  bloque N ──→ partes/bloque_0000N.xml ─┘             y borra partes/
+
+  Cada bloque terminado se escribe UNA vez (tmp + rename, fsync) y no se
+  vuelve a tocar. Si el proceso se interrumpe, los fragmentos completos
+  quedan en disco y una corrida posterior continúa desde ahí
+  (bloques_previos / filas_previas).
+"""
+
+import math
+import os
+import re
+import shutil
+import zipfile
+from datetime import datetime, date, time as dtime
+from xml.sax.saxutils import escape
+
+_EPOCA = datetime(1899, 12, 30)
+
+# Caracteres de control no permitidos en XML 1.0
+_RE_ILEGAL = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+# numFmtId integrados de Excel
+_FORMATOS_INTEGRADOS = {'General': 0, '0': 1, '0.00': 2, '#,##0': 3, '#,##0.00': 4}
+
+FORMATO_FECHA = 'yyyy-mm-dd h:mm:ss'
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '</Types>'
+)
+
+_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+    '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+    '</Relationships>'
+)
+
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{titulo}" sheetId="1" r:id="rId1"/></sheets>'
+    '<calcPr calcId="124519" fullCalcOnLoad="0"/>'
+    '</workbook>'
+)
+
+_SHEET_INICIO = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+)
+
+
+def letra_columna(n: int) -> str:
+    """1 → 'A', 27 → 'AA'"""
+    s = ''
+    while n > 0:
+        n, r = divmod(n - 1, 26)
+        s = chr(65 + r) + s
+    return s
+
+
+def _serial_excel(v) -> float:
+    if isinstance(v, datetime):
+        if v.tzinfo is not None:
+            v = v.replace(tzinfo=None)
+        d = v - _EPOCA
+    elif isinstance(v, date):
+        d = datetime(v.year, v.month, v.day) - _EPOCA
+    else:
+        return (v.hour * 3600 + v.minute * 60 + v.second) / 86400
+    return d.days + d.seconds / 86400 + d.microseconds / 86400e6
+
+
+def _numero(v) -> str:
+    if isinstance(v, float) and v.is_integer() and abs(v) < 1e15:
+        return str(int(v))
+    return repr(float(v)) if not isinstance(v, int) else str(v)
+
+
+def valor_releido(v):
+    """
+    El valor tal como vuelve al leer con openpyxl la celda que escribe
+    EscritorXlsx (sin estilos): 5.0 → 5, NaN → None, Timestamp → datetime,
+    texto sin caracteres ilegales. Permite pasar los datos en memoria
+    sin que cambie nada respecto a releer el archivo.
+    """
+    if v is None or isinstance(v, (bool, int)):
+        return v
+    if isinstance(v, str):
+        return _RE_ILEGAL.sub('', v)
+    if isinstance(v, (datetime, date, dtime)):
+        if v != v:   # NaT
+            return None
+        if isinstance(v, datetime):
+            v = v.replace(tzinfo=None)
+            return v.to_pydatetime() if hasattr(v, 'to_pydatetime') else v
+        return v if isinstance(v, dtime) else datetime(v.year, v.month, v.day)
+    try:
+        f = float(v)
+    except (TypeError, ValueError):
+        return _RE_ILEGAL.sub('', str(v))
+    if math.isnan(f) or math.isinf(f):
+        return None
+    if f.is_integer() and abs(f) < 1e15:
+        return int(f)
+    return f
+
+
+class CeldaFormula:
+    """
+    Celda con fórmula viva + valor cacheado.
+
+    Se coloca directamente en la lista de valores de escribir_fila():
+        CeldaFormula('J2-K2', 1234.5)  →  <f>J2-K2</f><v>1234.5</v>
+
+    Excel muestra la operación al pararse en la celda; openpyxl
+    (data_only) y pandas leen el valor sin recalcular.
+    """
+
+    __slots__ = ('formula', 'valor')
+
+    def __init__(self, formula: str, valor=None):
+        self.formula = formula.lstrip('=')
+        self.valor   = valor
+
+    def __repr__(self):
+        return f'CeldaFormula({self.formula!r}, {self.valor!r})'
+
+
+class EscritorXlsx:
+    """
+    Escribe un .xlsx de UNA hoja fila por fila.
+
+    Uso:
+        with EscritorXlsx(ruta, anchos={3: 65}) as w:
+            st = w.estilo(relleno='00B0F0', negrita=True)
+            w.escribir_fila(['UUID', 'Total'], estilos={1: st})
+            w.escribir_fila(['ABC', 10.5, CeldaFormula('B2*2', 21.0)])
+    """
+
+    def __init__(self, output_path: str, titulo: str = 'Sheet1',
+                 anchos: dict = None, filas_buffer: int = 500,
+                 dir_bloques: str = None, bloques_previos: list = None,
+                 filas_previas: int = 0):
+        self.output_path  = output_path
+        self.titulo       = titulo
+        self.filas_buffer = filas_buffer
+        self.fila_actual  = filas_previas
+        self.dir_bloques  = dir_bloques
+        self.bloques      = list(bloques_previos or [])
+
+        self._letras  = ['']
+        self._buffer  = []
+        self._fills   = ['<fill><patternFill patternType="none"/></fill>',
+                         '<fill><patternFill patternType="gray125"/></fill>']
+        self._fonts   = ['<font><sz val="11"/><name val="Calibri"/></font>']
+        self._numfmts = {}
+        self._xfs     = [(0, 0, 0, False)]
+        self._idx_fill, self._idx_font = {}, {}
+        self._idx_xf  = {self._xfs[0]: 0}
+        self.estilo_fecha = self.estilo(formato=FORMATO_FECHA)
+
+        cols = ''
+        if anchos:
+            cols = '<cols>' + ''.join(
+                '<col min="%d" max="%d" width="%s" customWidth="1"/>' % (c, c, w)
+                for c, w in sorted(anchos.items())) + '</cols>'
+        self._inicio_hoja = (_SHEET_INICIO + cols + '<sheetData>').encode('utf-8')
+
+        if dir_bloques:
+            # Fragmentos: el ZIP se arma hasta cerrar()
+            os.makedirs(dir_bloques, exist_ok=True)
+            self._zip   = None
+            self._sheet = None
+            self._abrir_fragmento()
+        else:
+            self._zip   = zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED)
+            self._sheet = self._zip.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True)
+            self._sheet.write(self._inicio_hoja)
+
+    # ── Estilos ─────────────────────────────────────────────────
+    def estilo(self, relleno: str = None, negrita: bool = False,
+               color_fuente: str = None, centrado: bool = False,
+               formato: str = None) -> int:
+        """Registra (o reutiliza) un estilo y retorna su índice s=."""
+        fill_id = 0
+        if relleno:
+            fill_id = self._idx_fill.get(relleno)
+            if fill_id is None:
+                fill_id = len(self._fills)
+                self._fills.append(
+                    '<fill><patternFill patternType="solid">'
+                    '<fgColor rgb="FF%s"/><bgColor rgb="FF%s"/>'
+                    '</patternFill></fill>' % (relleno, relleno))
+                self._idx_fill[relleno] = fill_id
+
+        font_id = 0
+        if negrita or color_fuente:
+            clave = (negrita, color_fuente)
+            font_id = self._idx_font.get(clave)
+            if font_id is None:
+                font_id = len(self._fonts)
+                self._fonts.append(
+                    '<font>%s%s<sz val="11"/><name val="Calibri"/></font>' % (
+                        '<b/>' if negrita else '',
+                        '<color rgb="FF%s"/>' % color_fuente if color_fuente else ''))
+                self._idx_font[clave] = font_id
+
+        fmt_id = 0
+        if formato:
+            fmt_id = _FORMATOS_INTEGRADOS.get(formato)
+            if fmt_id is None:
+                fmt_id = self._numfmts.setdefault(formato, 164 + len(self._numfmts))
+
+        xf = (fmt_id, font_id, fill_id, centrado)
+        idx = self._idx_xf.get(xf)
+        if idx is None:
+            idx = len(self._xfs)
+            self._xfs.append(xf)
+            self._idx_xf[xf] = idx
+        return idx
+
+    def _styles_xml(self) -> str:
+        numfmts = ''
+        if self._numfmts:
+            numfmts = '<numFmts count="%d">%s</numFmts>' % (
+                len(self._numfmts), ''.join(
+                    '<numFmt numFmtId="%d" formatCode="%s"/>' % (i, escape(f, {'"': '&quot;'}))
+                    for f, i in self._numfmts.items()))
+        xfs = []
+        for fmt_id, font_id, fill_id, centrado in self._xfs:
+            attrs = 'numFmtId="%d" fontId="%d" fillId="%d" borderId="0" xfId="0"' % (
+                fmt_id, font_id, fill_id)
+            if fmt_id:   attrs += ' applyNumberFormat="1"'
+            if font_id:  attrs += ' applyFont="1"'
+            if fill_id:  attrs += ' applyFill="1"'
+            if centrado:
+                xfs.append('<xf %s applyAlignment="1"><alignment horizontal="center"/></xf>' % attrs)
+            else:
+                xfs.append('<xf %s/>' % attrs)
+        return (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+            + numfmts +
+            '<fonts count="%d">%s</fonts>' % (len(self._fonts), ''.join(self._fonts)) +
+            '<fills count="%d">%s</fills>' % (len(self._fills), ''.join(self._fills)) +
+            '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+            '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+            '<cellXfs count="%d">%s</cellXfs>' % (len(xfs), ''.join(xfs)) +
+            '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+            '</styleSheet>'
+        )
+
+    # ── Celdas y filas ──────────────────────────────────────────
+    def _letra(self, col: int) -> str:
+        while len(self._letras) <= col:
+            self._letras.append(letra_columna(len(self._letras)))
+        return self._letras[col]
+
+    def _celda(self, ref: str, v, s: int) -> str:
+        sa = ' s="%d"' % s if s else ''
+        if v is None:
+            return '<c r="%s"%s/>' % (ref, sa) if s else ''
+        if isinstance(v, CeldaFormula):
+            cache = v.valor
+            if cache is None or (isinstance(cache, float) and math.isnan(cache)):
+                return '<c r="%s"%s><f>%s</f></c>' % (ref, sa, escape(v.formula))
+            return '<c r="%s"%s><f>%s</f><v>%s</v></c>' % (
+                ref, sa, escape(v.formula), _numero(cache))
+        if isinstance(v, bool):
+            return '<c r="%s"%s t="b"><v>%d</v></c>' % (ref, sa, v)
+        if isinstance(v, str):
+            txt = _RE_ILEGAL.sub('', v)
+            esp = ' xml:space="preserve"' if txt[:1].isspace() or txt[-1:].isspace() else ''
+            return '<c r="%s"%s t="inlineStr"><is><t%s>%s</t></is></c>' % (
+                ref, sa, esp, escape(txt))
+        if isinstance(v, (datetime, date, dtime)):
+            if v != v:   # NaT
+                return '<c r="%s"%s/>' % (ref, sa) if s else ''
+            sa = ' s="%d"' % (s or self.estilo_fecha)
+            return '<c r="%s"%s><v>%s</v></c>' % (ref, sa, repr(_serial_excel(v)))
+        try:
+            f = float(v)
+        except (TypeError, ValueError):
+            return self._celda(ref, str(v), s)
+        if math.isnan(f) or math.isinf(f):
+            return '<c r="%s"%s/>' % (ref, sa) if s else ''
+        return '<c r="%s"%s><v>%s</v></c>' % (ref, sa, _numero(v if isinstance(v, int) else f))
+
+    def escribir_fila(self, valores, estilos: dict = None):
+        """
+        valores = lista de valores (col 1 = valores[0]); una CeldaFormula
+                  se escribe como fórmula viva con su valor cacheado
+        estilos = {col: indice_estilo}
+        """
+        self.fila_actual += 1
+        rn = self.fila_actual
+        estilos = estilos or {}
+        letra   = self._letra
+        partes  = ['<row r="%d">' % rn]
+        sufijo  = str(rn)
+        n = len(valores)
+        if estilos:
+            n = max(n, max(estilos))
+        for col in range(1, n + 1):
+            v = valores[col - 1] if col <= len(valores) else None
+            partes.append(self._celda(letra(col) + sufijo, v, estilos.get(col, 0)))
+        partes.append('</row>')
+        self._buffer.append(''.join(partes))
+        if len(self._buffer) >= self.filas_buffer:
+            self._vaciar()
+
+    def escribir_xml_fila(self, xml: str):
+        """
+        Fila ya serializada ('<row r="N">...</row>', con N = fila_actual + 1).
+        La usa la re-validación incremental para copiar filas sin cambios.
+        """
+        self.fila_actual += 1
+        self._buffer.append(xml)
+        if len(self._buffer) >= self.filas_buffer:
+            self._vaciar()
+
+    def _vaciar(self):
+        if self._buffer:
+            self._sheet.write(''.join(self._buffer).encode('utf-8'))
+            self._buffer = []
+
+    # ── Modo por bloques ────────────────────────────────────────
+    def _nombre_fragmento(self) -> str:
+        return 'bloque_%05d.xml' % len(self.bloques)
+
+    def _abrir_fragmento(self):
+        self._tmp   = os.path.join(self.dir_bloques, self._nombre_fragmento() + '.tmp')
+        self._sheet = open(self._tmp, 'wb')
+
+    def cerrar_bloque(self) -> str:
+        """
+        Fija en disco las filas escritas desde el bloque anterior.
+        Retorna el nombre del fragmento (ya completo y durable).
+        """
+        if not self.dir_bloques:
+            raise RuntimeError('cerrar_bloque() requiere dir_bloques')
+        self._vaciar()
+        self._sheet.flush()
+        os.fsync(self._sheet.fileno())
+        self._sheet.close()
+        nombre = self._nombre_fragmento()
+        os.replace(self._tmp, os.path.join(self.dir_bloques, nombre))
+        self.bloques.append(nombre)
+        self._abrir_fragmento()
+        return nombre
+
+    def _ensamblar(self):
+        """Une los fragmentos, en orden, en el ZIP final."""
+        if self._buffer:
+            self.cerrar_bloque()
+        self._sheet.close()
+        os.remove(self._tmp)
+        self._zip = zipfile.ZipFile(self.output_path, 'w', zipfile.ZIP_DEFLATED)
+        with self._zip.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as hoja:
+            hoja.write(self._inicio_hoja)
+            for nombre in self.bloques:
+                with open(os.path.join(self.dir_bloques, nombre), 'rb') as frag:
+                    shutil.copyfileobj(frag, hoja, 1 << 20)
+            hoja.write(b'</sheetData></worksheet>')
+
+    def cerrar(self):
+        if self.dir_bloques:
+            if self._sheet is None:
+                return
+            self._ensamblar()
+            self._sheet = None
+        elif self._zip is None:
+            return
+        else:
+            self._vaciar()
+            self._sheet.write(b'</sheetData></worksheet>')
+            self._sheet.close()
+        z = self._zip
+        z.writestr('[Content_Types].xml', _CONTENT_TYPES)
+        z.writestr('_rels/.rels', _RELS)
+        z.writestr('xl/workbook.xml', _WORKBOOK.format(titulo=escape(self.titulo)))
+        z.writestr('xl/_rels/workbook.xml.rels', _WORKBOOK_RELS)
+        z.writestr('xl/styles.xml', self._styles_xml())
+        z.close()
+        self._zip = None
+
+    def descartar(self):
+        """Cierra sin ensamblar: conserva los fragmentos completos en disco."""
+        if self.dir_bloques and self._sheet is not None:
+            self._sheet.close()
+            os.remove(self._tmp)
+            self._sheet = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo, *exc):
+        if tipo is not None and self.dir_bloques:
+            self.descartar()
+        else:
+            self.cerrar()
+        return False
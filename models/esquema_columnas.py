@@ -0,0 +1,122 @@
+"""
+esquema_columnas.py — Resolución de encabezados compartida
+ReaDesF1.9
+
+Un solo lugar para "¿en qué columna está X?", usado por los motores
+(pandas, chunks, openpyxl), salida_validado y leer_validado (Paso 3).
+
+  encabezados del archivo ──→ compilar_esquema() ──→ Esquema
+  ('Folio Fiscal', 'Razón    (caché por firma:       .indice('UUID') → 0
+   Emisor', ...)               mismos encabezados    .columna('Razon emisor')
+                               → mismo objeto)          → 'Razón Emisor'
+
+Normalización (una vez por encabezado, no por búsqueda):
+  • sin acentos:     'Razón' → 'razon'
+  • minúsculas y espacios colapsados: '  Uso   CFDI ' → 'uso cfdi'
+
+Alias: nombres que distintos exportadores usan para la MISMA columna
+('folio fiscal', 'uuid', 'id cfdi', ...). Solo coincidencia exacta
+(normalizada) o por alias: nada de subcadenas, que confundían
+'IEPS Trasladado 3%' con 'IEPS Trasladado'.
+"""
+
+import re
+import unicodedata
+from functools import lru_cache
+
+_RE_ESPACIOS = re.compile(r'\s+')
+
+# Cada grupo = una columna; el primer nombre es el canónico
+GRUPOS_ALIAS = (
+    ('uuid', 'folio fiscal', 'id cfdi', 'uuid cfdi'),
+    ('uuids relacionados', 'uuid relacionado', 'folio fiscal relacionado',
+     'cfdi relacionados'),
+    ('fecha emision', 'fecha de emision'),
+    ('fecha certificacion', 'fecha de certificacion', 'fecha timbrado'),
+    ('rfc emisor', 'rfc del emisor'),
+    ('razon emisor', 'nombre emisor', 'razon social emisor'),
+    ('razon receptor', 'nombre receptor', 'razon social receptor'),
+    ('regimen receptor', 'regimen fiscal receptor'),
+    ('uso cfdi', 'uso de cfdi', 'uso del cfdi'),
+    ('metodo pago', 'metodo de pago'),
+    ('forma pago', 'forma de pago'),
+    ('conceptos', 'concepto', 'descripcion'),
+    ('subtotal', 'sub total'),
+    ('iva trasladado 16%', 'iva 16%'),
+    ('iva trasladado 0%', 'iva 0%'),
+    ('comentarios', 'comentario', 'observaciones'),
+    ('sub1-16%', 'sub1'),
+    ('sub0%', 'sub0'),
+    ('sub2-16%', 'sub2'),
+)
+
+
+def normalizar_encabezado(nombre) -> str:
+    """'  Razón   Emisor ' → 'razon emisor'"""
+    if nombre is None:
+        return ''
+    txt = unicodedata.normalize('NFKD', str(nombre))
+    txt = ''.join(ch for ch in txt if not unicodedata.combining(ch))
+    return _RE_ESPACIOS.sub(' ', txt).strip().lower()
+
+
+_GRUPO = {}
+for _grupo in GRUPOS_ALIAS:
+    for _alias in _grupo:
+        _GRUPO[_alias] = _grupo
+
+
+class Esquema:
+    """
+    Mapa compilado nombre → índice (0-based) para UNA fila de encabezados.
+    Inmutable: lo comparten todos los bloques con la misma firma.
+    """
+
+    __slots__ = ('encabezados', '_indices', '_resueltos')
+
+    def __init__(self, encabezados: tuple):
+        self.encabezados = encabezados
+        indices = {}
+        for i, h in enumerate(encabezados):
+            n = normalizar_encabezado(h)
+            if n and n not in indices:   # duplicados: gana el primero
+                indices[n] = i
+        self._indices   = indices
+        self._resueltos = {}
+
+    def _buscar(self, nombre: str):
+        n = normalizar_encabezado(nombre)
+        if n in self._indices:
+            return self._indices[n]
+        for alias in _GRUPO.get(n, ()):
+            if alias in self._indices:
+                return self._indices[alias]
+        return None
+
+    def indice(self, *nombres):
+        """Índice (0-based) del primer nombre encontrado, o None."""
+        for nombre in nombres:
+            if nombre not in self._resueltos:
+                self._resueltos[nombre] = self._buscar(nombre)
+            i = self._resueltos[nombre]
+            if i is not None:
+                return i
+        return None
+
+    def columna(self, *nombres):
+        """Encabezado original del primer nombre encontrado, o None."""
+        i = self.indice(*nombres)
+        return self.encabezados[i] if i is not None else None
+
+    def faltantes(self, nombres) -> list:
+        return [n for n in nombres if self.indice(n) is None]
+
+
+@lru_cache(maxsize=64)
+def _compilar(encabezados: tuple) -> Esquema:
+    return Esquema(encabezados)
+
+
+def compilar_esquema(encabezados) -> Esquema:
+    """Esquema para esos encabezados (cacheado por firma)."""
+    return _compilar(tuple(encabezados))
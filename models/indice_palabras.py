@@ -0,0 +1,175 @@
+"""
+indice_palabras.py — Índice de palabras clave por token (multi-categoría)
+ReaDesF1.9
+
+Reemplaza al autómata por subcadena: 'gas' encontraba 'organización',
+'pan' encontraba 'panel', 'att' encontraba 'attachment'... y esas filas
+caían en las reglas de gasolina / insumo con la deducibilidad equivocada.
+
+Ahora cada concepto se parte en palabras UNA vez y cada palabra se
+busca completa:
+
+  'Gasolina Magna | Diésel'
+       │ minúsculas + sin acentos + separar en [a-z0-9]+
+       ↓
+  ['gasolina', 'magna', 'diesel']
+       │
+       ├─ palabra suelta → conjunto hash   {'gasolina': GAS, 'pan': DULCE, ...}
+       └─ frase          → trie de palabras {'jet': {'fuel': GAS}, ...}
+       ↓
+  bits = GASOLINA (+ AGRUPADO por el '|')
+
+  • Costo por concepto = número de palabras, sin importar cuántas
+    haya en las listas.
+  • Plural simple: el índice guarda cada palabra también con -s y -es
+    ('fertilizantes', 'gases'); buscar es solo consultar el hash.
+  • Sin acentos de ambos lados: 'diésel' = 'diesel', 'caña' = 'cana'.
+  • Palabras clave sin letras ni dígitos ('|') se buscan como símbolo.
+
+Dos entradas:
+  • buscar(texto)         → int   (un concepto; motor openpyxl)
+  • buscar_serie(valores) → uint8 (Series/array; una vez por texto distinto)
+
+a_bytes() / desde_bytes(): el índice ya armado, como JSON, para la
+instantánea de catalogo_palabras.py (se carga sin volver a tokenizar
+el catálogo). El trie va aplanado en una lista de nodos:
+
+  "nodos": [[bits, {"jet": 1, "jets": 1, "jetes": 1}],   ← 0 = raíz
+            [0,    {"fuel": 2, ...}],
+            [GAS,  {}]]
+
+  las formas plurales apuntan al mismo número → mismo nodo al cargar.
+"""
+
+import re
+import json
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+# Subir si cambia la estructura del índice (invalida las instantáneas)
+VERSION_INDICE = 2
+
+_RE_TOKEN = re.compile(r'[a-z0-9]+')
+
+# Nodo del trie de frases: palabra → nodo; los bits van en la clave ''
+_BITS = ''
+
+
+def tokenizar(texto: str) -> list:
+    """Minúsculas, sin acentos, separado en palabras [a-z0-9]+."""
+    texto = texto.lower()
+    if not texto.isascii():
+        texto = unicodedata.normalize('NFKD', texto).encode('ascii', 'ignore').decode('ascii')
+    return _RE_TOKEN.findall(texto)
+
+
+def _con_plural(palabra: str) -> tuple:
+    """La palabra y sus plurales simples (-s, -es)."""
+    return (palabra, palabra + 's', palabra + 'es')
+
+
+class IndicePalabras:
+    """
+    categorias: {bit: conjunto de palabras o frases}, p. ej. {1: {"gasolina", "jet fuel"}}
+    """
+
+    def __init__(self, categorias: dict):
+        self.simples  = {}     # palabra → bits
+        self.frases   = {}     # trie: palabra → {palabra → ..., '': bits}
+        self.simbolos = {}     # '|' → bits (sin letras ni dígitos)
+        for bit, palabras in categorias.items():
+            for clave in palabras:
+                tokens = tokenizar(clave)
+                if not tokens:
+                    self.simbolos[clave] = self.simbolos.get(clave, 0) | bit
+                elif len(tokens) == 1:
+                    for v in _con_plural(tokens[0]):
+                        self.simples[v] = self.simples.get(v, 0) | bit
+                else:
+                    nodo = self.frases
+                    for t in tokens:
+                        sig = nodo.get(t, {})
+                        for v in _con_plural(t):    # las 3 formas → mismo nodo
+                            nodo.setdefault(v, sig)
+                        nodo = nodo[t]
+                    nodo[_BITS] = nodo.get(_BITS, 0) | bit
+
+    # ── Instantánea ─────────────────────────────────────────────
+    def a_bytes(self) -> bytes:
+        nodos, ids = [], {}
+
+        def numerar(nodo) -> int:
+            if id(nodo) not in ids:             # nodo compartido por los plurales
+                ids[id(nodo)] = len(nodos)
+                entrada = [nodo.get(_BITS, 0), {}]
+                nodos.append(entrada)
+                for palabra, sig in nodo.items():
+                    if palabra != _BITS:
+                        entrada[1][palabra] = numerar(sig)
+            return ids[id(nodo)]
+
+        numerar(self.frases)
+        return json.dumps({'version': VERSION_INDICE, 'simples': self.simples,
+                           'simbolos': self.simbolos, 'nodos': nodos},
+                          ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    @classmethod
+    def desde_bytes(cls, datos) -> 'IndicePalabras':
+        """ValueError si los datos no son una instantánea de esta versión."""
+        datos = json.loads(datos)
+        try:
+            version = datos['version']
+            if version != VERSION_INDICE:
+                raise ValueError(f'Instantánea de índice v{version}, se esperaba v{VERSION_INDICE}')
+            nodos = [{} for _ in datos['nodos']]
+            for nodo, (bits, hijos) in zip(nodos, datos['nodos']):
+                for palabra, n in hijos.items():
+                    nodo[palabra] = nodos[n]
+                if bits:
+                    nodo[_BITS] = int(bits)
+            indice = cls.__new__(cls)
+            indice.simples  = {str(p): int(b) for p, b in datos['simples'].items()}
+            indice.simbolos = {str(p): int(b) for p, b in datos['simbolos'].items()}
+            indice.frases   = nodos[0]
+        except (KeyError, IndexError, TypeError, AttributeError) as e:
+            raise ValueError(f'Instantánea de índice dañada: {e!r}') from None
+        return indice
+
+    # ══════════════════════════════════════════════════════════════
+    # UN TEXTO
+    # ══════════════════════════════════════════════════════════════
+
+    def buscar(self, texto: str) -> int:
+        """Bits de todas las categorías presentes en `texto`."""
+        bits = 0
+        for simbolo, b in self.simbolos.items():
+            if simbolo in texto:
+                bits |= b
+        tokens  = tokenizar(texto)
+        simples = self.simples
+        frases  = self.frases
+        n = len(tokens)
+        for i, t in enumerate(tokens):
+            bits |= simples.get(t, 0)
+            nodo = frases.get(t)
+            j = i + 1
+            while nodo is not None:
+                bits |= nodo.get(_BITS, 0)
+                if j == n:
+                    break
+                nodo = nodo.get(tokens[j])
+                j += 1
+        return bits
+
+    # ══════════════════════════════════════════════════════════════
+    # SERIE / ARRAY COMPLETO
+    # ══════════════════════════════════════════════════════════════
+
+    def buscar_serie(self, valores) -> np.ndarray:
+        """uint8 por elemento; vacíos/nulos → 0. Un buscar() por texto distinto."""
+        codigos, unicos = pd.factorize(pd.Series(valores, dtype=object))
+        bits = np.fromiter((self.buscar(u) if isinstance(u, str) else 0 for u in unicos),
+                           dtype=np.uint8, count=len(unicos))
+        return np.append(bits, np.uint8(0))[codigos]
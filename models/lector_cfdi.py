@@ -0,0 +1,368 @@
+"""
+lector_cfdi.py — Ingesta directa de CFDI 4.0 (carpeta de XML)
+ReaDesF1.9
+
+Recorre una carpeta con los XML timbrados y arma, por bloques, el mismo
+DataFrame que produce la exportación a Excel (mismas columnas: Conceptos,
+Uso CFDI, IVA Trasladado 16%, ...). Así los motores y el Paso 3 no
+distinguen si el origen fue un .xlsx o los XML.
+
+  carpeta/                    ProcessPool              bloques
+  ├── A1B2...xml  ──┐      ┌─ parsear_cfdi() ─┐      ┌────────────┐
+  ├── C3D4...xml  ──┼────→ ├─ parsear_cfdi() ─┼────→ │ DataFrame  │ → motor
+  └── ...         ──┘      └─ parsear_cfdi() ─┘      │ chunk_size │
+                                                      └────────────┘
+
+Cada XML se lee con iterparse (streaming, sin árbol completo). Nodos:
+  • Comprobante, Emisor, Receptor
+  • Conceptos (descripción + traslados/retenciones por concepto)
+  • Impuestos globales (solo si no hay impuestos por concepto)
+  • CfdiRelacionados
+  • Complemento: TimbreFiscalDigital (UUID) y Pagos 2.0
+    (DoctoRelacionado → UUIDs EXACTOS de los PPD que paga el CP01)
+
+Los nombres de nodo se comparan sin namespace: acepta CFDI 4.0 y 3.3.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+import xml.etree.ElementTree as ET
+
+import pandas as pd
+
+# Debajo de este número de XML el arranque del pool cuesta más que parsear
+MIN_XML_POOL = 200
+
+# ══════════════════════════════════════════════════════════════════
+# CATÁLOGOS SAT — mismo texto "CLAVE - Descripción" que la exportación
+# ══════════════════════════════════════════════════════════════════
+USOS_CFDI = {
+    'G01': 'Adquisición de mercancías',
+    'G02': 'Devoluciones, descuentos o bonificaciones',
+    'G03': 'Gastos en general',
+    'I01': 'Construcciones',
+    'I02': 'Mobiliario y equipo de oficina por inversiones',
+    'I03': 'Equipo de transporte',
+    'I04': 'Equipo de computo y accesorios',
+    'I05': 'Dados, troqueles, moldes, matrices y herramental',
+    'I06': 'Comunicaciones telefónicas',
+    'I07': 'Comunicaciones satelitales',
+    'I08': 'Otra maquinaria y equipo',
+    'D01': 'Honorarios médicos, dentales y gastos hospitalarios',
+    'D02': 'Gastos médicos por incapacidad o discapacidad',
+    'D03': 'Gastos funerales',
+    'D04': 'Donativos',
+    'D05': 'Intereses reales efectivamente pagados por créditos hipotecarios (casa habitación)',
+    'D06': 'Aportaciones voluntarias al SAR',
+    'D07': 'Primas por seguros de gastos médicos',
+    'D08': 'Gastos de transportación escolar obligatoria',
+    'D09': 'Depósitos en cuentas para el ahorro, primas que tengan como base planes de pensiones',
+    'D10': 'Pagos por servicios educativos (colegiaturas)',
+    'S01': 'Sin efectos fiscales',
+    'CP01': 'Pagos',
+    'CN01': 'Nómina',
+}
+
+REGIMENES = {
+    '601': 'General de Ley Personas Morales',
+    '603': 'Personas Morales con Fines no Lucrativos',
+    '605': 'Sueldos y Salarios e Ingresos Asimilados a Salarios',
+    '606': 'Arrendamiento',
+    '607': 'Régimen de Enajenación o Adquisición de Bienes',
+    '608': 'Demás ingresos',
+    '610': 'Residentes en el Extranjero sin Establecimiento Permanente en México',
+    '611': 'Ingresos por Dividendos (socios y accionistas)',
+    '612': 'Personas Físicas con Actividades Empresariales y Profesionales',
+    '614': 'Ingresos por intereses',
+    '615': 'Régimen de los ingresos por obtención de premios',
+    '616': 'Sin obligaciones fiscales',
+    '620': 'Sociedades Cooperativas de Producción que optan por diferir sus ingresos',
+    '621': 'Incorporación Fiscal',
+    '622': 'Actividades Agrícolas, Ganaderas, Silvícolas y Pesqueras',
+    '623': 'Opcional para Grupos de Sociedades',
+    '624': 'Coordinados',
+    '625': 'Régimen de las Actividades Empresariales con ingresos a través de Plataformas Tecnológicas',
+    '626': 'Régimen Simplificado de Confianza',
+}
+
+FORMAS_PAGO = {
+    '01': 'Efectivo', '02': 'Cheque nominativo',
+    '03': 'Transferencia electrónica de fondos', '04': 'Tarjeta de crédito',
+    '05': 'Monedero electrónico', '06': 'Dinero electrónico',
+    '08': 'Vales de despensa', '12': 'Dación en pago',
+    '13': 'Pago por subrogación', '14': 'Pago por consignación',
+    '15': 'Condonación', '17': 'Compensación', '23': 'Novación',
+    '24': 'Confusión', '25': 'Remisión de deuda',
+    '26': 'Prescripción o caducidad', '27': 'A satisfacción del acreedor',
+    '28': 'Tarjeta de débito', '29': 'Tarjeta de servicios',
+    '30': 'Aplicación de anticipos', '31': 'Intermediario pagos',
+    '99': 'Por definir',
+}
+
+METODOS_PAGO = {
+    'PUE': 'Pago en una sola exhibición',
+    'PPD': 'Pago en parcialidades o diferido',
+}
+
+EFECTOS = {'I': 'Ingreso', 'E': 'Egreso', 'T': 'Traslado',
+           'N': 'Nómina', 'P': 'Pago'}
+
+# Columnas en el orden de la exportación
+COLUMNAS_CFDI = [
+    'UUID', 'Serie', 'Folio', 'Fecha Emision', 'Fecha certificacion',
+    'Efecto', 'RFC Emisor', 'Razon emisor', 'Regimen emisor',
+    'RFC Receptor', 'Razon receptor', 'Regimen receptor', 'Uso CFDI',
+    'Metodo pago', 'Forma pago', 'Moneda', 'Tipo cambio', 'Conceptos',
+    'SubTotal', 'Descuento',
+    'IVA Trasladado 0%', 'IVA Exento', 'IVA Trasladado 8%', 'IVA Trasladado 16%',
+    'IEPS Trasladado 8%', 'IEPS Trasladado 3%', 'IEPS Trasladado',
+    'IVA Retenido', 'ISR Retenido', 'Total',
+    'Tipo relacion', 'UUIDs relacionados', 'Complementos',
+    'Fecha pago', 'Monto pagado', 'Parcialidades', 'Saldo insoluto',
+    'Archivo',
+]
+
+COLUMNAS_MONTO = {
+    'SubTotal', 'Descuento', 'Tipo cambio',
+    'IVA Trasladado 0%', 'IVA Exento', 'IVA Trasladado 8%', 'IVA Trasladado 16%',
+    'IEPS Trasladado 8%', 'IEPS Trasladado 3%', 'IEPS Trasladado',
+    'IVA Retenido', 'ISR Retenido', 'Total', 'Monto pagado', 'Saldo insoluto',
+}
+
+
+def _local(tag: str) -> str:
+    """'{http://www.sat.gob.mx/cfd/4}Concepto' → 'Concepto'"""
+    return tag.rsplit('}', 1)[-1]
+
+
+def _num(v) -> float:
+    try:
+        return float(v) if v not in (None, '') else 0.0
+    except ValueError:
+        return 0.0
+
+
+def _catalogo(clave: str, catalogo: dict) -> str:
+    if not clave:
+        return ''
+    desc = catalogo.get(clave)
+    return f'{clave} - {desc}' if desc else clave
+
+
+def _sumar_traslado(fila: dict, a: dict) -> None:
+    """Acumula un nodo Traslado (Impuesto 002=IVA, 003=IEPS) en su columna."""
+    impuesto = a.get('Impuesto', '')
+    factor   = a.get('TipoFactor', '')
+    tasa     = _num(a.get('TasaOCuota'))
+    base     = _num(a.get('Base'))
+    importe  = _num(a.get('Importe'))
+
+    if impuesto == '002':
+        if factor == 'Exento':
+            fila['IVA Exento'] += base
+        elif tasa == 0:
+            fila['IVA Trasladado 0%'] += base
+        elif abs(tasa - 0.08) < 1e-6:
+            fila['IVA Trasladado 8%'] += importe
+        else:
+            fila['IVA Trasladado 16%'] += importe
+    elif impuesto == '003':
+        if factor == 'Tasa' and abs(tasa - 0.08) < 1e-6:
+            fila['IEPS Trasladado 8%'] += importe
+        elif factor == 'Tasa' and abs(tasa - 0.03) < 1e-6:
+            fila['IEPS Trasladado 3%'] += importe
+        else:
+            # Cuota (combustibles) y demás tasas
+            fila['IEPS Trasladado'] += importe
+
+
+def _sumar_retencion(fila: dict, a: dict) -> None:
+    impuesto = a.get('Impuesto', '')
+    if impuesto == '002':
+        fila['IVA Retenido'] += _num(a.get('Importe'))
+    elif impuesto == '001':
+        fila['ISR Retenido'] += _num(a.get('Importe'))
+
+
+def parsear_cfdi(ruta: str):
+    """
+    Lee UN XML de CFDI en streaming y retorna un dict con COLUMNAS_CFDI.
+    Retorna None si el archivo no es un CFDI válido (se reporta aparte).
+    Función de módulo (no closure) para poder usarse en ProcessPool.
+    """
+    fila = {c: '' for c in COLUMNAS_CFDI}
+    for c in COLUMNAS_MONTO:
+        fila[c] = 0.0
+    fila['Archivo'] = os.path.basename(ruta)
+
+    conceptos    = []
+    relacionados = []
+    docs_pago    = []
+    parcialidad  = []
+    tipos_rel    = []
+    fechas_pago  = []
+    formas_pago  = []
+    saldo        = 0.0
+    monto_pagado = 0.0
+    traslados_globales   = []
+    retenciones_globales = []
+    hay_imp_concepto     = False
+
+    pila = []   # nombres locales de los nodos abiertos
+    try:
+        for evento, elem in ET.iterparse(ruta, events=('start', 'end')):
+            nodo = _local(elem.tag)
+            if evento == 'end':
+                pila.pop()
+                if nodo in ('Concepto', 'Pago'):
+                    elem.clear()
+                continue
+
+            padre = pila[-1] if pila else ''
+            pila.append(nodo)
+            a = elem.attrib
+
+            if nodo == 'Comprobante' and not padre:
+                fila['Serie']         = a.get('Serie', '')
+                fila['Folio']         = a.get('Folio', '')
+                fila['Fecha Emision'] = a.get('Fecha', '').replace('T', ' ')
+                fila['Efecto']        = EFECTOS.get(a.get('TipoDeComprobante', ''),
+                                                    a.get('TipoDeComprobante', ''))
+                fila['Metodo pago']   = _catalogo(a.get('MetodoPago', ''), METODOS_PAGO)
+                fila['Forma pago']    = _catalogo(a.get('FormaPago', ''), FORMAS_PAGO)
+                fila['Moneda']        = a.get('Moneda', '')
+                fila['Tipo cambio']   = _num(a.get('TipoCambio')) or 1.0
+                fila['SubTotal']      = _num(a.get('SubTotal'))
+                fila['Descuento']     = _num(a.get('Descuento'))
+                fila['Total']         = _num(a.get('Total'))
+            elif nodo == 'Emisor' and padre == 'Comprobante':
+                fila['RFC Emisor']     = a.get('Rfc', '')
+                fila['Razon emisor']   = a.get('Nombre', '')
+                fila['Regimen emisor'] = _catalogo(a.get('RegimenFiscal', ''), REGIMENES)
+            elif nodo == 'Receptor' and padre == 'Comprobante':
+                fila['RFC Receptor']     = a.get('Rfc', '')
+                fila['Razon receptor']   = a.get('Nombre', '')
+                fila['Regimen receptor'] = _catalogo(a.get('RegimenFiscalReceptor', ''), REGIMENES)
+                fila['Uso CFDI']         = _catalogo(a.get('UsoCFDI', ''), USOS_CFDI)
+            elif nodo == 'Concepto' and padre == 'Conceptos':
+                conceptos.append(a.get('Descripcion', '').strip())
+            elif nodo == 'Traslado':
+                # Conceptos/Concepto/Impuestos/Traslados/Traslado
+                if 'Concepto' in pila:
+                    hay_imp_concepto = True
+                    _sumar_traslado(fila, a)
+                elif len(pila) == 4 and pila[1] == 'Impuestos':
+                    traslados_globales.append(dict(a))
+            elif nodo == 'Retencion':
+                if 'Concepto' in pila:
+                    _sumar_retencion(fila, a)
+                elif len(pila) == 4 and pila[1] == 'Impuestos':
+                    retenciones_globales.append(dict(a))
+            elif nodo == 'CfdiRelacionados':
+                if a.get('TipoRelacion'):
+                    tipos_rel.append(a['TipoRelacion'])
+            elif nodo == 'CfdiRelacionado':
+                if a.get('UUID'):
+                    relacionados.append(a['UUID'].upper())
+            elif nodo == 'TimbreFiscalDigital':
+                fila['UUID']                = a.get('UUID', '').upper()
+                fila['Fecha certificacion'] = a.get('FechaTimbrado', '').replace('T', ' ')
+            elif nodo == 'Pago' and padre == 'Pagos':
+                # Pagos 2.0
+                monto_pagado += _num(a.get('Monto'))
+                if a.get('FechaPago'):
+                    fechas_pago.append(a['FechaPago'].replace('T', ' '))
+                if a.get('FormaDePagoP'):
+                    formas_pago.append(a['FormaDePagoP'])
+            elif nodo == 'DoctoRelacionado':
+                if a.get('IdDocumento'):
+                    docs_pago.append(a['IdDocumento'].upper())
+                parcialidad.append(a.get('NumParcialidad', ''))
+                saldo += _num(a.get('ImpSaldoInsoluto'))
+    except (ET.ParseError, OSError):
+        return None
+
+    if not fila['UUID'] and not fila['Efecto']:
+        return None   # no es un CFDI
+
+    # Impuestos globales: solo si los conceptos no los traían
+    if not hay_imp_concepto:
+        for t in traslados_globales:
+            _sumar_traslado(fila, t)
+        for r in retenciones_globales:
+            _sumar_retencion(fila, r)
+
+    # ' | ' igual que la exportación (es_gasolina_agrupada busca el '|')
+    fila['Conceptos'] = ' | '.join(c for c in conceptos if c)
+
+    if fila['Efecto'] == 'Pago':
+        fila['Complementos']  = 'Pago'
+        fila['Fecha pago']    = fechas_pago[0] if fechas_pago else ''
+        fila['Monto pagado']  = round(monto_pagado, 2)
+        fila['Saldo insoluto']= round(saldo, 2)
+        fila['Parcialidades'] = ', '.join(p for p in parcialidad if p)
+        if not fila['Forma pago'] and formas_pago:
+            fila['Forma pago'] = _catalogo(formas_pago[0], FORMAS_PAGO)
+
+    # Pagos: UUIDs exactos de los documentos pagados; después los relacionados
+    uuids_rel = list(dict.fromkeys(docs_pago + relacionados))
+    fila['UUIDs relacionados'] = ', '.join(uuids_rel)
+    fila['Tipo relacion']      = ', '.join(tipos_rel)
+
+    for c in COLUMNAS_MONTO:
+        fila[c] = round(fila[c], 6)
+    return fila
+
+
+def listar_xml(carpeta: str) -> list:
+    """Rutas de todos los .xml de la carpeta (incluye subcarpetas), ordenadas."""
+    rutas = []
+    for raiz, _, archivos in os.walk(carpeta):
+        for nombre in archivos:
+            if nombre.lower().endswith('.xml'):
+                rutas.append(os.path.join(raiz, nombre))
+    rutas.sort()
+    return rutas
+
+
+def leer_bloques_cfdi(carpeta: str, chunk_size: int = 5000, workers: int = None):
+    """
+    Genera DataFrames de hasta chunk_size comprobantes (columnas
+    COLUMNAS_CFDI), en el orden de listar_xml(). El parseo se reparte en
+    un ProcessPool de `workers` procesos (por defecto: núcleos del CPU).
+    Los XML inválidos se omiten y se reportan al final.
+    """
+    rutas = listar_xml(carpeta)
+    if not rutas:
+        return
+
+    workers  = workers or os.cpu_count() or 1
+    omitidos = []
+    bloque   = []
+
+    def recolectar(resultados):
+        nonlocal bloque
+        for ruta, fila in zip(rutas, resultados):
+            if fila is None:
+                omitidos.append(os.path.basename(ruta))
+                continue
+            bloque.append(fila)
+            if len(bloque) >= chunk_size:
+                df, bloque = pd.DataFrame(bloque, columns=COLUMNAS_CFDI, dtype=object), []
+                yield df
+
+    if workers > 1 and len(rutas) >= MIN_XML_POOL:
+        print(f"  ⚙️  Parseando {len(rutas):,} XML con {workers} procesos...")
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # map() conserva el orden; chunksize reduce el ida y vuelta IPC
+            yield from recolectar(pool.map(parsear_cfdi, rutas,
+                                           chunksize=max(1, min(256, len(rutas) // (workers * 4)))))
+    else:
+        yield from recolectar(map(parsear_cfdi, rutas))
+
+    if bloque:
+        yield pd.DataFrame(bloque, columns=COLUMNAS_CFDI, dtype=object)
+
+    if omitidos:
+        print(f"  ⚠️  {len(omitidos):,} XML omitidos (no son CFDI válidos): "
+              f"{', '.join(omitidos[:5])}{' ...' if len(omitidos) > 5 else ''}")
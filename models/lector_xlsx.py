@@ -0,0 +1,336 @@
+"""
+lector_xlsx.py — Lector XLSX en streaming (out-of-core)
+ReaDesF1.9
+
+Lee la hoja activa de un .xlsx directamente desde el ZIP, sin cargar
+el libro completo en memoria:
+
+  xl/sharedStrings.xml      → tabla de textos (iterparse incremental)
+  xl/styles.xml             → qué estilos son fechas
+  xl/worksheets/sheetN.xml  → filas, una a una (iterparse + clear)
+
+  ┌──────────────┐   iterparse   ┌──────────┐   chunk_size   ┌────────────┐
+  │ sheet1.xml   │ ────────────→ │  <row>   │ ─────────────→ │ DataFrame  │
+  │ (comprimido) │   fila a fila │  valores │   filas        │  (bloque)  │
+  └──────────────┘               └──────────┘                └────────────┘
+
+La RAM queda acotada por chunk_size (más la tabla de sharedStrings),
+no por el tamaño del archivo.
+
+SONDEO (sondear_xlsx) — metadatos sin abrir el libro, en milisegundos:
+  <dimension ref="A1:T1201"/> → filas y columnas
+  sin <dimension> (o solo "A1") → cuenta los <row en el stream comprimido
+  primera <row>                 → nombres de encabezado
+  sharedStrings.xml             → tamaño descomprimido (RAM que costará)
+
+Los valores se entregan como texto, igual que pd.read_excel(dtype=str):
+  • números → '1234.5' / '10'
+  • fechas  → '2026-02-10 10:30:00'
+  • vacíos  → NaN
+"""
+
+import re
+import zipfile
+import posixpath
+from datetime import datetime, timedelta
+import xml.etree.ElementTree as ET
+
+import pandas as pd
+
+_NS     = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+_NS_REL = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+_NS_PKG = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+
+_RE_REF = re.compile(r'([A-Z]+)(\d+)')
+_RE_ROW = re.compile(rb'<(?:\w+:)?row[\s>]')
+
+# numFmtId integrados de Excel que representan fecha/hora
+_FMT_FECHA_INTEGRADOS = set(range(14, 23)) | {45, 46, 47}
+_RE_FMT_FECHA = re.compile(r'[dmyhs]', re.IGNORECASE)
+_RE_FMT_LITERAL = re.compile(r'"[^"]*"|\[[^\]]*\]|\\.')
+
+_EPOCA_1900 = datetime(1899, 12, 30)
+_EPOCA_1904 = datetime(1904, 1, 1)
+
+
+def _col_idx(letras: str) -> int:
+    """'A' → 0, 'Z' → 25, 'AA' → 26"""
+    n = 0
+    for ch in letras:
+        n = n * 26 + (ord(ch) - 64)
+    return n - 1
+
+
+def _ruta_hoja_activa(zf: zipfile.ZipFile) -> str:
+    """Primera hoja del libro (la que lee pd.read_excel por defecto)."""
+    nombres = set(zf.namelist())
+    try:
+        wb   = ET.fromstring(zf.read('xl/workbook.xml'))
+        rels = ET.fromstring(zf.read('xl/_rels/workbook.xml.rels'))
+        hoja = wb.find(f'{_NS}sheets/{_NS}sheet')
+        rid  = hoja.get(f'{_NS_REL}id')
+        for r in rels.iter(f'{_NS_PKG}Relationship'):
+            if r.get('Id') == rid:
+                destino = r.get('Target', '')
+                ruta = destino.lstrip('/') if destino.startswith('/') \
+                       else posixpath.normpath(posixpath.join('xl', destino))
+                if ruta in nombres:
+                    return ruta
+    except (KeyError, ET.ParseError, AttributeError):
+        pass
+    return 'xl/worksheets/sheet1.xml'
+
+
+def _es_1904(zf: zipfile.ZipFile) -> bool:
+    try:
+        wb = ET.fromstring(zf.read('xl/workbook.xml'))
+    except (KeyError, ET.ParseError):
+        return False
+    pr = wb.find(f'{_NS}workbookPr')
+    return pr is not None and pr.get('date1904') in ('1', 'true')
+
+
+def _leer_shared_strings(zf: zipfile.ZipFile) -> list:
+    """Tabla de sharedStrings leída con iterparse (sin árbol completo)."""
+    if 'xl/sharedStrings.xml' not in zf.namelist():
+        return []
+    textos = []
+    with zf.open('xl/sharedStrings.xml') as fp:
+        for _, elem in ET.iterparse(fp, events=('end',)):
+            if elem.tag == f'{_NS}si':
+                # <si><t>..</t></si> o texto enriquecido <si><r><t>..</t></r>...</si>
+                textos.append(''.join(t.text or '' for t in elem.iter(f'{_NS}t')))
+                elem.clear()
+    return textos
+
+
+def _estilos_fecha(zf: zipfile.ZipFile) -> set:
+    """Índices de cellXfs cuyo formato numérico es fecha/hora."""
+    try:
+        st = ET.fromstring(zf.read('xl/styles.xml'))
+    except (KeyError, ET.ParseError):
+        return set()
+
+    fmts_fecha = set(_FMT_FECHA_INTEGRADOS)
+    nf = st.find(f'{_NS}numFmts')
+    if nf is not None:
+        for f in nf.findall(f'{_NS}numFmt'):
+            codigo = _RE_FMT_LITERAL.sub('', f.get('formatCode', ''))
+            if _RE_FMT_FECHA.search(codigo):
+                fmts_fecha.add(int(f.get('numFmtId', -1)))
+
+    xfs = st.find(f'{_NS}cellXfs')
+    if xfs is None:
+        return set()
+    return {i for i, xf in enumerate(xfs.findall(f'{_NS}xf'))
+            if int(xf.get('numFmtId', 0)) in fmts_fecha}
+
+
+def _numero_a_texto(v: str) -> str:
+    """
+    Mismo texto que pd.read_excel(dtype=str): openpyxl convierte a float
+    (o int) y pandas regresa el float entero como int → '626.0' = '626',
+    '1.5E+2' = '150'.
+    """
+    if '.' in v or 'E' in v or 'e' in v:
+        f = float(v)
+        return str(int(f)) if f.is_integer() else str(f)
+    return str(int(v))
+
+
+def _fecha_a_texto(v: str, epoca: datetime) -> str:
+    segundos = round(float(v) * 86400)
+    return str(epoca + timedelta(seconds=segundos))
+
+
+def iterar_filas(file_path: str):
+    """
+    Genera cada fila de la hoja activa como lista de textos (None = vacío).
+    La primera fila generada es la de encabezados.
+    """
+    with zipfile.ZipFile(file_path, 'r') as zf:
+        shared = _leer_shared_strings(zf)
+        fechas = _estilos_fecha(zf)
+        epoca  = _EPOCA_1904 if _es_1904(zf) else _EPOCA_1900
+        ruta   = _ruta_hoja_activa(zf)
+
+        t_row, t_c, t_v = f'{_NS}row', f'{_NS}c', f'{_NS}v'
+        t_is, t_t       = f'{_NS}is', f'{_NS}t'
+        t_sheet_data    = f'{_NS}sheetData'
+
+        with zf.open(ruta) as fp:
+            sheet_data = None
+            for evento, elem in ET.iterparse(fp, events=('start', 'end')):
+                if evento == 'start':
+                    if elem.tag == t_sheet_data:
+                        sheet_data = elem
+                    continue
+                if elem.tag != t_row:
+                    continue
+
+                fila = []
+                for c in elem.iter(t_c):
+                    ref = c.get('r')
+                    if ref:
+                        idx = _col_idx(_RE_REF.match(ref).group(1))
+                    else:
+                        idx = len(fila)
+                    tipo = c.get('t', 'n')
+
+                    if tipo == 'inlineStr':
+                        is_ = c.find(t_is)
+                        val = ''.join(t.text or '' for t in is_.iter(t_t)) if is_ is not None else None
+                    else:
+                        v = c.find(t_v)
+                        txt = v.text if v is not None else None
+                        if txt is None:
+                            val = None
+                        elif tipo == 's':
+                            val = shared[int(txt)]
+                        elif tipo == 'b':
+                            val = 'True' if txt == '1' else 'False'
+                        elif tipo in ('str', 'e'):
+                            val = txt
+                        elif int(c.get('s', 0)) in fechas:
+                            val = _fecha_a_texto(txt, epoca)
+                        else:
+                            val = _numero_a_texto(txt)
+
+                    if idx >= len(fila):
+                        fila.extend([None] * (idx - len(fila) + 1))
+                    fila[idx] = val
+
+                # Liberar la fila ya procesada (RAM constante)
+                elem.clear()
+                if sheet_data is not None:
+                    sheet_data.clear()
+                yield fila
+
+
+def leer_bloques_xlsx(file_path: str, chunk_size: int = 5000):
+    """
+    Genera DataFrames de hasta chunk_size filas (todas las columnas como
+    texto, encabezados con strip()). Las filas completamente vacías se omiten.
+    """
+    filas      = iterar_filas(file_path)
+    encabezado = next(filas, None)
+    if encabezado is None:
+        return
+
+    columnas = []
+    for i, h in enumerate(encabezado):
+        nombre = str(h).strip() if h is not None else f'Unnamed: {i}'
+        columnas.append(nombre)
+    n_cols = len(columnas)
+
+    bloque = []
+    for fila in filas:
+        if not any(v not in (None, '') for v in fila):
+            continue
+        if len(fila) < n_cols:
+            fila.extend([None] * (n_cols - len(fila)))
+        bloque.append(fila[:n_cols])
+        if len(bloque) >= chunk_size:
+            yield pd.DataFrame(bloque, columns=columnas, dtype=object)
+            bloque = []
+
+    if bloque:
+        yield pd.DataFrame(bloque, columns=columnas, dtype=object)
+
+
+# ══════════════════════════════════════════════════════════════════
+# SONDEO DE METADATOS
+# ══════════════════════════════════════════════════════════════════
+
+def _local(tag: str) -> str:
+    return tag.rsplit('}', 1)[-1]
+
+
+def _textos_hasta(zf: zipfile.ZipFile, maximo: int) -> list:
+    """Primeros maximo+1 textos de sharedStrings (los del encabezado)."""
+    textos = []
+    if maximo < 0 or 'xl/sharedStrings.xml' not in zf.namelist():
+        return textos
+    with zf.open('xl/sharedStrings.xml') as fp:
+        for _, elem in ET.iterparse(fp, events=('end',)):
+            if elem.tag == f'{_NS}si':
+                textos.append(''.join(t.text or '' for t in elem.iter(f'{_NS}t')))
+                elem.clear()
+                if len(textos) > maximo:
+                    break
+    return textos
+
+
+def _contar_rows(zf: zipfile.ZipFile, ruta: str) -> int:
+    """<row contados en el XML descomprimido por bloques, sin parsear."""
+    n, cola = 0, b''
+    with zf.open(ruta) as fp:
+        for bloque in iter(lambda: fp.read(1 << 20), b''):
+            buf = cola + bloque
+            # Solo los que terminan fuera de la cola (ya contada antes)
+            n += sum(1 for m in _RE_ROW.finditer(buf) if m.end() > len(cola))
+            cola = buf[-16:]
+    return n
+
+
+def sondear_xlsx(file_path: str) -> dict:
+    """
+    filas (sin encabezado), columnas, encabezados y tamaño de
+    sharedStrings, leídos de los metadatos del ZIP — sin cargar celdas.
+    """
+    with zipfile.ZipFile(file_path, 'r') as zf:
+        ruta = _ruta_hoja_activa(zf)
+        ref, celdas = None, []
+        with zf.open(ruta) as fp:
+            for evento, elem in ET.iterparse(fp, events=('start', 'end')):
+                nombre = _local(elem.tag)
+                if evento == 'start':
+                    if nombre == 'dimension':
+                        ref = elem.get('ref')
+                    continue
+                if nombre == 'row':
+                    for c in elem:
+                        if _local(c.tag) != 'c':
+                            continue
+                        v = next((x for x in c if _local(x.tag) == 'v'), None)
+                        t = ''.join(x.text or '' for x in c.iter() if _local(x.tag) == 't')
+                        celdas.append((c.get('r'), c.get('t', 'n'),
+                                       v.text if v is not None else t))
+                    break
+
+        # Encabezados: los 's' apuntan a sharedStrings (solo los primeros)
+        indices = [int(v) for _, tipo, v in celdas if tipo == 's' and v]
+        shared  = _textos_hasta(zf, max(indices, default=-1))
+        encabezados = []
+        for i, (r, tipo, v) in enumerate(celdas):
+            idx = _col_idx(_RE_REF.match(r).group(1)) if r else i
+            if tipo == 's' and v:
+                v = shared[int(v)]
+            elif tipo == 'n' and v:
+                v = _numero_a_texto(v)
+            encabezados.extend([None] * (idx + 1 - len(encabezados)))
+            encabezados[idx] = v
+        encabezados = [str(h).strip() if h is not None else f'Unnamed: {i}'
+                       for i, h in enumerate(encabezados)]
+
+        filas, columnas, fuente = None, len(encabezados), 'conteo <row>'
+        if ref and ':' in ref:
+            m = _RE_REF.match(ref.split(':')[-1].replace('$', ''))
+            if m:
+                filas    = int(m.group(2)) - 1
+                columnas = max(columnas, _col_idx(m.group(1)) + 1)
+                fuente   = '<dimension>'
+        if filas is None:
+            filas = max(0, _contar_rows(zf, ruta) - 1)
+
+        ss_bytes = 0
+        if 'xl/sharedStrings.xml' in zf.namelist():
+            ss_bytes = zf.getinfo('xl/sharedStrings.xml').file_size
+
+    return {
+        'filas':             filas,
+        'columnas':          columnas,
+        'encabezados':       encabezados,
+        'shared_strings_mb': ss_bytes / (1024 * 1024),
+        'fuente':            fuente,
+    }
@@ -0,0 +1,296 @@
+"""
+lectores.py — Capa de entrada intercambiable (XLSX / CSV / Parquet / Arrow)
+ReaDesF1.9
+
+El formato se elige por la extensión del origen; todos los lectores
+entregan lo mismo, así que los motores no saben de dónde viene el dato:
+
+  ┌──────────────┐
+  │ .xlsx/.xlsm  │──┐  lector_xlsx (streaming del XML)
+  │ .csv / .txt  │──┤  pandas.read_csv por bloques
+  │ .parquet     │──┼→ Lector ──→ leer_bloques() → DataFrames (chunks)
+  │ .arrow/.ipc  │──┤            leer_todo()    → DataFrame  (TURBO)
+  │ .feather     │──┤            iterar_filas() → listas     (openpyxl)
+  │ carpeta XML  │──┘            sondear()      → Metadatos (sin leer datos)
+  └──────────────┘
+
+Encabezados: siempre con strip(), igual que los gc()/ac() de los motores.
+Vacíos: NaN en DataFrames, None en iterar_filas().
+
+Parquet y Arrow requieren pyarrow (opcional): pip install pyarrow
+"""
+
+import os
+from dataclasses import dataclass, field
+from typing import Callable
+
+import pandas as pd
+
+from models.lector_xlsx import leer_bloques_xlsx, sondear_xlsx
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    import pyarrow.ipc as ipc
+    PYARROW_OK = True
+except ImportError:
+    PYARROW_OK = False
+
+EXT_XLSX    = ('.xlsx', '.xlsm')
+EXT_CSV     = ('.csv', '.txt')
+EXT_PARQUET = ('.parquet', '.pq')
+EXT_ARROW   = ('.arrow', '.ipc', '.feather')
+
+# CSV exportados desde Excel en Windows suelen venir en latin-1
+_ENCODINGS_CSV = ('utf-8-sig', 'latin-1')
+
+
+@dataclass
+class Metadatos:
+    filas:             int                  # sin contar el encabezado
+    columnas:          int
+    encabezados:       list  = field(default_factory=list)
+    shared_strings_mb: float = 0.0          # solo xlsx: tabla de textos descomprimida
+    fuente:            str   = ''           # de dónde salió el conteo
+
+
+@dataclass
+class Lector:
+    nombre:       str
+    leer_bloques: Callable   # (ruta, chunk_size) → generador de DataFrames
+    leer_todo:    Callable   # (ruta) → DataFrame
+    iterar_filas: Callable   # (ruta) → generador de listas (encabezado primero)
+    sondear:      Callable   # (ruta) → Metadatos
+    # Caché de lectura (models/cache_lectura.py). Subir `version` cada
+    # vez que cambie lo que entrega el lector: invalida lo ya cacheado.
+    version:      int  = 1
+    cacheable:    bool = False   # Parquet/Arrow ya son columnares → no vale la pena
+
+
+def _limpiar_encabezados(df: pd.DataFrame) -> pd.DataFrame:
+    df.columns = [str(c).strip() for c in df.columns]
+    return df
+
+
+def _filas_desde_bloques(bloques):
+    """Adapta un generador de DataFrames a filas (para el motor openpyxl)."""
+    encabezado = False
+    for df in bloques:
+        if not encabezado:
+            yield list(df.columns)
+            encabezado = True
+        df = df.astype(object)
+        for fila in df.where(df.notna(), None).itertuples(index=False, name=None):
+            yield list(fila)
+
+
+def _requiere_pyarrow(formato: str):
+    if not PYARROW_OK:
+        raise ImportError(f'Para leer {formato} instala pyarrow: pip install pyarrow')
+
+
+# ══════════════════════════════════════════════════════════════════
+# XLSX
+# ══════════════════════════════════════════════════════════════════
+
+def _xlsx_todo(ruta):
+    return _limpiar_encabezados(pd.read_excel(ruta, dtype=str))
+
+
+def _xlsx_sondear(ruta):
+    return Metadatos(**sondear_xlsx(ruta))
+
+
+def _xlsx_filas(ruta):
+    # openpyxl conserva tipos (números, fechas) → igual que antes en el motor
+    import openpyxl
+    wb = openpyxl.load_workbook(ruta, read_only=True)
+    try:
+        for fila in wb.active.iter_rows(values_only=True):
+            yield list(fila)
+    finally:
+        wb.close()
+
+
+# ══════════════════════════════════════════════════════════════════
+# CSV
+# ══════════════════════════════════════════════════════════════════
+
+def _csv_opciones(ruta) -> dict:
+    """Encoding (utf-8 / latin-1) y separador del CSV, vistos en el encabezado."""
+    with open(ruta, 'rb') as f:
+        muestra = f.read(1 << 16)
+    enc = 'latin-1'
+    for candidato in _ENCODINGS_CSV:
+        try:
+            muestra.decode(candidato)
+            enc = candidato
+            break
+        except UnicodeDecodeError:
+            continue
+    # Excel en español exporta con ';' → el separador sale del encabezado
+    encabezado = muestra.decode(enc, errors='replace').split('\n', 1)[0]
+    sep = max((',', ';', '\t', '|'), key=encabezado.count)
+    return {'encoding': enc, 'sep': sep, 'dtype': str}
+
+
+def _csv_bloques(ruta, chunk_size=5000):
+    with pd.read_csv(ruta, chunksize=chunk_size, **_csv_opciones(ruta)) as lector:
+        for df in lector:
+            df = _limpiar_encabezados(df).dropna(how='all')
+            if len(df):
+                yield df.astype(object)
+
+
+def _csv_todo(ruta):
+    df = pd.read_csv(ruta, **_csv_opciones(ruta))
+    return _limpiar_encabezados(df).dropna(how='all')
+
+
+def _csv_sondear(ruta):
+    # Saltos de línea contados en binario (sin parsear); columnas del encabezado
+    filas = 0
+    with open(ruta, 'rb') as f:
+        for bloque in iter(lambda: f.read(1 << 20), b''):
+            filas += bloque.count(b'\n')
+    encabezados = list(_limpiar_encabezados(
+        pd.read_csv(ruta, nrows=0, **_csv_opciones(ruta))).columns)
+    return Metadatos(max(0, filas - 1), len(encabezados), encabezados,
+                     fuente='saltos de línea')
+
+
+# ══════════════════════════════════════════════════════════════════
+# PARQUET — streaming por row groups / lotes
+# ══════════════════════════════════════════════════════════════════
+
+def _parquet_bloques(ruta, chunk_size=5000):
+    _requiere_pyarrow('Parquet')
+    pf = pq.ParquetFile(ruta)
+    for lote in pf.iter_batches(batch_size=chunk_size):
+        yield _limpiar_encabezados(lote.to_pandas()).astype(object)
+
+
+def _parquet_todo(ruta):
+    _requiere_pyarrow('Parquet')
+    return _limpiar_encabezados(pq.read_table(ruta).to_pandas())
+
+
+def _parquet_sondear(ruta):
+    _requiere_pyarrow('Parquet')
+    pf = pq.ParquetFile(ruta)
+    encabezados = [str(c).strip() for c in pf.schema_arrow.names]
+    return Metadatos(pf.metadata.num_rows, len(encabezados), encabezados,
+                     fuente='footer Parquet')
+
+
+# ══════════════════════════════════════════════════════════════════
+# ARROW IPC (formato archivo/feather v2; formato stream como respaldo)
+# ══════════════════════════════════════════════════════════════════
+
+def _arrow_lotes(ruta):
+    with pa.memory_map(ruta, 'r') as fuente:
+        try:
+            lector = ipc.open_file(fuente)
+            for i in range(lector.num_record_batches):
+                yield lector.get_batch(i)
+            return
+        except pa.ArrowInvalid:
+            pass
+    with pa.memory_map(ruta, 'r') as fuente:
+        yield from ipc.open_stream(fuente)
+
+
+def _arrow_bloques(ruta, chunk_size=5000):
+    _requiere_pyarrow('Arrow IPC')
+    for lote in _arrow_lotes(ruta):
+        for inicio in range(0, lote.num_rows, chunk_size):
+            yield _limpiar_encabezados(
+                lote.slice(inicio, chunk_size).to_pandas()).astype(object)
+
+
+def _arrow_todo(ruta):
+    _requiere_pyarrow('Arrow IPC')
+    lotes = list(_arrow_lotes(ruta))
+    if not lotes:
+        return pd.DataFrame()
+    return _limpiar_encabezados(pa.Table.from_batches(lotes).to_pandas())
+
+
+def _arrow_sondear(ruta):
+    _requiere_pyarrow('Arrow IPC')
+    with pa.memory_map(ruta, 'r') as fuente:
+        try:
+            lector = ipc.open_file(fuente)
+            # Footer del archivo: filas sin leer los datos
+            filas = sum(lector.get_batch(i).num_rows
+                        for i in range(lector.num_record_batches))
+            encabezados = [str(c).strip() for c in lector.schema.names]
+            return Metadatos(filas, len(encabezados), encabezados, fuente='footer Arrow')
+        except pa.ArrowInvalid:
+            pass
+    filas, encabezados = 0, []
+    for lote in _arrow_lotes(ruta):
+        filas      += lote.num_rows
+        encabezados = [str(c).strip() for c in lote.schema.names]
+    return Metadatos(filas, len(encabezados), encabezados, fuente='stream Arrow')
+
+
+# ══════════════════════════════════════════════════════════════════
+# CARPETA DE XML CFDI
+# ══════════════════════════════════════════════════════════════════
+
+def _cfdi_bloques(ruta, chunk_size=5000):
+    from models.lector_cfdi import leer_bloques_cfdi
+    return leer_bloques_cfdi(ruta, chunk_size)
+
+
+def _cfdi_todo(ruta):
+    bloques = list(_cfdi_bloques(ruta, 50000))
+    return pd.concat(bloques, ignore_index=True) if bloques else pd.DataFrame()
+
+
+def _cfdi_sondear(ruta):
+    from models.lector_cfdi import listar_xml, COLUMNAS_CFDI
+    return Metadatos(len(listar_xml(ruta)), len(COLUMNAS_CFDI), list(COLUMNAS_CFDI),
+                     fuente='archivos .xml')
+
+
+# ══════════════════════════════════════════════════════════════════
+# REGISTRO
+# ══════════════════════════════════════════════════════════════════
+
+LECTOR_XLSX = Lector('xlsx', leer_bloques_xlsx, _xlsx_todo, _xlsx_filas, _xlsx_sondear,
+                     cacheable=True)
+
+LECTOR_CSV = Lector('csv', _csv_bloques, _csv_todo,
+                    lambda r: _filas_desde_bloques(_csv_bloques(r)), _csv_sondear,
+                    cacheable=True)
+
+LECTOR_PARQUET = Lector('parquet', _parquet_bloques, _parquet_todo,
+                        lambda r: _filas_desde_bloques(_parquet_bloques(r)), _parquet_sondear)
+
+LECTOR_ARROW = Lector('arrow', _arrow_bloques, _arrow_todo,
+                      lambda r: _filas_desde_bloques(_arrow_bloques(r)), _arrow_sondear)
+
+LECTOR_CFDI = Lector('cfdi_xml', _cfdi_bloques, _cfdi_todo,
+                     lambda r: _filas_desde_bloques(_cfdi_bloques(r)), _cfdi_sondear,
+                     cacheable=True)
+
+LECTORES = {}
+for _ext in EXT_XLSX:    LECTORES[_ext] = LECTOR_XLSX
+for _ext in EXT_CSV:     LECTORES[_ext] = LECTOR_CSV
+for _ext in EXT_PARQUET: LECTORES[_ext] = LECTOR_PARQUET
+for _ext in EXT_ARROW:   LECTORES[_ext] = LECTOR_ARROW
+
+EXTENSIONES_SOPORTADAS = tuple(LECTORES)
+
+
+def obtener_lector(ruta: str) -> Lector:
+    """Lector según la extensión (o LECTOR_CFDI si la ruta es carpeta)."""
+    if os.path.isdir(ruta):
+        return LECTOR_CFDI
+    ext = os.path.splitext(ruta)[1].lower()
+    if ext not in LECTORES:
+        raise ValueError(f'Formato no soportado: "{ext}" '
+                         f'(válidos: {", ".join(EXTENSIONES_SOPORTADAS)})')
+    return LECTORES[ext]
@@ -0,0 +1,136 @@
+"""
+clasificacion_paralela.py — Preparación de bloques en varios núcleos
+ReaDesF1.9
+
+El motor CHUNKS lee y escribe en un solo proceso (el .xlsx es un solo
+flujo), pero la parte cara de cada bloque — detección de conceptos,
+IEPS → IVA 0%, subtotales y evaluar_deducibilidad_vectorizado — no
+depende de otras filas. Con ≥ 4 núcleos y archivos grandes se reparte:
+
+                     ┌─ filas 0-2,499     ─→ proceso 1 ─┐
+  bloque (10,000) ───┼─ filas 2,500-4,999 ─→ proceso 2 ─┼──→ concat en orden
+                     ├─ filas 5,000-7,499 ─→ proceso 3 ─┤    → SalidaValidado
+                     └─ filas 7,500-9,999 ─→ proceso 4 ─┘
+
+  • Cada fragmento corre _preparar_bloque() de motor_chunks: el
+    resultado es el mismo que en un solo proceso.
+  • Viajan como buffer Arrow IPC (pyarrow) y, si una columna no cabe
+    en Arrow (tipos mezclados), como arrays NumPy por columna — nunca
+    como DataFrame serializado con pickle.
+  • Caché de conceptos: cada proceso arranca con una copia de la del
+    principal y devuelve lo que aprendió; solo el principal la guarda.
+
+Lo activa analizador_sistema.elegir_procesos(): núcleos ≥
+NUCLEOS_MIN_PARALELO y filas ≥ FILAS_MIN_PARALELO.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    PYARROW_OK = True
+except ImportError:
+    PYARROW_OK = False
+
+from models.validaciones_fiscales import (
+    cache_conceptos, sembrar_cache_conceptos, fusionar_cache_conceptos
+)
+
+# Fragmentos más chicos no compensan el ida y vuelta entre procesos
+FILAS_MIN_FRAGMENTO  = 2000
+
+
+# ══════════════════════════════════════════════════════════════════
+# TRANSPORTE: DataFrame ↔ buffers
+# ══════════════════════════════════════════════════════════════════
+
+_ERRORES_ARROW = (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError,
+                  ValueError, TypeError) if PYARROW_OK else ()
+
+
+def empacar(df: pd.DataFrame) -> tuple:
+    """DataFrame → ('arrow', bytes IPC) o ('numpy', columnas, arrays)."""
+    if PYARROW_OK and df.columns.is_unique:
+        try:
+            tabla = pa.Table.from_pandas(df, preserve_index=False)
+            sink  = pa.BufferOutputStream()
+            with pa.ipc.new_stream(sink, tabla.schema) as w:
+                w.write_table(tabla)
+            return ('arrow', sink.getvalue())
+        except _ERRORES_ARROW:
+            pass
+    return ('numpy', list(df.columns),
+            [df.iloc[:, i].to_numpy() for i in range(df.shape[1])])
+
+
+def desempacar(paquete: tuple) -> pd.DataFrame:
+    if paquete[0] == 'arrow':
+        tabla = pa.ipc.open_stream(paquete[1]).read_all()
+        # Enteros con nulos quedan como objeto (no float): misma celda al escribir
+        return tabla.to_pandas(integer_object_nulls=True)
+    _, columnas, arrays = paquete
+    df = pd.DataFrame({i: a for i, a in enumerate(arrays)})
+    df.columns = columnas
+    return df
+
+
+# ══════════════════════════════════════════════════════════════════
+# PROCESO DE TRABAJO
+# ══════════════════════════════════════════════════════════════════
+
+def _iniciar_proceso(semilla: dict) -> None:
+    sembrar_cache_conceptos(semilla)
+
+
+def _preparar_fragmento(paquete: tuple) -> tuple:
+    """Función de módulo (no closure) para poder usarse en ProcessPool."""
+    from models.motores.motor_chunks import _preparar_bloque
+    df, C, cols_ieps, _, unicos = _preparar_bloque(desempacar(paquete))
+    cache    = cache_conceptos()
+    aciertos = cache.aciertos
+    cache.aciertos = cache.nuevos = 0
+    return empacar(df), C, cols_ieps, unicos, cache.tomar_nuevos(), aciertos
+
+
+# ══════════════════════════════════════════════════════════════════
+# PROCESO PRINCIPAL
+# ══════════════════════════════════════════════════════════════════
+
+class ClasificadorParalelo:
+    """
+    Pool de `procesos` procesos, abierto una vez por corrida.
+    preparar(bloque) → misma tupla que motor_chunks._preparar_bloque.
+    """
+
+    def __init__(self, procesos: int):
+        self.procesos = procesos
+        self._pool = ProcessPoolExecutor(
+            max_workers=procesos, initializer=_iniciar_proceso,
+            initargs=(cache_conceptos().exportar(),))
+
+    def preparar(self, bloque: pd.DataFrame) -> tuple:
+        n      = len(bloque)
+        partes = min(self.procesos, n // FILAS_MIN_FRAGMENTO)
+        if partes < 2:
+            from models.motores.motor_chunks import _preparar_bloque
+            return _preparar_bloque(bloque)
+        cortes = [n * k // partes for k in range(partes + 1)]
+        futuros = [self._pool.submit(_preparar_fragmento,
+                                     empacar(bloque.iloc[a:b]))
+                   for a, b in zip(cortes, cortes[1:])]
+
+        piezas, unicos = [], 0
+        for futuro in futuros:            # en orden de filas
+            paquete, C, cols_ieps, u, nuevos, aciertos = futuro.result()
+            piezas.append(desempacar(paquete))
+            unicos += u
+            fusionar_cache_conceptos(nuevos, aciertos)
+
+        df = pd.concat(piezas, ignore_index=True)
+        df.index = bloque.index
+        return df, C, cols_ieps, df['_ieps_gas_ok'], unicos
+
+    def cerrar(self) -> None:
+        self._pool.shutdown(cancel_futures=True)
@@ -0,0 +1,290 @@
+"""
+incremental.py — Re-validación incremental del Paso 2 (CHUNKS / CFDI)
+ReaDesF1.9
+
+Caso típico: el cliente agrega 40 facturas tardías a un mes de 60,000
+filas. Sin esto se vuelve a clasificar y colorear TODO el mes.
+
+Junto al _validado.xlsx se guarda un índice de huellas:
+
+  NOMBRE_validado.xlsx.huellas
+  ┌──────────┬──────────────────┬──────┬─────────┬────────┐
+  │ uuid     │ huella (uint64)  │ fila │ regimen │ bits   │
+  ├──────────┼──────────────────┼──────┼─────────┼────────┤
+  │ CD613E30…│ hash de la fila  │  2   │ 612     │ stats  │
+  └──────────┴──────────────────┴──────┴─────────┴────────┘
+
+  huella = hash de TODAS las columnas de entrada de la fila
+  bits   = aportación de la fila a las estadísticas del motor
+
+  Formato: .npz (un arreglo por columna) + 'meta' como texto JSON, leído
+  con allow_pickle=False. La carpeta de salida se copia y se comparte:
+  un índice ajeno o dañado nunca ejecuta código, solo obliga a una
+  corrida completa.
+
+En la siguiente corrida, cada fila se busca por (uuid, huella):
+
+  encontrada → su <row> se copia tal cual del _validado.xlsx anterior
+               (fórmulas, valores cacheados y colores ya resueltos;
+               solo se renumera si cambió de posición)
+  nueva o modificada → clasificación + evaluar_deducibilidad_vectorizado
+               + estilos, como siempre
+
+El tiempo de re-validación crece con el tamaño del cambio, no del mes.
+
+El índice solo se usa si:
+  • el _validado.xlsx es exactamente el que lo acompaña (tamaño + mtime)
+  • las reglas no cambiaron (hash de todo el código de models/,
+    VERSION_CONCEPTOS y la huella del catálogo de palabras, con el
+    JSON del cliente)
+  • las columnas de entrada son las mismas
+Si algo no cuadra, la corrida es completa y deja un índice nuevo.
+"""
+
+import os
+import re
+import json
+import hashlib
+import zipfile
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from models.esquema_columnas import compilar_esquema
+from models.validaciones_fiscales import catalogo_conceptos
+from models.cache_conceptos import VERSION_CONCEPTOS
+
+USAR_INCREMENTAL = True
+
+# Subir si cambia el formato del índice
+VERSION_HUELLAS = 2
+
+EXT_HUELLAS = '.huellas'
+
+_DIR_MODELS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Código que decide el contenido de cada <row>: TODO models/. Una lista
+# a mano se quedaba corta cada vez que la clasificación pasaba a un
+# módulo nuevo (esquema_columnas, cache_conceptos, reglas...).
+def _archivos_reglas() -> list:
+    """Cada .py bajo models/, en orden estable (ruta relativa)."""
+    archivos = []
+    for raiz, dirs, nombres in os.walk(_DIR_MODELS):
+        dirs[:] = [d for d in dirs if d != '__pycache__']
+        archivos += [os.path.join(raiz, n) for n in nombres if n.endswith('.py')]
+    return sorted(archivos, key=lambda r: os.path.relpath(r, _DIR_MODELS))
+
+
+_RE_REF_CELDA = re.compile(r'(<c r="[A-Z]+)(\d+)"')
+_RE_FORMULA   = re.compile(r'<f>([^<]*)</f>')
+_RE_REF_FORM  = re.compile(r'(?<![A-Za-z0-9_.])(\$?[A-Z]{1,3}\$?)(\d+)(?![0-9(])')
+
+
+def ruta_huellas(output_path: str) -> str:
+    return output_path + EXT_HUELLAS
+
+
+def guardar_tabla_huellas(ruta: str, filas: pd.DataFrame, meta: dict = None) -> None:
+    """uuid/huella/fila/regimen/bits (+ meta) → .npz sin pickle, atómico."""
+    tmp = ruta + '.tmp'
+    with open(tmp, 'wb') as f:
+        np.savez(f,
+                 meta=np.array(json.dumps(meta or {}, ensure_ascii=False)),
+                 uuid=np.array(filas['uuid'].tolist(), dtype=str),
+                 huella=filas['huella'].to_numpy(np.uint64),
+                 fila=filas['fila'].to_numpy(np.int64),
+                 regimen=np.array(filas['regimen'].fillna('').tolist(), dtype=str),
+                 bits=filas['bits'].to_numpy(np.uint16))
+    os.replace(tmp, ruta)
+
+
+def leer_tabla_huellas(ruta: str) -> tuple:
+    """(meta, filas) de guardar_tabla_huellas(). OSError / ValueError / KeyError si no sirve."""
+    try:
+        with np.load(ruta, allow_pickle=False) as z:
+            meta  = json.loads(str(z['meta']))
+            filas = pd.DataFrame({'uuid':    z['uuid'].astype(object),
+                                  'huella':  z['huella'],
+                                  'fila':    z['fila'],
+                                  'regimen': z['regimen'].astype(object),
+                                  'bits':    z['bits']})
+    except (zipfile.BadZipFile, EOFError) as e:
+        raise ValueError(f'{ruta}: índice de huellas dañado ({e})') from None
+    return meta, filas
+
+
+def firma_reglas() -> str:
+    """
+    Código de models/ + VERSION_CONCEPTOS + catálogo de palabras clave:
+    una marca nueva en el JSON del cliente cambia la clasificación igual
+    que el código. Se toma al inicio de la corrida y se revisa al guardar
+    el índice.
+    """
+    h = hashlib.sha256(f'c{VERSION_CONCEPTOS}'.encode())
+    for ruta in _archivos_reglas():
+        h.update(os.path.relpath(ruta, _DIR_MODELS).replace(os.sep, '/').encode() + b'\0')
+        with open(ruta, 'rb') as f:
+            h.update(f.read())
+    h.update(catalogo_conceptos().huella.encode())
+    return h.hexdigest()
+
+
+def _estado_archivo(ruta: str):
+    st = os.stat(ruta)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def huellas_filas(df: pd.DataFrame) -> np.ndarray:
+    """uint64 por fila; vacío (None/NaN) cuenta igual que ''."""
+    texto = df.astype(object).where(df.notna(), '').astype(str)
+    return pd.util.hash_pandas_object(texto, index=False).to_numpy(np.uint64)
+
+
+def uuids_filas(df: pd.DataFrame) -> list:
+    c = compilar_esquema(df.columns).columna('UUID')
+    if c is None:
+        return [''] * len(df)
+    return df[c].astype(object).fillna('').astype(str).str.strip().str.upper().tolist()
+
+
+def _renumerar(xml: str, viejo: int, nuevo: int) -> str:
+    """<row> de la fila `viejo` → misma fila en la posición `nuevo`."""
+    if viejo == nuevo:
+        return xml
+    v, n = str(viejo), str(nuevo)
+
+    def ref(m):
+        return m.group(1) + (n if m.group(2) == v else m.group(2))
+
+    def formula(m):
+        return '<f>' + _RE_REF_FORM.sub(ref, m.group(1)) + '</f>'
+
+    xml = xml.replace('<row r="%s"' % v, '<row r="%s"' % n, 1)
+    xml = _RE_REF_CELDA.sub(lambda m: ref(m) + '"', xml)
+    return _RE_FORMULA.sub(formula, xml)
+
+
+def _filas_xml(ruta_xlsx: str):
+    """
+    (número, '<row ...>...</row>') de la hoja, en streaming.
+    Solo para libros de EscritorXlsx: una fila por <row>, sin anidar.
+    """
+    with zipfile.ZipFile(ruta_xlsx) as zf, zf.open('xl/worksheets/sheet1.xml') as fp:
+        resto = b''
+        for bloque in iter(lambda: fp.read(1 << 20), b''):
+            partes = (resto + bloque).split(b'</row>')
+            resto  = partes.pop()
+            for p in partes:
+                fila = p[p.index(b'<row '):] + b'</row>'
+                yield int(fila[8:fila.index(b'"', 8)]), fila.decode('utf-8')
+
+
+class IndiceIncremental:
+    """
+    Empareja las filas de la corrida actual con las del _validado.xlsx
+    anterior y junta, bloque a bloque, el índice de la corrida nueva.
+    """
+
+    def __init__(self, output_path: str):
+        self.output_path = output_path
+        self.columnas_entrada = None
+        self.columnas_salida  = None
+        self.activo   = False
+        self.reusadas = 0
+        self._previo  = None
+        self._mapa    = {}
+        self._cursor  = 0
+        self._filas   = None
+        self._reglas  = firma_reglas()
+        if USAR_INCREMENTAL:
+            self._cargar()
+
+    # ── Índice anterior ─────────────────────────────────────────
+    def _cargar(self):
+        ruta = ruta_huellas(self.output_path)
+        try:
+            meta, filas = leer_tabla_huellas(ruta)
+            if (meta.get('version') != VERSION_HUELLAS
+                    or meta.get('reglas') != self._reglas
+                    or meta.get('salida') != _estado_archivo(self.output_path)):
+                return
+        except (OSError, ValueError, KeyError, AttributeError):
+            return
+        self._meta   = meta
+        self._previo = filas.set_index('fila')
+
+    def preparar(self, columnas_entrada: list) -> None:
+        """Primer bloque: el índice anterior solo vale con las mismas columnas."""
+        self.columnas_entrada = list(columnas_entrada)
+        if self._previo is None or self._meta['columnas_entrada'] != self.columnas_entrada:
+            self._previo = None
+            return
+        self.columnas_salida = self._meta['columnas_salida']
+        mapa = {}
+        for fila, u, h in zip(self._previo.index, self._previo['uuid'], self._previo['huella']):
+            mapa.setdefault((u, int(h)), deque()).append(int(fila))
+        self._mapa   = mapa
+        self._filas  = _filas_xml(self.output_path)
+        self.activo  = True
+        print(f"  ♻️  Re-validación incremental: índice con {len(self._previo):,} filas previas")
+
+    # ── Emparejar ───────────────────────────────────────────────
+    def emparejar(self, uuids: list, huellas: np.ndarray) -> list:
+        """
+        Fila anterior reutilizable para cada fila (None = evaluar).
+        Las filas previas se toman en orden creciente: así el
+        _validado.xlsx anterior se lee UNA vez, hacia adelante.
+        """
+        if not self.activo:
+            return [None] * len(uuids)
+        previas = []
+        for u, h in zip(uuids, huellas.tolist()):
+            fila = None
+            cands = self._mapa.get((u, h))
+            if cands:
+                while cands and cands[0] < self._cursor:
+                    cands.popleft()
+                if cands:
+                    fila = cands.popleft()
+                    self._cursor = fila + 1
+            previas.append(fila)
+        return previas
+
+    def fila_xml(self, fila_previa: int, fila_nueva: int) -> str:
+        """<row> ya escrito en la corrida anterior, en su nueva posición."""
+        for rn, xml in self._filas:
+            if rn == fila_previa:
+                self.reusadas += 1
+                return _renumerar(xml, rn, fila_nueva)
+        raise RuntimeError(f'Fila {fila_previa} no encontrada en {self.output_path}')
+
+    def previos(self, filas: list):
+        """(bits, regimen) guardados de las filas anteriores indicadas."""
+        sel = self._previo.loc[filas]
+        return sel['bits'].to_numpy(np.uint16), sel['regimen'].tolist()
+
+    def cerrar(self) -> None:
+        """Suelta el _validado.xlsx anterior (antes de sobrescribirlo)."""
+        if self._filas is not None:
+            self._filas.close()
+            self._filas = None
+
+    # ── Índice nuevo ────────────────────────────────────────────
+    def guardar(self, piezas: list, columnas_salida: list) -> None:
+        """Escribe el índice de la corrida que acaba de cerrar el .xlsx."""
+        if not USAR_INCREMENTAL or self.columnas_entrada is None:
+            return
+        filas = pd.concat(piezas, ignore_index=True) if piezas else \
+            pd.DataFrame(columns=['uuid', 'huella', 'fila', 'regimen', 'bits'])
+        # catálogo recargado a media corrida: filas con dos catálogos,
+        # el índice se guarda pero ninguna corrida lo va a reusar
+        reglas = self._reglas if firma_reglas() == self._reglas else None
+        meta = {
+            'version':          VERSION_HUELLAS,
+            'reglas':           reglas,
+            'columnas_entrada': self.columnas_entrada,
+            'columnas_salida':  list(columnas_salida),
+            'salida':           _estado_archivo(self.output_path),
+        }
+        guardar_tabla_huellas(ruta_huellas(self.output_path), filas, meta)
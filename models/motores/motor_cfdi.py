@@ -0,0 +1,35 @@
+"""
+motor_cfdi.py — Motor para carpetas de XML CFDI 4.0
+ReaDesF1.9
+
+Usado cuando el origen es una CARPETA con los XML timbrados en lugar
+del Excel exportado. Es el motor CHUNKS con otro lector:
+
+  lector_cfdi (ProcessPool + iterparse) → bloques DataFrame
+      → validación vectorizada → salida_validado (fórmulas + colores)
+
+El _validado.xlsx resultante tiene las mismas columnas que el del Excel,
+más las que solo da el XML (UUIDs relacionados exactos del complemento
+de Pagos 2.0, parcialidades, saldo insoluto, retenciones, archivo).
+
+La carpeta ya parseada queda en la caché de lectura (hash de todos los
+XML): re-ejecutar sin cambios en la carpeta no vuelve a abrir ningún XML.
+"""
+
+from functools import partial
+
+from models.lector_cfdi import leer_bloques_cfdi
+from models.lectores import LECTOR_CFDI
+from models.cache_lectura import leer_bloques_cacheado
+from models.motores.motor_chunks import procesar_con_chunks
+from models.resultado_validacion import ResultadoValidacion
+
+
+def procesar_con_cfdi(carpeta: str, output_path: str,
+                      chunk_size: int = 5000, workers: int = None) -> ResultadoValidacion:
+
+    print(f"  🧾 Motor: CFDI XML (carpeta, bloques de {chunk_size:,})")
+    return procesar_con_chunks(
+        carpeta, output_path, chunk_size,
+        lector=partial(leer_bloques_cacheado, LECTOR_CFDI,
+                       fuente=partial(leer_bloques_cfdi, workers=workers)))
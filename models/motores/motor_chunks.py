@@ -18,8 +18,12 @@ CONCEPTO:
     └──────────┘ └──────────┘ └──────────┘
 
   Cada bloque:
-    1. pandas  → valida reglas fiscales (vectorizado)
-    2. openpyxl → escribe fórmulas auditables + colores
+    1. lectores    → lee SOLO chunk_size filas (xlsx/csv/parquet/arrow)
+    2. pandas      → valida reglas fiscales (vectorizado)
+    3. salida_validado → escribe fórmulas auditables (con valor
+                         cacheado) + colores directo al ZIP
+  y se libera antes de leer el siguiente. Nunca existe el archivo
+  completo en memoria: ni al leer ni al escribir.
 
 VENTAJA:
   Filas       RAM usada   Tiempo
@@ -30,109 +34,82 @@ VENTAJA:
 
 Las FÓRMULAS AUDITABLES (sub1, sub0, sub2, iva_acred)
 se escriben como fórmulas Excel vivas en cada bloque.
+
+PUNTO DE CONTROL:
+  Cada bloque terminado se fija UNA vez como fragmento en
+  NOMBRE_validado.xlsx.partes/ junto con avance.json (bloques hechos,
+  filas y estadísticas acumuladas). Al final se ensambla el .xlsx y se
+  borra la carpeta. Si el proceso se interrumpe, volver a ejecutar con
+  el mismo archivo continúa desde el último bloque completo.
+
+EN PARALELO (procesos > 1):
+  La preparación de cada bloque se reparte en fragmentos entre varios
+  procesos (clasificacion_paralela.py); lectura y escritura siguen en
+  el proceso principal, en el orden original.
+
+INCREMENTAL:
+  Al terminar se deja NOMBRE_validado.xlsx.huellas (huella por UUID).
+  En la siguiente corrida las filas sin cambios se copian del
+  _validado.xlsx anterior; solo las nuevas o modificadas se evalúan.
+  Ver incremental.py.
 """
 
-import zipfile
-import re
+import os
+import json
+import shutil
+
+import numpy as np
 import pandas as pd
-import openpyxl
-from openpyxl.styles import Font, PatternFill, Alignment
-from openpyxl.utils import get_column_letter
 
+from models.lectores import obtener_lector
+from models.esquema_columnas import compilar_esquema
+from models.cache_lectura import con_cache
+from models.motores.salida_validado import SalidaValidado
+from models.resultado_validacion import ResultadoValidacion
+from models.motores.incremental import (
+    IndiceIncremental, huellas_filas, uuids_filas,
+    guardar_tabla_huellas, leer_tabla_huellas
+)
 from models.validaciones_fiscales import (
     evaluar_deducibilidad_vectorizado,
     optimizar_tipos_dataframe,
-    formulas_auditables,
-    PATRON_GASOLINA, PATRON_DULCE, PATRON_INSUMO,
-    USO_CFDI_VERDE, LIMITE_EFECTIVO, FORMAS_ELECTRONICAS
+    clasificar_conceptos_unicos, CAT_GASOLINA, CAT_DULCE, CAT_INSUMO, CAT_AGRUPADO,
+    LIMITE_EFECTIVO, FORMAS_ELECTRONICAS, guardar_cache_conceptos
 )
 
-blue_fill   = PatternFill(start_color='00B0F0', end_color='00B0F0', fill_type='solid')
-green_fill  = PatternFill(start_color='00FF00', end_color='00FF00', fill_type='solid')
-red_fill    = PatternFill(start_color='FF0000', end_color='FF0000', fill_type='solid')
-purple_fill = PatternFill(start_color='800080', end_color='800080', fill_type='solid')
-orange_fill = PatternFill(start_color='FFA500', end_color='FFA500', fill_type='solid')
-yellow_fill = PatternFill(start_color='FFFF00', end_color='FFFF00', fill_type='solid')
-pink_fill   = PatternFill(start_color='FF69B4', end_color='FF69B4', fill_type='solid')
-brown_fill  = PatternFill(start_color='8B4513', end_color='8B4513', fill_type='solid')
-lime_fill   = PatternFill(start_color='90EE90', end_color='90EE90', fill_type='solid')
-
-bold_white   = Font(bold=True, color='FFFFFF')
-bold_black   = Font(bold=True)
-center_align = Alignment(horizontal='center')
-REG_FILLS    = {'626': blue_fill, '612': purple_fill, '616': brown_fill}
-
 
 def _extraer_serie(s: pd.Series) -> pd.Series:
-    s2   = s.fillna('').astype(str).str.strip()
+    s2   = s.astype(object).fillna('').astype(str).str.strip()
     mask = s2.str.contains('-', regex=False)
     return s2.str.split('-').str[0].str.strip().where(mask, s2).str.upper()
 
 
-def _parchear_cache_formulas(xlsx_path: str, cache: dict) -> None:
-    """Inserta valores cacheados en fórmulas del xlsx vía XML."""
-    with zipfile.ZipFile(xlsx_path, 'r') as zin:
-        contents = {n: zin.read(n) for n in zin.namelist()}
-    sheet_key = 'xl/worksheets/sheet1.xml'
-    xml = contents[sheet_key].decode('utf-8')
-    def replacer(m):
-        ref = m.group(1)
-        if ref not in cache: return m.group(0)
-        val = cache[ref]
-        sv = str(int(val)) if isinstance(val, float) and val == int(val) \
-             else f'{val:.10f}'.rstrip('0').rstrip('.')
-        return m.group(0).replace('<v></v>', f'<v>{sv}</v>')
-    xml_patched = re.sub(
-        r'<c r="([A-Z]+\d+)"[^>]*><f>[^<]*</f><v></v></c>',
-        replacer, xml)
-    contents[sheet_key] = xml_patched.encode('utf-8')
-    with zipfile.ZipFile(xlsx_path, 'w', zipfile.ZIP_DEFLATED) as zout:
-        for name, data in contents.items():
-            zout.writestr(name, data)
-
+CAMPOS_BASE = {
+    'concepto':'Conceptos','total':'Total','uso':'Uso CFDI',
+    'metodo':'Metodo pago','forma':'Forma pago',
+    'regimen':'Regimen receptor','subtotal':'SubTotal',
+    'descuento':'Descuento','iva0':'IVA Trasladado 0%',
+    'iva_ex':'IVA Exento','iva16':'IVA Trasladado 16%',
+    'razon_em':'Razon emisor',
+}
 
-def procesar_con_chunks(file_path: str, output_path: str,
-                        chunk_size: int = 5000) -> dict:
+def _preparar_bloque(df: pd.DataFrame):
     """
-    Procesa el archivo Excel en bloques de chunk_size filas.
-    RAM constante independientemente del tamaño del archivo.
+    Normaliza, clasifica y evalúa UN bloque (vectorizado).
+    Retorna (df, C, cols_ieps, mask_ieps_gas, conceptos únicos).
     """
+    df = optimizar_tipos_dataframe(df)
 
-    print(f"  📦 Motor: pandas CHUNKS (bloques de {chunk_size:,} filas)")
-
-    # ── PASO 1: Leer el archivo completo con pandas ───────────────
-    # pandas no tiene chunksize nativo para Excel — se lee completo
-    # y se divide manualmente en bloques. El ahorro de RAM viene
-    # de procesar y escribir bloque a bloque antes de seguir.
-    print("  📂 Leyendo archivo...")
-    df_full = pd.read_excel(file_path, dtype=str)
-    df_full.columns = df_full.columns.str.strip()
-    total_filas = len(df_full)
-    bloques     = -(-total_filas // chunk_size)
-    print(f"  ✅ {total_filas:,} filas — {bloques} bloques de {chunk_size:,}")
-
-    # Columnas a category ANTES de dividir en chunks (ahorra RAM global)
-    df_full = optimizar_tipos_dataframe(df_full)
-
-    def gc(n):
-        for c in df_full.columns:
-            if c.strip().lower() == n.strip().lower(): return c
-        return None
+    esquema = compilar_esquema(df.columns)
+    def gc(n): return esquema.columna(n)
     def ac(n, d=None):
         c = gc(n)
         if c is None:
-            df_full[n] = d if d is not None else ''
+            df[n] = d if d is not None else ''
             return n
         return c
 
-    C = {k: ac(v,'0' if k != 'concepto' else '') for k,v in {
-        'concepto':'Conceptos','total':'Total','uso':'Uso CFDI',
-        'metodo':'Metodo pago','forma':'Forma pago',
-        'regimen':'Regimen receptor','subtotal':'SubTotal',
-        'descuento':'Descuento','iva0':'IVA Trasladado 0%',
-        'iva_ex':'IVA Exento','iva16':'IVA Trasladado 16%',
-        'razon_em':'Razon emisor',
-    }.items()}
+    C = {k: ac(v,'0' if k != 'concepto' else '') for k,v in CAMPOS_BASE.items()}
 
     c_ieps8  = gc('IEPS Trasladado 8%')
     c_ieps_g = gc('IEPS Trasladado')
@@ -140,288 +117,355 @@ def procesar_con_chunks(file_path: str, output_path: str,
     c_ieps3  = gc('IEPS Trasladado 3%')
 
     for nc in ['total','subtotal','descuento','iva0','iva_ex','iva16']:
-        df_full[C[nc]] = pd.to_numeric(df_full[C[nc]], errors='coerce').fillna(0)
+        df[C[nc]] = pd.to_numeric(df[C[nc]], errors='coerce').fillna(0)
     for ic in [c_ieps8, c_ieps_g, c_ieps_nd, c_ieps3]:
-        if ic: df_full[ic] = pd.to_numeric(df_full[ic], errors='coerce').fillna(0)
-
-    # Columnas internas globales (para todos los bloques)
-    df_full['_regimen'] = _extraer_serie(df_full[C['regimen']])
-    df_full['_uso']     = _extraer_serie(df_full[C['uso']])
-    df_full['_metodo']  = _extraer_serie(df_full[C['metodo']])
-    df_full['_forma']   = _extraer_serie(df_full[C['forma']])
-    df_full['_cl']      = df_full[C['concepto']].fillna('').str.lower()
-
-    # Detección vectorizada COMPLETA (una sola vez, no por bloque)
-    print("  🔍 Detectando tipos (vectorizado completo)...")
-    df_full['_es_gas']    = df_full['_cl'].str.contains(PATRON_GASOLINA, regex=True, na=False)
-    df_full['_es_dulce']  = df_full['_cl'].str.contains(PATRON_DULCE,    regex=True, na=False)
-    df_full['_es_insumo'] = df_full['_cl'].str.contains(PATRON_INSUMO,   regex=True, na=False)
-    df_full['_agrupada']  = df_full['_es_gas'] & df_full['_cl'].str.contains(r'\|', na=False)
+        if ic: df[ic] = pd.to_numeric(df[ic], errors='coerce').fillna(0)
+
+    df['_regimen'] = _extraer_serie(df[C['regimen']])
+    df['_uso']     = _extraer_serie(df[C['uso']])
+    df['_metodo']  = _extraer_serie(df[C['metodo']])
+    df['_forma']   = _extraer_serie(df[C['forma']])
+
+    # Solo los conceptos distintos se bajan a minúsculas y se recorren
+    cat, unicos = clasificar_conceptos_unicos(df[C['concepto']])
+    df['_es_gas']    = (cat & CAT_GASOLINA) > 0
+    df['_es_dulce']  = (cat & CAT_DULCE)    > 0
+    df['_es_insumo'] = (cat & CAT_INSUMO)   > 0
+    df['_agrupada']  = df['_es_gas'] & ((cat & CAT_AGRUPADO) > 0)
 
     # IEPS gasolina → IVA 0%
-    i8   = df_full[c_ieps8]  if c_ieps8  else pd.Series(0, index=df_full.index)
-    ig   = df_full[c_ieps_g] if c_ieps_g else pd.Series(0, index=df_full.index)
-    ind  = df_full[c_ieps_nd]if c_ieps_nd else pd.Series(0, index=df_full.index)
+    i8   = df[c_ieps8]  if c_ieps8  else pd.Series(0, index=df.index)
+    ig   = df[c_ieps_g] if c_ieps_g else pd.Series(0, index=df.index)
+    ind  = df[c_ieps_nd]if c_ieps_nd else pd.Series(0, index=df.index)
     ieps_gas = ig.where(ig > 0, ind)
-    mask_ig  = df_full['_es_gas'] & (ieps_gas > 0)
-    df_full.loc[mask_ig, C['iva0']] = ieps_gas[mask_ig]
+    mask_ig  = df['_es_gas'] & (ieps_gas > 0)
+    df.loc[mask_ig, C['iva0']] = ieps_gas[mask_ig]
 
-    # Evaluación vectorizada COMPLETA
-    print("  ⚖️  Evaluando deducibilidad (vectorizado completo)...")
-    df_full['Total'] = df_full[C['total']]
-    df_full = evaluar_deducibilidad_vectorizado(df_full)
+    df['Total'] = df[C['total']]
+    df = evaluar_deducibilidad_vectorizado(df)
 
     # Cálculos para fórmulas
-    st = df_full[C['subtotal']]
-    dc = df_full[C['descuento']]
-    i3 = df_full[c_ieps3].fillna(0) if c_ieps3 else pd.Series(0, index=df_full.index)
-    df_full['_sub1']     = (st - dc + i8.where(i8 > 0, 0) + i3.where(i3 > 0, 0)).round(2)
-    df_full.loc[mask_ig, '_sub1'] = (st - dc)[mask_ig].round(2)
+    st = df[C['subtotal']]
+    dc = df[C['descuento']]
+    i3 = df[c_ieps3].fillna(0) if c_ieps3 else pd.Series(0, index=df.index)
+    df['_sub1']     = (st - dc + i8.where(i8 > 0, 0) + i3.where(i3 > 0, 0)).round(2)
+    df.loc[mask_ig, '_sub1'] = (st - dc)[mask_ig].round(2)
     # sub0: gasolina con IEPS → solo iva0 (iva_ex es el mismo valor, no duplicar)
-    df_full['_sub0'] = (df_full[C['iva0']] + df_full[C['iva_ex']]).round(2)
-    df_full.loc[mask_ig, '_sub0'] = df_full.loc[mask_ig, C['iva0']].round(2)
-    df_full['_sub2']     = (df_full['_sub1'] - df_full['_sub0']).round(2)
-    df_full['_iva_acred']= (df_full['_sub2'] * 0.16).round(2)
-    df_full['_iva_ok']   = (df_full['_iva_acred'] - df_full[C['iva16']]).abs() < 0.01
-
-    df_full['Deducible']          = df_full['_deducible']
-    df_full['Razón No Deducible'] = df_full['_razon']
-
-    # ── CRÍTICO: agregar columnas de cálculo al df ANTES de to_excel() ──
-    df_full['SUB1-16%']            = df_full['_sub1']
-    df_full['SUB0%']               = df_full['_sub0']
-    df_full['SUB2-16%']            = df_full['_sub2']
-    df_full['IVA ACREDITABLE 16%'] = df_full['_iva_acred']
-    iva16_s = df_full[C['iva16']].fillna(0).astype(float)
-    df_full['C IVA']               = (df_full['_iva_acred'] - iva16_s).round(2)
-    df_full['T2']                  = (df_full['_sub2'] + df_full['_sub0'] + iva16_s).round(2)
-    df_full['Comprobación T2']     = (df_full[C['total']].fillna(0).astype(float) - df_full['T2']).round(2)
-
-    # Guardar base con pandas
-    cols_int  = [c for c in df_full.columns if c.startswith('_')]
-    df_salida = df_full.drop(columns=cols_int)
-    df_salida.to_excel(output_path, index=False)
-    print("  ✅ Datos base guardados")
-
-    # ── PASO 2: openpyxl escribe fórmulas + colores POR BLOQUES ──
-    # Aquí está el ahorro de RAM: se escribe un bloque a la vez
-    # y se libera antes de cargar el siguiente.
-    print("  🎨 Aplicando fórmulas auditables y colores por bloques...")
-
-    wb    = openpyxl.load_workbook(output_path)
-    sheet = wb.active
-    wb.calculation.fullCalcOnLoad = False
-
-    hmap = {str(c.value).strip().lower(): c.column
-            for c in sheet[1] if c.value}
-    def fc(n): return hmap.get(n.strip().lower())
-
-    # Encabezados de columnas de cálculo
-    calc_names = ['SUB1-16%','SUB0%','SUB2-16%',
-                  'IVA ACREDITABLE 16%','C IVA','T2','Comprobación T2']
-    for n in calc_names:
-        c = fc(n)
-        if c:
-            sh = sheet.cell(1, c)
-            sh.fill      = blue_fill
-            sh.alignment = center_align
-    c_ded   = fc('Deducible')
-    c_razon = fc('Razón No Deducible')
-    if c_ded:   sheet.cell(1, c_ded).fill   = blue_fill
-    if c_razon: sheet.cell(1, c_razon).fill = red_fill
-
-    # Cache de columnas
-    c_sub1 = fc('SUB1-16%');   c_sub0 = fc('SUB0%')
-    c_sub2 = fc('SUB2-16%');   c_iva_a= fc('IVA ACREDITABLE 16%')
-    c_civa = fc('C IVA');      c_t2   = fc('T2')
-    c_comp = fc('Comprobación T2')
-    c_i16  = fc('IVA Trasladado 16%')
-    c_uso  = fc('Uso CFDI');   c_reg  = fc('Regimen receptor')
-    c_rem  = fc('Razon emisor'); c_conc = fc('Conceptos')
-    c_form = fc('Forma pago'); c_ef   = fc('Efecto')
-
-    CL = {}
-    for key, col_name in {
-        'ST':'SubTotal','DC':'Descuento','I16':'IVA Trasladado 16%',
-        'I0':'IVA Trasladado 0%','IE':'IVA Exento','TOT':'Total',
-        'S1':'SUB1-16%','S0':'SUB0%','S2':'SUB2-16%',
-        'IA':'IVA ACREDITABLE 16%','T2':'T2',
-    }.items():
-        c = fc(col_name)
-        if c: CL[key] = get_column_letter(c)
-    c_i8_col = fc('IEPS Trasladado 8%')
-    if c_i8_col: CL['I8'] = get_column_letter(c_i8_col)
-    c_i3_col = fc('IEPS Trasladado 3%')
-    if c_i3_col: CL['I3'] = get_column_letter(c_i3_col)
-
-    # Cache fórmulas y wf() definidos UNA VEZ fuera de todos los loops
-    _cache_formulas = {}
-
-    def wf(col, formula, num_val):
-        if col:
-            c = sheet.cell(rn, col, formula)
-            c.number_format = "0.00"
-            c.font = Font(bold=True)
-            _cache_formulas[f'{get_column_letter(col)}{rn}'] = num_val
-
-    # ── PROCESAR POR BLOQUES ──────────────────────────────────────
-    for n_bloque in range(bloques):
-        inicio = n_bloque * chunk_size
-        fin    = min(inicio + chunk_size, total_filas)
-        chunk  = df_full.iloc[inicio:fin]
-
-        print(f"  📦 Bloque {n_bloque+1}/{bloques}: "
-              f"filas {inicio+1:,}-{fin:,} ({fin/total_filas*100:.0f}%)")
-
-        for local_idx, (_, row_df) in enumerate(chunk.iterrows()):
-            rn = inicio + local_idx + 2   # +2 por encabezado Excel
-
-            reg_val  = str(row_df.get('_regimen',''))
-            uso_val  = str(row_df.get('_uso',''))
-            forma_val= str(row_df.get('_forma',''))
-            es_gas_v = bool(row_df.get('_es_gas', False))
-            es_ins_v = bool(row_df.get('_es_insumo', False))
-            es_dul_v = bool(row_df.get('_es_dulce', False))
-            agrup_v  = bool(row_df.get('_agrupada', False))
-            iva_ok_v = bool(row_df.get('_iva_ok', False))
-            ded_val  = str(row_df.get('_deducible','NO'))
-            total_v  = float(row_df.get(C['total'], 0) or 0)
-            i8_v     = float(row_df.get(c_ieps8, 0) or 0) if c_ieps8 else 0
-            i3_v     = float(row_df.get(c_ieps3, 0) or 0) if c_ieps3 else 0
-            es_ded   = (ded_val == 'SI')
-
-            # ══════════════════════════════════════════════════════
-            # FÓRMULAS AUDITABLES — escritas como fórmulas Excel vivas
-            # sub1 = subtotal - descuento
-            # sub0 = iva0 + iva_exento
-            # sub2 = sub1 - sub0
-            # iva_acred = sub2 * 0.16
-            # Al pararse en la celda se ve la operación completa
-            # ══════════════════════════════════════════════════════
-            fa = formulas_auditables(rn, CL)
-
-            # sub0: gasolina con IEPS → sub0_gas (solo iva0, no duplicar iva_ex)
-            ieps_g_v  = float(row_df.get(c_ieps_g,  0) or 0) if c_ieps_g  else 0
-            ieps_nd_v = float(row_df.get(c_ieps_nd, 0) or 0) if c_ieps_nd else 0
-            f_sub0 = fa['sub0_gas'] if (es_gas_v and (ieps_g_v > 0 or ieps_nd_v > 0)) else fa['sub0']
-
-            # Valores numéricos ya calculados en el DataFrame
-            v_sub1      = float(row_df.get('_sub1',      0) or 0)
-            v_sub0      = float(row_df.get('_sub0',      0) or 0)
-            v_sub2      = float(row_df.get('_sub2',      0) or 0)
-            v_iva_acred = float(row_df.get('_iva_acred', 0) or 0)
-            iva16_v     = float(row_df.get(C['iva16'],   0) or 0)
-            v_c_iva     = round(v_iva_acred - iva16_v, 2)
-            v_t2        = round(v_sub2 + v_sub0 + iva16_v, 2)
-            v_comprob   = round(total_v - v_t2, 2)
-
-            if i8_v > 0:
-                f_sub1 = fa['sub1_ieps8']
-            elif i3_v > 0:
-                f_sub1 = fa['sub1_ieps3']
-            else:
-                f_sub1 = fa['sub1']
-            wf(c_sub1, f_sub1,           v_sub1)
-            wf(c_sub0, f_sub0,           v_sub0)
-            wf(c_sub2, fa['sub2'],       v_sub2)
-            wf(c_iva_a, fa['iva_acred'], v_iva_acred)
-            wf(c_civa,  fa['c_iva'],     v_c_iva)
-            wf(c_t2,    fa['t2'],        v_t2)
-            wf(c_comp,  fa['comprob'],   v_comprob)
-
-            # Validación IVA
-            if c_i16 and c_iva_a and iva_ok_v:
-                sheet.cell(rn, c_i16).fill   = green_fill
-                sheet.cell(rn, c_iva_a).fill = green_fill
-
-            # Colores
-            if c_reg: sheet.cell(rn, c_reg).fill = REG_FILLS.get(reg_val, orange_fill)
-            if c_rem and reg_val not in REG_FILLS: sheet.cell(rn, c_rem).fill = orange_fill
-
-            if c_uso:
-                uso_raw = str(df_full.iloc[inicio + local_idx].get('Uso CFDI',''))
-                if uso_raw.strip() == USO_CFDI_VERDE: sheet.cell(rn, c_uso).fill = green_fill
-                if uso_val == 'S01': sheet.cell(rn, c_uso).fill = red_fill
-
-            if c_conc:
-                if es_dul_v and i8_v > 0:  sheet.cell(rn, c_conc).fill = pink_fill
-                elif es_gas_v:
-                    ieps_g_v  = float(row_df.get(c_ieps_g,  0) or 0) if c_ieps_g  else 0
-                    ieps_nd_v2= float(row_df.get(c_ieps_nd, 0) or 0) if c_ieps_nd else 0
-                    sheet.cell(rn, c_conc).fill = blue_fill if (ieps_g_v > 0 or ieps_nd_v2 > 0) else orange_fill
-                elif es_ins_v:
-                    sheet.cell(rn, c_conc).fill = (
-                        red_fill    if forma_val=='01' and total_v > LIMITE_EFECTIVO else
-                        yellow_fill if forma_val=='01' else lime_fill)
-
-            if c_form:
-                if es_gas_v and forma_val == '01':
-                    sheet.cell(rn, c_form).fill = (
-                        yellow_fill if reg_val=='626' and (total_v<=LIMITE_EFECTIVO or agrup_v)
-                        else red_fill)
-                elif es_ins_v and forma_val == '01':
-                    sheet.cell(rn, c_form).fill = (
-                        red_fill if total_v > LIMITE_EFECTIVO else yellow_fill)
-
-            if c_ef and not es_ded and forma_val=='01' and total_v > LIMITE_EFECTIVO:
-                sheet.cell(rn, c_ef).fill = red_fill
-
-            if c_ded:
-                es_egreso = False
-                if c_ef:
-                    ev = sheet.cell(rn, c_ef).value
-                    if ev and str(ev).strip().upper() in {'EGRESO', 'E'}:
-                        es_egreso = True
-                dc_cell          = sheet.cell(rn, c_ded, value=ded_val)
-                dc_cell.fill     = (blue_fill if es_egreso else green_fill) if es_ded else red_fill
-                dc_cell.font     = bold_white
-                dc_cell.alignment= center_align
-
-            if c_razon:
-                rc = sheet.cell(rn, c_razon)
-                if ded_val == 'NO':
-                    rc.fill = red_fill;    rc.font = bold_white
-                elif rc.value and rc.value != 'Cumple requisitos':
-                    rc.fill = yellow_fill; rc.font = bold_black
-                else:
-                    rc.fill = green_fill;  rc.font = Font(color='006100')
-
-        # Guardar parcialmente cada bloque y liberar chunk de memoria
-        del chunk
-        print(f"    ✅ Bloque {n_bloque+1} escrito — guardando...")
-        wb.save(output_path)
-
-    # Anchos finales
-    if c_razon: sheet.column_dimensions[get_column_letter(c_razon)].width = 65
-    for n in calc_names + ['Deducible']:
-        c = fc(n)
-        if c: sheet.column_dimensions[get_column_letter(c)].width = 15
-
-    wb.save(output_path)
-    print(f"  🔧 Insertando valores cacheados ({len(_cache_formulas):,} celdas)...")
-    _parchear_cache_formulas(output_path, _cache_formulas)
-    print(f"  ✅ Procesamiento por chunks completado: {output_path}")
+    df['_sub0'] = (df[C['iva0']] + df[C['iva_ex']]).round(2)
+    df.loc[mask_ig, '_sub0'] = df.loc[mask_ig, C['iva0']].round(2)
+    df['_sub2']     = (df['_sub1'] - df['_sub0']).round(2)
+    df['_iva_acred']= (df['_sub2'] * 0.16).round(2)
+    df['_iva_ok']   = (df['_iva_acred'] - df[C['iva16']]).abs() < 0.01
+    df['_ieps_gas_ok'] = mask_ig
+
+    # Bool y código de razón: SalidaValidado escribe SI/NO y el texto
+    df['Deducible']          = df['_deducible']
+    df['Razón No Deducible'] = df['_razon_cod']
 
-    # Estadísticas
-    f  = df_full['_forma'].fillna('')
-    r  = df_full['_regimen'].fillna('')
-    eg = df_full['_es_gas'].fillna(False)
-    ei = df_full['_es_insumo'].fillna(False)
-    t  = df_full[C['total']].fillna(0).astype(float)
+    df['SUB1-16%']            = df['_sub1']
+    df['SUB0%']               = df['_sub0']
+    df['SUB2-16%']            = df['_sub2']
+    df['IVA ACREDITABLE 16%'] = df['_iva_acred']
+    iva16_s = df[C['iva16']].fillna(0).astype(float)
+    df['C IVA']               = (df['_iva_acred'] - iva16_s).round(2)
+    df['T2']                  = (df['_sub2'] + df['_sub0'] + iva16_s).round(2)
+    df['Comprobación T2']     = (df[C['total']].fillna(0).astype(float) - df['T2']).round(2)
 
+    cols_ieps = {'i8': c_ieps8, 'ig': c_ieps_g, 'ind': c_ieps_nd, 'i3': c_ieps3}
+    return df, C, cols_ieps, mask_ig, unicos
+
+
+CLAVES_STATS = ['dulces_ieps8','dulces_sin','gas_ieps','gas_sin',
+                'gas_626','gas_626_agrup','gas_612','gas_elec',
+                'ins_nd','ins_menor','ins_elec','s01','ef_mayor']
+
+
+def _bits_stats(df: pd.DataFrame, C: dict, cols_ieps: dict,
+                mask_ig: pd.Series) -> np.ndarray:
+    """
+    Aportación de cada fila a las estadísticas: bit k = CLAVES_STATS[k].
+    Se guarda en el índice incremental para sumar filas reutilizadas
+    sin volver a evaluarlas.
+    """
+    f  = df['_forma'].fillna('')
+    r  = df['_regimen'].fillna('')
+    eg = df['_es_gas'].fillna(False)
+    ei = df['_es_insumo'].fillna(False)
+    t  = df[C['total']].fillna(0).astype(float)
+    i8 = df[cols_ieps['i8']] if cols_ieps['i8'] else pd.Series(0, index=df.index)
+
+    mascaras = {
+        'dulces_ieps8': df['_es_dulce'] & (i8 > 0),
+        'dulces_sin':   df['_es_dulce'] & (i8 == 0),
+        'gas_ieps':     mask_ig,
+        'gas_sin':      eg & ~mask_ig,
+        'gas_626':      eg & (f=='01') & (r=='626'),
+        'gas_626_agrup':df['_agrupada'],
+        'gas_612':      eg & (f=='01') & (r=='612'),
+        'gas_elec':     eg & (f!='01'),
+        'ins_nd':       ei & ~eg & (f=='01') & (t>LIMITE_EFECTIVO),
+        'ins_menor':    ei & ~eg & (f=='01') & (t<=LIMITE_EFECTIVO),
+        'ins_elec':     ei & ~eg & f.isin(FORMAS_ELECTRONICAS),
+        's01':          df['_uso']=='S01',
+        'ef_mayor':     ~eg & ~ei & (f=='01') & (t>LIMITE_EFECTIVO),
+    }
+    bits = np.zeros(len(df), dtype=np.uint16)
+    for k, clave in enumerate(CLAVES_STATS):
+        bits |= mascaras[clave].to_numpy(dtype=bool).astype(np.uint16) << k
+    return bits
+
+
+def _sumar_stats(stats: dict, bits: np.ndarray, regimenes: list) -> None:
+    """Suma las estadísticas de un bloque al acumulado global."""
+    for reg, cnt in pd.Series(regimenes, dtype=object).fillna('').value_counts().items():
+        stats['regimenes'][reg] = stats['regimenes'].get(reg, 0) + int(cnt)
+    for k, clave in enumerate(CLAVES_STATS):
+        stats[clave] += int(((bits >> k) & 1).sum())
+
+
+VERSION_AVANCE = 2      # 2: huellas por bloque en .npz (antes .pkl)
+
+
+def _firma_origen(file_path: str, chunk_size: int) -> dict:
+    """
+    Identifica la corrida: mismo origen (tamaño + mtime) y mismo bloque.
+    Si el origen es una carpeta (XML), suma tamaños y toma el mtime mayor.
+    """
+    if os.path.isdir(file_path):
+        tamano, mtime, n = 0, 0, 0
+        for raiz, _, archivos in os.walk(file_path):
+            for nombre in archivos:
+                st = os.stat(os.path.join(raiz, nombre))
+                tamano += st.st_size
+                mtime   = max(mtime, st.st_mtime_ns)
+                n      += 1
+        tamano = [n, tamano]   # lista: se compara contra el JSON
+    else:
+        st = os.stat(file_path)
+        tamano, mtime = st.st_size, st.st_mtime_ns
     return {
-        'regimenes':    r.value_counts().to_dict(),
-        'dulces_ieps8': int((df_full['_es_dulce'] & (i8 > 0)).sum()),
-        'dulces_sin':   int((df_full['_es_dulce'] & (i8 == 0)).sum()),
-        'gas_ieps':     int(mask_ig.sum()),
-        'gas_sin':      int((eg & ~mask_ig).sum()),
-        'gas_626':      int((eg & (f=='01') & (r=='626')).sum()),
-        'gas_626_agrup':int(df_full['_agrupada'].sum()),
-        'gas_612':      int((eg & (f=='01') & (r=='612')).sum()),
-        'gas_elec':     int((eg & (f!='01')).sum()),
-        'ins_nd':       int((ei & ~eg & (f=='01') & (t>LIMITE_EFECTIVO)).sum()),
-        'ins_menor':    int((ei & ~eg & (f=='01') & (t<=LIMITE_EFECTIVO)).sum()),
-        'ins_elec':     int((ei & ~eg & f.isin(FORMAS_ELECTRONICAS)).sum()),
-        's01':          int((df_full['_uso']=='S01').sum()),
-        'ef_mayor':     int((~eg & ~ei & (f=='01') & (t>LIMITE_EFECTIVO)).sum()),
+        'version':    VERSION_AVANCE,
+        'origen':     os.path.abspath(file_path),
+        'tamano':     tamano,
+        'mtime':      mtime,
+        'chunk_size': chunk_size,
     }
+
+
+def _leer_avance(dir_bloques: str, firma: dict):
+    """Retorna el avance guardado si corresponde a la misma corrida, o None."""
+    try:
+        with open(os.path.join(dir_bloques, 'avance.json'), encoding='utf-8') as f:
+            avance = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if avance.get('firma') != firma:
+        return None
+    if not all(os.path.isfile(os.path.join(dir_bloques, b)) for b in avance['bloques']):
+        return None
+    return avance
+
+
+def _guardar_avance(dir_bloques: str, avance: dict) -> None:
+    """Escritura atómica: un corte a medias deja el avance anterior intacto."""
+    ruta = os.path.join(dir_bloques, 'avance.json')
+    tmp  = ruta + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(avance, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, ruta)
+
+
+def _escribir_bloque(salida: SalidaValidado, indice: IndiceIncremental,
+                     chunk, C, cols_ieps, previas: list) -> None:
+    """
+    Escribe las filas del bloque en su orden original: las reutilizadas
+    se copian del _validado.xlsx anterior y las evaluadas (chunk, en el
+    mismo orden) se escriben por tramos consecutivos.
+    """
+    n, i, j = len(previas), 0, 0
+    while i < n:
+        k = i
+        if previas[i] is None:
+            while k < n and previas[k] is None:
+                k += 1
+            salida.escribir(chunk.iloc[j:j + k - i], C, cols_ieps)
+            j += k - i
+        else:
+            while k < n and previas[k] is not None:
+                salida.escribir_previa(indice, previas[k])
+                k += 1
+        i = k
+
+
+def _guardar_huellas(dir_bloques: str, n_bloque: int, pieza: pd.DataFrame) -> None:
+    guardar_tabla_huellas(os.path.join(dir_bloques, 'huellas_%05d.npz' % n_bloque), pieza)
+
+
+def _leer_huellas(dir_bloques: str, n_bloques: int) -> list:
+    return [leer_tabla_huellas(os.path.join(dir_bloques, 'huellas_%05d.npz' % n))[1]
+            for n in range(n_bloques)]
+
+
+def procesar_con_chunks(file_path: str, output_path: str,
+                        chunk_size: int = 5000, lector=None,
+                        procesos: int = 1) -> ResultadoValidacion:
+    """
+    Procesa el archivo Excel en bloques de chunk_size filas.
+    RAM constante independientemente del tamaño del archivo:
+    cada bloque se lee, valida y escribe antes de leer el siguiente.
+
+    lector(file_path, chunk_size) → generador de DataFrames con las
+    columnas de la exportación. Por defecto: el de la extensión
+    (xlsx, csv, parquet, arrow — ver models/lectores.py).
+
+    Si existe el índice de huellas de una corrida anterior
+    (ver incremental.py), solo se evalúan las filas nuevas o modificadas.
+
+    procesos > 1 → cada bloque se prepara en fragmentos en paralelo.
+
+    Retorna ResultadoValidacion: stats + columnas del Paso 3 en memoria
+    (sin tabla si hubo filas reutilizadas o la corrida se reanudó).
+    """
+    lector = lector or con_cache(obtener_lector(file_path)).leer_bloques
+
+    print(f"  📦 Motor: pandas CHUNKS (bloques de {chunk_size:,} filas)")
+    preparar = _preparar_bloque
+    paralelo = None
+    if procesos > 1:
+        from models.motores.clasificacion_paralela import ClasificadorParalelo
+        paralelo = ClasificadorParalelo(procesos)
+        preparar = paralelo.preparar
+        print(f"  ⚙️  Clasificación en paralelo: {procesos} procesos")
+
+    dir_bloques = output_path + '.partes'
+    firma       = _firma_origen(file_path, chunk_size)
+    avance      = _leer_avance(dir_bloques, firma)
+
+    if avance:
+        stats = avance['stats']
+        print(f"  ♻️  Reanudando: {avance['filas']:,} filas ya validadas "
+              f"({len(avance['bloques']) - 1} bloques)")
+    else:
+        shutil.rmtree(dir_bloques, ignore_errors=True)
+        stats = {k: 0 for k in CLAVES_STATS}
+        stats['regimenes'] = {}
+    # Dedup de conceptos (solo filas evaluadas; únicos contados por bloque)
+    stats.setdefault('conceptos_filas', 0)
+    stats.setdefault('conceptos_unicos', 0)
+
+    def reabrir():
+        # filas_previas incluye el encabezado (fragmento 0)
+        return SalidaValidado(output_path, avance['columnas'], dir_bloques,
+                              avance['bloques'], avance['filas'] + 1)
+
+    indice      = IndiceIncremental(output_path)
+    salida      = None
+    total_filas = 0
+    n_bloques   = 0
+    evaluadas   = 0
+    hechos      = len(avance['bloques']) - 1 if avance else 0
+
+    # ── PROCESAR POR BLOQUES (lectura y escritura en streaming) ───
+    print("  📂 Leyendo origen en streaming...")
+    try:
+        for n_bloque, bloque in enumerate(lector(file_path, chunk_size)):
+            inicio = total_filas
+            total_filas += len(bloque)
+            n_bloques    = n_bloque + 1
+
+            # Emparejar SIEMPRE (también en bloques ya hechos): el
+            # recorrido del _validado.xlsx anterior es hacia adelante
+            if n_bloque == 0:
+                indice.preparar(list(bloque.columns))
+            huellas = huellas_filas(bloque)
+            uuids   = uuids_filas(bloque)
+            previas = indice.emparejar(uuids, huellas)
+
+            # Bloque ya fijado en una corrida anterior → no se repite
+            if n_bloque < hechos:
+                continue
+
+            if salida is None and avance:
+                salida = reabrir()
+
+            nuevas = [i for i, p in enumerate(previas) if p is None]
+            chunk = C = cols_ieps = None
+            if nuevas:
+                chunk, C, cols_ieps, mask_ig, unicos = preparar(
+                    bloque if len(nuevas) == len(bloque) else bloque.iloc[nuevas])
+                stats['conceptos_filas']  += len(nuevas)
+                stats['conceptos_unicos'] += unicos
+            del bloque
+            evaluadas += len(nuevas)
+
+            print(f"  📦 Bloque {n_bloque+1}: filas {inicio+1:,}-{total_filas:,}"
+                  + (f" ({len(nuevas):,} a evaluar)" if indice.activo else ""))
+
+            # Primer bloque: define columnas, anchos y encabezados
+            if salida is None:
+                columnas = [c for c in chunk.columns if not c.startswith('_')] \
+                           if chunk is not None else indice.columnas_salida
+                salida = SalidaValidado(output_path, columnas, dir_bloques)
+                avance = {'firma': firma, 'columnas': columnas,
+                          'bloques': [salida.cerrar_bloque()], 'filas': 0}
+
+            _escribir_bloque(salida, indice, chunk, C, cols_ieps, previas)
+
+            # Estadísticas e índice del bloque (evaluadas + reutilizadas)
+            bits      = np.zeros(len(previas), dtype=np.uint16)
+            regimenes = [''] * len(previas)
+            if nuevas:
+                bits[nuevas] = _bits_stats(chunk, C, cols_ieps, mask_ig)
+                for i, reg in zip(nuevas, chunk['_regimen'].tolist()):
+                    regimenes[i] = reg
+            reusadas = [i for i, p in enumerate(previas) if p is not None]
+            if reusadas:
+                bits_p, regs_p = indice.previos([previas[i] for i in reusadas])
+                bits[reusadas] = bits_p
+                for i, reg in zip(reusadas, regs_p):
+                    regimenes[i] = reg
+            _sumar_stats(stats, bits, regimenes)
+            _guardar_huellas(dir_bloques, n_bloque, pd.DataFrame({
+                'uuid': uuids, 'huella': huellas,
+                'fila': np.arange(inicio + 2, total_filas + 2, dtype=np.int64),
+                'regimen': regimenes, 'bits': bits}))
+
+            # Punto de control: fragmento durable + avance
+            avance['bloques'].append(salida.cerrar_bloque())
+            avance['filas'] = total_filas
+            avance['stats'] = stats
+            _guardar_avance(dir_bloques, avance)
+
+            # Bloque escrito → liberar antes de leer el siguiente
+            del chunk
+            print(f"    ✅ Bloque {n_bloque+1} escrito")
+
+        if salida is None:
+            salida = reabrir() if avance else \
+                     SalidaValidado(output_path, ['Sin datos'], dir_bloques)
+    except BaseException:
+        indice.cerrar()
+        if paralelo:
+            paralelo.cerrar()
+        guardar_cache_conceptos()
+        if salida is not None:
+            salida.descartar()
+            print(f"  💾 Avance guardado en {dir_bloques} — se reanudará en la próxima ejecución")
+        raise
+
+    indice.cerrar()
+    if paralelo:
+        paralelo.cerrar()
+    salida.cerrar()
+    guardar_cache_conceptos()
+    indice.guardar(_leer_huellas(dir_bloques, n_bloques), salida.out_cols)
+    shutil.rmtree(dir_bloques, ignore_errors=True)
+
+    if indice.activo:
+        print(f"  ♻️  {indice.reusadas:,} filas reutilizadas, {evaluadas:,} evaluadas")
+    print(f"  ✅ {total_filas:,} filas procesadas")
+    print(f"  ✅ Procesamiento por chunks completado: {output_path}")
+
+    return ResultadoValidacion(stats, salida.tabla)
@@ -0,0 +1,293 @@
+"""
+salida_validado.py — Formato del _validado.xlsx para los motores pandas
+ReaDesF1.9
+
+Escribe encabezados, FÓRMULAS AUDITABLES (con valor cacheado) y colores
+de un DataFrame ya evaluado, directo a un EscritorXlsx en una sola pasada.
+Lo comparten motor_pandas (un solo bloque) y motor_chunks (N bloques).
+
+Columnas internas requeridas en el DataFrame:
+  _regimen, _uso, _forma, _es_gas, _es_insumo, _es_dulce, _agrupada,
+  _iva_ok, _ieps_gas_ok, _deducible, _razon_cod, _metodo,
+  _sub1, _sub0, _sub2, _iva_acred
+
+'Deducible' y 'Razón No Deducible' se materializan aquí (SI/NO y texto
+de RAZONES_DEDUCIBILIDAD), no en el motor: el texto se arma una vez por
+código de razón distinto del bloque.
+
+.tabla: las columnas que lee el Paso 3, guardadas al escribir (ver
+models/resultado_validacion.py). None si alguna fila no pasó por
+escribir() (filas copiadas de la corrida anterior o ya escritas antes
+de reanudar).
+"""
+
+import pandas as pd
+
+from models.escritor_xlsx import EscritorXlsx, CeldaFormula, letra_columna
+from models.esquema_columnas import compilar_esquema
+from models.resultado_validacion import TablaValidado
+from models.validaciones_fiscales import (
+    formulas_auditables, razones_deducibilidad, USO_CFDI_VERDE, LIMITE_EFECTIVO
+)
+
+# Paleta — mismos colores que motor_openpyxl
+AZUL    = '00B0F0'
+VERDE   = '00FF00'
+ROJO    = 'FF0000'
+MORADO  = '800080'
+NARANJA = 'FFA500'
+AMARILLO= 'FFFF00'
+ROSA    = 'FF69B4'
+CAFE    = '8B4513'
+LIMA    = '90EE90'
+BLANCO  = 'FFFFFF'
+
+CALC_NAMES = ['SUB1-16%','SUB0%','SUB2-16%',
+              'IVA ACREDITABLE 16%','C IVA','T2','Comprobación T2']
+
+
+def _col(df: pd.DataFrame, nombre, defecto):
+    if nombre and nombre in df.columns:
+        return df[nombre].tolist()
+    return [defecto] * len(df)
+
+
+def _num(lista):
+    return [float(v) if v is not None and v == v else 0.0 for v in lista]
+
+
+class SalidaValidado:
+    """
+    Layout del _validado.xlsx sobre un EscritorXlsx.
+    out_cols = columnas visibles, en orden (sin las internas '_...').
+
+    Con dir_bloques escribe por fragmentos (ver EscritorXlsx); al
+    reanudar (filas_previas > 0) el encabezado ya está en el primer
+    fragmento y no se repite.
+    """
+
+    def __init__(self, output_path: str, out_cols: list,
+                 dir_bloques: str = None, bloques_previos: list = None,
+                 filas_previas: int = 0):
+        self.out_cols = list(out_cols)
+        self.tabla    = None if filas_previas else TablaValidado(self.out_cols)
+        esquema = compilar_esquema(self.out_cols)
+        def fc(n):
+            i = esquema.indice(n)
+            return i + 1 if i is not None else None
+        self.fc = fc
+
+        self.c_sub1 = fc('SUB1-16%');   self.c_sub0 = fc('SUB0%')
+        self.c_sub2 = fc('SUB2-16%');   self.c_iva_a= fc('IVA ACREDITABLE 16%')
+        self.c_civa = fc('C IVA');      self.c_t2   = fc('T2')
+        self.c_comp = fc('Comprobación T2')
+        self.c_i16  = fc('IVA Trasladado 16%')
+        self.c_uso  = fc('Uso CFDI');   self.c_reg  = fc('Regimen receptor')
+        self.c_rem  = fc('Razon emisor'); self.c_conc = fc('Conceptos')
+        self.c_form = fc('Forma pago'); self.c_ef   = fc('Efecto')
+        self.c_ded   = fc('Deducible')
+        self.c_razon = fc('Razón No Deducible')
+
+        # Cache letras para fórmulas
+        CL = {}
+        for key, col_name in {
+            'ST':'SubTotal','DC':'Descuento','I16':'IVA Trasladado 16%',
+            'I0':'IVA Trasladado 0%','IE':'IVA Exento','TOT':'Total',
+            'S1':'SUB1-16%','S0':'SUB0%','S2':'SUB2-16%',
+            'IA':'IVA ACREDITABLE 16%','T2':'T2',
+            'I8':'IEPS Trasladado 8%','I3':'IEPS Trasladado 3%',
+        }.items():
+            c = fc(col_name)
+            if c: CL[key] = letra_columna(c)
+        self.CL = CL
+
+        anchos = {}
+        if self.c_razon: anchos[self.c_razon] = 65
+        for n in CALC_NAMES + ['Deducible']:
+            c = fc(n)
+            if c: anchos[c] = 15
+
+        self.escritor = w = EscritorXlsx(
+            output_path, anchos=anchos, dir_bloques=dir_bloques,
+            bloques_previos=bloques_previos, filas_previas=filas_previas)
+
+        # Estilos registrados UNA vez
+        self.st_formula    = w.estilo(negrita=True, formato='0.00')
+        self.st_formula_ok = w.estilo(negrita=True, formato='0.00', relleno=VERDE)
+        self.st_fill    = {h: w.estilo(relleno=h) for h in
+                           (AZUL, VERDE, ROJO, MORADO, NARANJA, AMARILLO, ROSA, CAFE, LIMA)}
+        self.st_reg     = {'626': self.st_fill[AZUL],
+                           '612': self.st_fill[MORADO], '616': self.st_fill[CAFE]}
+        self.st_ded     = {
+            'egreso': w.estilo(relleno=AZUL,  negrita=True, color_fuente=BLANCO, centrado=True),
+            'si':     w.estilo(relleno=VERDE, negrita=True, color_fuente=BLANCO, centrado=True),
+            'no':     w.estilo(relleno=ROJO,  negrita=True, color_fuente=BLANCO, centrado=True),
+        }
+        self.st_razon   = {
+            'no':     w.estilo(relleno=ROJO,     negrita=True, color_fuente=BLANCO),
+            'nota':   w.estilo(relleno=AMARILLO, negrita=True),
+            'ok':     w.estilo(relleno=VERDE,    color_fuente='006100'),
+        }
+
+        # Encabezados (el estilo se registra aunque se reanude: el
+        # encabezado del fragmento 0 lo referencia en styles.xml)
+        st_calc = w.estilo(relleno=AZUL, centrado=True)
+        if filas_previas:
+            return
+        est = {}
+        for n in CALC_NAMES:
+            c = fc(n)
+            if c: est[c] = st_calc
+        if self.c_ded:   est[self.c_ded]   = st_calc
+        if self.c_razon: est[self.c_razon] = self.st_fill[ROJO]
+        w.escribir_fila(self.out_cols, estilos=est)
+
+    def escribir(self, df: pd.DataFrame, C: dict, cols_ieps: dict) -> None:
+        """Escribe todas las filas de df (ya evaluado) con fórmulas y colores."""
+        w  = self.escritor
+        CL = self.CL
+        fill = self.st_fill
+
+        salida = df[self.out_cols].astype(object)
+        salida = salida.where(salida.notna(), None)
+
+        deds  = df['_deducible'].astype(bool).tolist()
+        cods  = df['_razon_cod'].tolist()
+        if self.c_ded:
+            salida.isetitem(self.c_ded - 1, ['SI' if d else 'NO' for d in deds])
+        if self.c_razon:
+            salida.isetitem(self.c_razon - 1, razones_deducibilidad(df))
+        if self.tabla is not None:
+            self.tabla.agregar(salida, df)
+
+        regs   = df['_regimen'].astype(str).tolist()
+        usos   = df['_uso'].astype(str).tolist()
+        formas = df['_forma'].astype(str).tolist()
+        gas    = df['_es_gas'].astype(bool).tolist()
+        ins    = df['_es_insumo'].astype(bool).tolist()
+        dul    = df['_es_dulce'].astype(bool).tolist()
+        agr    = df['_agrupada'].astype(bool).tolist()
+        iva_ok = df['_iva_ok'].astype(bool).tolist()
+        ig_ok  = df['_ieps_gas_ok'].astype(bool).tolist()
+        tots   = _num(df[C['total']].tolist())
+        iva16s = _num(df[C['iva16']].tolist())
+        i8s    = _num(_col(df, cols_ieps.get('i8'), 0))
+        i3s    = _num(_col(df, cols_ieps.get('i3'), 0))
+        s1s    = _num(df['_sub1'].tolist())
+        s0s    = _num(df['_sub0'].tolist())
+        s2s    = _num(df['_sub2'].tolist())
+        ias    = _num(df['_iva_acred'].tolist())
+
+        for i, fila in enumerate(salida.itertuples(index=False, name=None)):
+            valores = list(fila)
+            rn  = w.fila_actual + 1
+            est = {}
+            reg_val, forma_val = regs[i], formas[i]
+            es_gas_v, es_ins_v = gas[i], ins[i]
+            total_v = tots[i]
+            es_ded  = deds[i]
+
+            # ══════════════════════════════════════════════════════
+            # FÓRMULAS AUDITABLES — fórmula viva + valor cacheado
+            # sub1 = subtotal - descuento
+            # sub0 = iva0 + iva_exento
+            # sub2 = sub1 - sub0
+            # iva_acred = sub2 * 0.16
+            # ══════════════════════════════════════════════════════
+            fa = formulas_auditables(rn, CL)
+            f_sub0 = fa['sub0_gas'] if ig_ok[i] else fa['sub0']
+            if i8s[i] > 0:
+                f_sub1 = fa['sub1_ieps8']
+            elif i3s[i] > 0:
+                f_sub1 = fa['sub1_ieps3']
+            else:
+                f_sub1 = fa['sub1']
+
+            v_sub0, v_sub2, iva16_v = s0s[i], s2s[i], iva16s[i]
+            v_t2 = round(v_sub2 + v_sub0 + iva16_v, 2)
+            for col, formula, valor in (
+                    (self.c_sub1,  f_sub1,          s1s[i]),
+                    (self.c_sub0,  f_sub0,          v_sub0),
+                    (self.c_sub2,  fa['sub2'],      v_sub2),
+                    (self.c_iva_a, fa['iva_acred'], ias[i]),
+                    (self.c_civa,  fa['c_iva'],     round(ias[i] - iva16_v, 2)),
+                    (self.c_t2,    fa['t2'],        v_t2),
+                    (self.c_comp,  fa['comprob'],   round(total_v - v_t2, 2))):
+                if col:
+                    valores[col-1] = CeldaFormula(formula, valor)
+                    est[col] = self.st_formula
+
+            # Validación visual IVA
+            if self.c_i16 and self.c_iva_a and iva_ok[i]:
+                est[self.c_i16]   = fill[VERDE]
+                est[self.c_iva_a] = self.st_formula_ok
+
+            # Color régimen
+            if self.c_reg: est[self.c_reg] = self.st_reg.get(reg_val, fill[NARANJA])
+            if self.c_rem and reg_val not in self.st_reg: est[self.c_rem] = fill[NARANJA]
+
+            # Uso CFDI
+            if self.c_uso:
+                uso_raw = str(valores[self.c_uso-1] or '')
+                if uso_raw.strip() == USO_CFDI_VERDE: est[self.c_uso] = fill[VERDE]
+                if usos[i] == 'S01': est[self.c_uso] = fill[ROJO]
+
+            # Color concepto
+            if self.c_conc:
+                if dul[i] and i8s[i] > 0:
+                    est[self.c_conc] = fill[ROSA]
+                elif es_gas_v:
+                    est[self.c_conc] = fill[AZUL] if ig_ok[i] else fill[NARANJA]
+                elif es_ins_v:
+                    est[self.c_conc] = (
+                        fill[ROJO]     if forma_val == '01' and total_v > LIMITE_EFECTIVO else
+                        fill[AMARILLO] if forma_val == '01' else fill[LIMA])
+
+            # Color forma pago
+            if self.c_form:
+                if es_gas_v and forma_val == '01':
+                    est[self.c_form] = (
+                        fill[AMARILLO] if reg_val == '626' and (total_v <= LIMITE_EFECTIVO or agr[i])
+                        else fill[ROJO])
+                elif es_ins_v and forma_val == '01':
+                    est[self.c_form] = fill[ROJO] if total_v > LIMITE_EFECTIVO else fill[AMARILLO]
+
+            # Efecto
+            if self.c_ef and not es_ded and forma_val == '01' and total_v > LIMITE_EFECTIVO:
+                est[self.c_ef] = fill[ROJO]
+
+            # Deducible
+            if self.c_ded:
+                es_egreso = False
+                if self.c_ef:
+                    ev = valores[self.c_ef-1]
+                    if ev and str(ev).strip().upper() in {'EGRESO', 'E'}:
+                        es_egreso = True
+                est[self.c_ded] = (self.st_ded['egreso'] if es_egreso else self.st_ded['si']) \
+                                  if es_ded else self.st_ded['no']
+
+            # Razón
+            if self.c_razon:
+                if not es_ded:
+                    est[self.c_razon] = self.st_razon['no']
+                elif cods[i]:
+                    est[self.c_razon] = self.st_razon['nota']
+                else:
+                    est[self.c_razon] = self.st_razon['ok']
+
+            w.escribir_fila(valores, estilos=est)
+
+    def escribir_previa(self, indice, fila_previa: int) -> None:
+        """Copia una fila sin cambios del _validado.xlsx anterior (incremental)."""
+        w = self.escritor
+        w.escribir_xml_fila(indice.fila_xml(fila_previa, w.fila_actual + 1))
+        self.tabla = None       # esta fila solo existe en el archivo
+
+    def cerrar_bloque(self) -> str:
+        return self.escritor.cerrar_bloque()
+
+    def cerrar(self) -> None:
+        self.escritor.cerrar()
+
+    def descartar(self) -> None:
+        self.escritor.descartar()
@@ -0,0 +1,538 @@
+"""
+reglas.py — Tablas de reglas declarativas y sus tres compiladores
+ReaDesF1.9
+
+Las reglas fiscales se escriben UNA vez, como datos:
+
+  Regla('metodo_invalido', ~En('metodo', {'PUE','PPD'}), NO_DEDUCIBLE,
+        'Método {metodo} inválido')
+
+y de la misma tabla salen las tres formas de evaluarla:
+
+                        ┌─→ vectorizar()  → máscaras numpy  (pandas / chunks)
+  condiciones + texto ──┼─→ compilar()    → función Python  (openpyxl, Paso 3)
+                        └─→ excel(refs)   → fórmula Excel   (reporte)
+
+Condiciones (se combinan con &, | y ~):
+  En(campo, valores)         campo ∈ valores
+  Comparar(campo, op, valor) campo > 2000, forma == '01', ...
+  Bandera(campo)             campo booleano (es gasolina, ...)
+
+Textos: 'Forma de pago {forma} inválida' — {campo} se sustituye por el
+valor de la fila (en Excel, por la referencia de la celda).
+
+Fila a fila, cada condición y cada texto se evalúa solo con valor(fila)
+(fila = {campo: valor}); compilar() no genera código, solo envuelve esos
+valor() en una función que recibe los campos en orden.
+
+Fórmulas Excel: refs = campo → celda ('LEFT(K5,3)', 'H5'). Un campo que
+no está en la hoja va como Valor('612'): su condición se resuelve al
+generar la fórmula y las ramas que no aplican desaparecen.
+
+Dos tipos de tabla:
+  TablaReglas  → TODAS las reglas que apliquen suman razón; cualquiera
+                 con NO_DEDUCIBLE vuelve la fila no deducible (Paso 2).
+                 Vectorizada, la razón es un código uint32 (bit i =
+                 regla i) y el texto se arma al escribir:
+
+                   0b000…0100_0010 ──razones()──→ 'Método XXX inválido |
+                                                   Forma de pago 99 inválida'
+  Primera      → la PRIMERA condición que se cumple decide el texto
+                 (estatus del reporte, Paso 3)
+
+En vectorizar() cada condición atómica se calcula una sola vez por
+bloque (memo por estructura) aunque aparezca en varias reglas.
+
+nucleo() es vectorizar() sobre NumPy puro: los campos de texto que
+comparan las reglas (uso, forma, ...) llegan como códigos int8 y cada
+En()/== es una consulta a una tabla bool[código], sin hashing de
+cadenas por fila.
+"""
+
+import re
+import operator
+
+import numpy as np
+import pandas as pd
+
+NO_DEDUCIBLE = 'NO'
+NOTA         = 'NOTA'
+
+_RE_CAMPO = re.compile(r'\{(\w+)\}')
+
+_OPS    = {'>': operator.gt, '>=': operator.ge, '<': operator.lt,
+           '<=': operator.le, '==': operator.eq, '!=': operator.ne}
+_OPS_XL = {'==': '=', '!=': '<>'}
+
+
+class Valor:
+    """Dato fijo de la fila (no es celda): se evalúa al generar la fórmula."""
+
+    def __init__(self, valor):
+        self.valor = valor
+
+
+_XL_SI, _XL_NO = 'TRUE', 'FALSE'
+
+
+def _xl_bool(b) -> str:
+    return _XL_SI if b else _XL_NO
+
+
+def _literal_xl(valor) -> str:
+    if isinstance(valor, str):
+        return '"%s"' % valor.replace('"', '""')
+    if isinstance(valor, bool):
+        return 'TRUE' if valor else 'FALSE'
+    return repr(valor)
+
+
+class Contexto(dict):
+    """
+    campo → array, para nucleo(). Los campos de `vocabulario` llegan
+    como códigos int8: 0 = otro texto, i = vocabulario[campo][i-1].
+    """
+
+    def __init__(self, datos: dict, vocabulario: dict):
+        super().__init__(datos)
+        self.vocabulario = vocabulario
+
+    def tabla(self, campo: str, valores) -> np.ndarray:
+        """bool[código] → el texto del código está en `valores`."""
+        voc = self.vocabulario[campo]
+        return np.array([False] + [v in valores for v in voc], dtype=bool)
+
+    def codigo(self, campo: str, valor: str) -> int:
+        voc = self.vocabulario[campo]
+        return voc.index(valor) + 1 if valor in voc else -1
+
+
+def _codificado(ctx, campo: str) -> bool:
+    return campo in getattr(ctx, 'vocabulario', ())
+
+
+# ══════════════════════════════════════════════════════════════════
+# CONDICIONES
+# ══════════════════════════════════════════════════════════════════
+
+class Condicion:
+
+    def __and__(self, otra):  return Y(self, otra)
+    def __or__(self, otra):   return O(self, otra)
+    def __invert__(self):     return No(self)
+
+    def vector(self, ctx: dict, memo: dict) -> np.ndarray:
+        clave = self.clave()
+        if clave not in memo:
+            memo[clave] = self._vector(ctx, memo)
+        return memo[clave]
+
+    def textos(self):
+        """(campo, texto) con que compara la condición → vocabulario."""
+        return ()
+
+
+class En(Condicion):
+    def __init__(self, campo: str, valores):
+        self.campo   = campo
+        self.valores = frozenset(valores)
+
+    def clave(self):
+        return ('en', self.campo, self.valores)
+
+    def _vector(self, ctx, memo):
+        if _codificado(ctx, self.campo):
+            return ctx.tabla(self.campo, self.valores)[ctx[self.campo]]
+        return pd.Series(ctx[self.campo]).isin(self.valores).to_numpy()
+
+    def textos(self):
+        return [(self.campo, v) for v in self.valores if isinstance(v, str)]
+
+    def valor(self, fila):
+        return fila[self.campo] in self.valores
+
+    def excel(self, refs):
+        ref = refs[self.campo]
+        if isinstance(ref, Valor):
+            return _xl_bool(ref.valor in self.valores)
+        vals = sorted(self.valores)
+        if len(vals) == 1:
+            return '%s=%s' % (ref, _literal_xl(vals[0]))
+        return 'NOT(ISERROR(MATCH(%s,{%s},0)))' % (ref, ','.join(_literal_xl(v) for v in vals))
+
+
+class Comparar(Condicion):
+    def __init__(self, campo: str, op: str, valor):
+        self.campo, self.op, self.dato = campo, op, valor
+
+    def clave(self):
+        return ('cmp', self.campo, self.op, self.dato)
+
+    def _vector(self, ctx, memo):
+        valor = self.dato
+        if isinstance(valor, str) and _codificado(ctx, self.campo):
+            valor = ctx.codigo(self.campo, valor)
+        return np.asarray(_OPS[self.op](ctx[self.campo], valor), dtype=bool)
+
+    def textos(self):
+        if isinstance(self.dato, str):
+            if self.op not in ('==', '!='):
+                raise ValueError('Comparar: texto solo con == o != (%s %s)' % (self.campo, self.op))
+            return [(self.campo, self.dato)]
+        return ()
+
+    def valor(self, fila):
+        return _OPS[self.op](fila[self.campo], self.dato)
+
+    def excel(self, refs):
+        ref = refs[self.campo]
+        if isinstance(ref, Valor):
+            return _xl_bool(_OPS[self.op](ref.valor, self.dato))
+        return '%s%s%s' % (ref, _OPS_XL.get(self.op, self.op), _literal_xl(self.dato))
+
+
+class Bandera(Condicion):
+    def __init__(self, campo: str):
+        self.campo = campo
+
+    def clave(self):
+        return ('bandera', self.campo)
+
+    def _vector(self, ctx, memo):
+        return np.asarray(ctx[self.campo], dtype=bool)
+
+    def valor(self, fila):
+        return bool(fila[self.campo])
+
+    def excel(self, refs):
+        ref = refs[self.campo]
+        return _xl_bool(ref.valor) if isinstance(ref, Valor) else ref
+
+
+class No(Condicion):
+    def __init__(self, cond: Condicion):
+        self.cond = cond
+
+    def clave(self):
+        return ('no', self.cond.clave())
+
+    def _vector(self, ctx, memo):
+        return ~self.cond.vector(ctx, memo)
+
+    def textos(self):
+        return self.cond.textos()
+
+    def valor(self, fila):
+        return not self.cond.valor(fila)
+
+    def excel(self, refs):
+        x = self.cond.excel(refs)
+        if x in (_XL_SI, _XL_NO):
+            return _xl_bool(x == _XL_NO)
+        return _negar_xl(x)
+
+
+def _negar_xl(x: str) -> str:
+    """NOT(x), sin dobles negaciones: NOT(NOT(a)) → a (más legible al auditar)."""
+    if x.startswith('NOT(') and x.endswith(')'):
+        nivel, comillas = 0, False
+        for i, ch in enumerate(x[3:], 3):
+            if ch == '"':
+                comillas = not comillas
+            elif not comillas and ch == '(':
+                nivel += 1
+            elif not comillas and ch == ')':
+                nivel -= 1
+                if nivel == 0:
+                    if i == len(x) - 1:      # el NOT( cierra al final → envuelve todo
+                        return x[4:-1]
+                    break
+    return 'NOT(%s)' % x
+
+
+class Y(Condicion):
+    _op_np, _op_xl = operator.and_, 'AND'
+    _neutro, _absorbe = _XL_SI, _XL_NO       # AND(TRUE, x) = x; AND(FALSE, …) = FALSE
+
+    def __init__(self, *conds):
+        partes = []
+        for c in conds:   # Y(Y(a, b), c) → Y(a, b, c)
+            partes.extend(c.conds if type(c) is type(self) else [c])
+        self.conds = partes
+
+    def clave(self):
+        return (self._op_xl,) + tuple(c.clave() for c in self.conds)
+
+    def _vector(self, ctx, memo):
+        res = self.conds[0].vector(ctx, memo)
+        for c in self.conds[1:]:
+            res = self._op_np(res, c.vector(ctx, memo))
+        return res
+
+    def textos(self):
+        return [t for c in self.conds for t in c.textos()]
+
+    def valor(self, fila):
+        for c in self.conds:          # corta en la primera falsa, como and
+            if not c.valor(fila):
+                return False
+        return True
+
+    def excel(self, refs):
+        partes = []
+        for c in self.conds:
+            x = c.excel(refs)
+            if x == self._absorbe:
+                return x
+            if x != self._neutro:
+                partes.append(x)
+        if not partes:
+            return self._neutro
+        if len(partes) == 1:
+            return partes[0]
+        return '%s(%s)' % (self._op_xl, ','.join(partes))
+
+
+class O(Y):
+    _op_np, _op_xl = operator.or_, 'OR'
+    _neutro, _absorbe = _XL_NO, _XL_SI
+
+    def valor(self, fila):
+        for c in self.conds:          # corta en la primera verdadera, como or
+            if c.valor(fila):
+                return True
+        return False
+
+
+# ══════════════════════════════════════════════════════════════════
+# TEXTOS
+# ══════════════════════════════════════════════════════════════════
+
+class Plantilla:
+    """'Forma de pago {forma} inválida' → literal/campo alternados."""
+
+    def __init__(self, texto: str):
+        self.texto  = texto
+        self.partes = [(i % 2 == 1, p) for i, p in enumerate(_RE_CAMPO.split(texto)) if p]
+
+    @property
+    def constante(self) -> bool:
+        return not any(es_campo for es_campo, _ in self.partes)
+
+    def vector(self, ctx: dict, mask: np.ndarray):
+        """Texto de las filas en `mask` o índices (str si no depende de la fila)."""
+        if self.constante:
+            return self.texto
+        res = ''
+        for es_campo, p in self.partes:
+            res = res + (ctx[p][mask].astype(str).astype(object) if es_campo else p)
+        return res
+
+    def valor(self, fila) -> str:
+        return ''.join(str(fila[p]) if es_campo else p for es_campo, p in self.partes)
+
+    def excel(self, refs):
+        if not self.partes:
+            return '""'
+        def xl(es_campo, p):
+            if not es_campo:
+                return _literal_xl(p)
+            ref = refs[p]
+            return _literal_xl(str(ref.valor)) if isinstance(ref, Valor) else ref
+        return '&'.join(xl(es_campo, p) for es_campo, p in self.partes)
+
+
+def _salida(s):
+    return Plantilla(s) if isinstance(s, str) else s
+
+
+class Concat:
+    """Textos uno tras otro."""
+
+    def __init__(self, *partes):
+        self.partes = [_salida(p) for p in partes]
+
+    def valor(self, fila) -> str:
+        return ''.join(p.valor(fila) for p in self.partes)
+
+    def excel(self, refs):
+        return '&'.join(p.excel(refs) for p in self.partes)
+
+
+class Unir:
+    """prefijo + textos de las condiciones que se cumplen, separados por sep."""
+
+    def __init__(self, prefijo: str, sep: str, casos):
+        self.prefijo = prefijo
+        self.sep     = sep
+        self.casos   = [(c, _salida(s)) for c, s in casos]
+
+    def valor(self, fila) -> str:
+        return self.prefijo + self.sep.join([s.valor(fila) for c, s in self.casos if c.valor(fila)])
+
+    def excel(self, refs):
+        # Cada caso aporta sep+texto; MID quita el primer separador
+        sep = _literal_xl(self.sep)
+        partes = []
+        for c, s in self.casos:
+            x = c.excel(refs)
+            if x == _XL_SI:
+                partes.append('%s&%s' % (sep, s.excel(refs)))
+            elif x != _XL_NO:
+                partes.append('IF(%s,%s&%s,"")' % (x, sep, s.excel(refs)))
+        if not partes:
+            return _literal_xl(self.prefijo)
+        return '%s&MID(%s,%d,1024)' % (_literal_xl(self.prefijo), '&'.join(partes),
+                                       len(self.sep) + 1)
+
+
+class Primera:
+    """
+    Tabla de primera coincidencia: [(condición, texto), ...] + defecto.
+    Los textos pueden ser otra Primera, Concat o Unir.
+    """
+
+    def __init__(self, casos, defecto=''):
+        self.casos   = [(c, _salida(s)) for c, s in casos]
+        self.defecto = _salida(defecto)
+
+    def valor(self, fila) -> str:
+        for c, s in self.casos:
+            if c.valor(fila):
+                return s.valor(fila)
+        return self.defecto.valor(fila)
+
+    def excel(self, refs) -> str:
+        expr = self.defecto.excel(refs)
+        for c, s in reversed(self.casos):
+            x = c.excel(refs)
+            if x == _XL_SI:
+                expr = s.excel(refs)
+            elif x != _XL_NO:
+                expr = 'IF(%s,%s,%s)' % (x, s.excel(refs), expr)
+        return expr
+
+    def compilar(self, campos):
+        """función(*valores de campos) → texto."""
+        campos = tuple(campos)
+
+        def _primera(*valores):
+            return self.valor(dict(zip(campos, valores)))
+        return _primera
+
+    def formula(self, refs: dict) -> str:
+        """Fórmula Excel; refs = campo → celda ('H5') o Valor(dato fijo)."""
+        return '=' + self.excel(refs)
+
+
+# ══════════════════════════════════════════════════════════════════
+# TABLA DE DEDUCIBILIDAD (todas las reglas que apliquen)
+# ══════════════════════════════════════════════════════════════════
+
+class Regla:
+    def __init__(self, nombre: str, cuando: Condicion, accion: str, razon: str):
+        self.nombre = nombre
+        self.cuando = cuando
+        self.accion = accion
+        self.razon  = Plantilla(razon)
+
+
+class TablaReglas:
+    """
+    Reglas acumulativas. En vectorizar() cada regla es un bit de un
+    código uint32 por fila; el texto se arma después, con razones(),
+    una vez por código distinto y solo para las filas que se escriben.
+    """
+
+    def __init__(self, reglas):
+        self.reglas = list(reglas)
+        if len(self.reglas) > 32:
+            raise ValueError('TablaReglas: máximo 32 reglas (código uint32)')
+        # Campos que aparecen en los textos → columnas de parámetros
+        self.parametros = tuple(sorted({p for r in self.reglas
+                                        for es_campo, p in r.razon.partes if es_campo}))
+        # Campos de texto que comparan las reglas → códigos int8 en nucleo()
+        voc = {}
+        for r in self.reglas:
+            for campo, texto in r.cuando.textos():
+                voc.setdefault(campo, set()).add(texto)
+        self.vocabulario = {c: tuple(sorted(v)) for c, v in voc.items()}
+        if any(len(v) > 126 for v in self.vocabulario.values()):
+            raise ValueError('TablaReglas: más de 126 textos en un campo (código int8)')
+
+    def catalogo(self) -> dict:
+        """bit → plantilla de la razón ({campo} = parámetro de la fila)."""
+        return {1 << i: r.razon.texto for i, r in enumerate(self.reglas)}
+
+    def codificar(self, campo: str, valores) -> np.ndarray:
+        """Textos (array, Series u objeto category) → códigos int8 de `campo`."""
+        voc = self.vocabulario[campo]
+        if isinstance(valores, pd.Series) and isinstance(valores.dtype, pd.CategoricalDtype):
+            cod = valores.cat.set_categories(voc).cat.codes.to_numpy()
+        else:
+            cod = pd.Categorical(valores, categories=voc).codes
+        return (cod + 1).astype(np.int8)
+
+    def nucleo(self, ctx: dict) -> tuple:
+        """
+        Igual que vectorizar(), sobre arrays NumPy puros: los campos de
+        self.vocabulario como códigos int8 (codificar()), números float64,
+        banderas bool. Cada condición de texto es una tabla bool[código].
+        """
+        return self.vectorizar(Contexto(ctx, self.vocabulario))
+
+    def vectorizar(self, ctx: dict) -> tuple:
+        """
+        ctx: campo → array (una posición por fila).
+        Retorna (deducible bool[n], codigos uint32[n]: bit i = regla i).
+        """
+        n = len(next(iter(ctx.values())))
+        memo      = {}
+        deducible = np.ones(n, dtype=bool)
+        codigos   = np.zeros(n, dtype=np.uint32)
+        for i, regla in enumerate(self.reglas):
+            m = regla.cuando.vector(ctx, memo)
+            if not m.any():
+                continue
+            if regla.accion == NO_DEDUCIBLE:
+                deducible &= ~m
+            codigos[m] |= np.uint32(1 << i)
+        return deducible, codigos
+
+    def razones(self, codigos, ctx: dict, vacio: str = '') -> np.ndarray:
+        """
+        Texto 'a | b' de cada fila a partir de su código.
+        ctx solo necesita self.parametros; código 0 → `vacio`.
+        """
+        codigos = np.asarray(codigos, dtype=np.uint32)
+        res = np.full(len(codigos), vacio, dtype=object)
+        unicos, inv = np.unique(codigos, return_inverse=True)
+        orden  = np.argsort(inv, kind='stable')
+        cortes = np.searchsorted(inv[orden], np.arange(len(unicos) + 1))
+        for k, cod in enumerate(unicos.tolist()):
+            if not cod:
+                continue
+            filas  = orden[cortes[k]:cortes[k + 1]]
+            partes = [r.razon.vector(ctx, filas)
+                      for i, r in enumerate(self.reglas) if cod >> i & 1]
+            texto = partes[0]
+            for p in partes[1:]:
+                texto = texto + ' | ' + p
+            res[filas] = texto
+        return res
+
+    def compilar(self, campos):
+        """función(*valores de campos) → (deducible, [razones])."""
+        campos = tuple(campos)
+        reglas = [(r.cuando.valor, r.accion == NO_DEDUCIBLE, r.razon.valor) for r in self.reglas]
+
+        def _evaluar(*valores):
+            fila = dict(zip(campos, valores))
+            ded, r = True, []
+            for cumple, quita, razon in reglas:
+                if cumple(fila):
+                    if quita:
+                        ded = False
+                    r.append(razon(fila))
+            return ded, r
+        return _evaluar
@@ -0,0 +1,107 @@
+"""
+resultado_validacion.py — Entrega del Paso 2 al Paso 3 en memoria
+ReaDesF1.9
+
+Antes el Paso 3 volvía a abrir el _validado.xlsx recién escrito
+(openpyxl read_only) y parseaba cada celda otra vez. Ahora los motores
+pandas/chunks guardan, mientras escriben, las columnas que lee el
+reporte y las entregan en un ResultadoValidacion:
+
+  motor ──→ SalidaValidado.escribir(bloque) ──→ _validado.xlsx
+                        │
+                        └─→ TablaValidado.agregar(bloque)
+                              columnas del reporte (una lista por campo,
+                              valores como los devolvería openpyxl)
+                              + _deducible, _razon_cod, _sub0, _sub2 (NumPy)
+                        ↓
+  ResultadoValidacion(stats, tabla) ──→ generar_reporte(..., validado=tabla)
+
+  • Sin tabla (motor openpyxl, corrida incremental o reanudada: hay
+    filas que solo existen en el archivo) el Paso 3 lee el archivo,
+    igual que al ejecutar generador_reporte.py directo.
+  • CAMPOS_REPORTE es la única definición de "qué columna es cuál"
+    para el Paso 3, en memoria o desde el archivo.
+"""
+
+from dataclasses import dataclass
+
+import numpy as np
+
+from models.esquema_columnas import compilar_esquema
+from models.escritor_xlsx import valor_releido
+
+# Campo del reporte → nombres posibles del encabezado (en orden de preferencia)
+CAMPOS_REPORTE = (
+    ('uuid',         ('uuid', 'folio')),
+    ('uuid_rel',     ('uuids relacionados',)),
+    ('fecha',        ('fecha certificacion', 'fecha emision', 'fecha')),
+    ('razon_em',     ('razon emisor', 'razon social')),
+    ('razon_rec',    ('razon receptor',)),
+    ('regimen',      ('regimen receptor', 'regimen')),
+    ('metodo',       ('metodo pago',)),
+    ('forma',        ('forma pago',)),
+    ('uso',          ('uso cfdi',)),
+    ('subtotal',     ('subtotal',)),
+    ('descuento',    ('descuento',)),
+    ('iva16',        ('iva trasladado 16%',)),
+    ('iva0',         ('iva trasladado 0%',)),
+    ('iva_ex',       ('iva exento',)),
+    ('ieps',         ('ieps trasladado', 'ieps')),
+    ('ieps_nd',      ('ieps trasladado no desglosado',)),
+    ('ieps_g',       ('ieps trasladado',)),
+    ('ieps3',        ('ieps trasladado 3%',)),
+    ('total',        ('total',)),
+    ('conceptos',    ('conceptos',)),
+    ('complementos', ('complementos',)),
+    ('efecto',       ('efecto',)),
+    ('comentarios',  ('comentarios',)),
+    ('rfc_em',       ('rfc emisor', 'rfc')),
+)
+
+
+def indices_reporte(encabezados) -> dict:
+    """{campo: índice 0-based o None} para una fila de encabezados."""
+    gc = compilar_esquema(encabezados).indice
+    return {campo: gc(*nombres) for campo, nombres in CAMPOS_REPORTE}
+
+
+class TablaValidado:
+    """
+    Columnas del _validado.xlsx que usa el Paso 3, por bloques.
+    out_cols = encabezados tal como se escriben en el archivo.
+    """
+
+    def __init__(self, out_cols: list):
+        self.encabezados = [str(c).strip() for c in out_cols]
+        self.indices     = indices_reporte(self.encabezados)
+        self.columnas    = {campo: [] for campo, i in self.indices.items() if i is not None}
+        self.filas       = 0
+        self._calculadas = {'deducible': [], 'razon_cod': [], 'sub0': [], 'sub2': []}
+
+    def agregar(self, salida, df) -> None:
+        """
+        salida = valores visibles del bloque (objeto, None en vacíos),
+        df     = el bloque evaluado (columnas internas '_...').
+        """
+        for campo, lista in self.columnas.items():
+            lista.extend(map(valor_releido, salida.iloc[:, self.indices[campo]].tolist()))
+        c = self._calculadas
+        c['deducible'].append(df['_deducible'].to_numpy(dtype=bool))
+        c['razon_cod'].append(df['_razon_cod'].to_numpy(dtype=np.uint32))
+        c['sub0'].append(df['_sub0'].to_numpy(dtype=np.float64))
+        c['sub2'].append(df['_sub2'].to_numpy(dtype=np.float64))
+        self.filas += len(df)
+
+    def calculada(self, nombre: str) -> np.ndarray:
+        """'deducible' (bool), 'razon_cod' (uint32), 'sub0' / 'sub2' (float64) del motor."""
+        partes = self._calculadas[nombre]
+        if len(partes) > 1:
+            partes[:] = [np.concatenate(partes)]
+        return partes[0] if partes else np.zeros(0)
+
+
+@dataclass
+class ResultadoValidacion:
+    """Lo que devuelve cada motor: estadísticas y, si la hay, la tabla en memoria."""
+    stats: dict
+    tabla: TablaValidado = None
@@ -0,0 +1,138 @@
+"""
+tabla_reporte.py — Filas del Paso 3 guardadas por columna
+ReaDesF1.9
+
+Antes el Paso 3 armaba un dict de 23 claves por factura: en un mes
+grande eran cientos de miles de objetos, cada importe un float suelto
+y cada "G03 - Gastos en general" repetido en todas las filas. Ahora
+cada campo es UNA columna:
+
+  importes   subtotal, descuento, iva16, iva0, iva_ex, ieps,
+             total, sub0, sub2                 → float64
+  catálogos  regimen, metodo, forma, uso, efecto
+                                               → códigos int32 + categorías
+  textos     uuid, uuid_rel, rfc_em            → str internadas (sys.intern)
+             razon_em, razon_rec, conceptos, complementos, comentarios,
+             fecha (valor crudo)               → lista
+  marcas     clave_personal (bool), agregadas por el Paso 3
+
+  tabla.por_categoria('metodo', fn) → fn una vez por valor distinto,
+                                      resultado por fila (array)
+  tabla[i] / iter(tabla)            → FilaVista: f['uuid'], f.get('total')
+                                      para las plantillas de Excel/HTML
+
+  • Los importes salen de la vista como float de Python (no np.float64)
+    para que openpyxl y las plantillas escriban lo mismo que antes.
+"""
+
+import sys
+
+import numpy as np
+import pandas as pd
+
+IMPORTES  = ('subtotal', 'descuento', 'iva16', 'iva0', 'iva_ex', 'ieps',
+             'total', 'sub0', 'sub2')
+CATALOGOS = ('regimen', 'metodo', 'forma', 'uso', 'efecto')
+TEXTOS    = ('uuid', 'uuid_rel', 'fecha', 'razon_em', 'razon_rec', 'conceptos',
+             'complementos', 'comentarios', 'rfc_em')
+
+# Textos que se repiten entre filas o se comparan en los cruces
+INTERNADOS = ('uuid', 'uuid_rel', 'rfc_em')
+
+
+class TablaReporte:
+    """
+    n         = número de filas
+    importes  = {campo: valores numéricos}
+    catalogos = {campo: [str]} → se factorizan aquí
+    textos    = {campo: [valor]}
+    """
+
+    def __init__(self, n: int, importes: dict, catalogos: dict, textos: dict):
+        self.n         = n
+        self.importes  = {c: np.asarray(v, dtype=np.float64) for c, v in importes.items()}
+        self.catalogos = {}
+        for campo, valores in catalogos.items():
+            codigos, categorias = pd.factorize(pd.Series(valores, dtype=object))
+            self.catalogos[campo] = (codigos.astype(np.int32), categorias.tolist())
+        self.textos = {c: ([sys.intern(s) for s in v] if c in INTERNADOS else list(v))
+                       for c, v in textos.items()}
+        self.marcas = {}
+        self._por_categoria = {}
+
+    def __len__(self) -> int:
+        return self.n
+
+    def __getitem__(self, i: int) -> 'FilaVista':
+        return FilaVista(self, i)
+
+    def __iter__(self):
+        for i in range(self.n):
+            yield FilaVista(self, i)
+
+    def __contains__(self, campo: str) -> bool:
+        return (campo in self.importes or campo in self.catalogos
+                or campo in self.textos or campo in self.marcas)
+
+    # ── Columnas completas ──────────────────────────────────────
+    def columna(self, campo: str):
+        """Array (importes, marcas) o lista (textos, catálogos decodificados)."""
+        if campo in self.importes:
+            return self.importes[campo]
+        if campo in self.marcas:
+            return self.marcas[campo]
+        if campo in self.catalogos:
+            codigos, categorias = self.catalogos[campo]
+            return [categorias[c] for c in codigos.tolist()]
+        return self.textos[campo]
+
+    def marcar(self, nombre: str, valores) -> None:
+        """Columna calculada por el Paso 3 (p. ej. clave_personal)."""
+        self.marcas[nombre] = np.asarray(valores)
+
+    def por_categoria(self, campo: str, fn, dtype=object, clave=None) -> np.ndarray:
+        """
+        fn(categoría) una vez por valor distinto de un catálogo → array por
+        fila. Con `clave` el resultado queda guardado (extraer_codigo...).
+        """
+        if clave is not None and (campo, clave) in self._por_categoria:
+            return self._por_categoria[(campo, clave)]
+        codigos, categorias = self.catalogos[campo]
+        resultado = np.array([fn(c) for c in categorias] or [fn('')], dtype=dtype)[codigos]
+        if clave is not None:
+            self._por_categoria[(campo, clave)] = resultado
+        return resultado
+
+    # ── Una celda ───────────────────────────────────────────────
+    def valor(self, campo: str, i: int):
+        if campo in self.importes:
+            return float(self.importes[campo][i])
+        if campo in self.catalogos:
+            codigos, categorias = self.catalogos[campo]
+            return categorias[codigos[i]]
+        if campo in self.textos:
+            return self.textos[campo][i]
+        if campo in self.marcas:
+            return self.marcas[campo][i].item()
+        raise KeyError(campo)
+
+
+class FilaVista:
+    """Una fila de TablaReporte con la interfaz de dict que usan las plantillas."""
+    __slots__ = ('tabla', 'i')
+
+    def __init__(self, tabla: TablaReporte, i: int):
+        self.tabla = tabla
+        self.i     = i
+
+    def __getitem__(self, campo: str):
+        return self.tabla.valor(campo, self.i)
+
+    def __contains__(self, campo: str) -> bool:
+        return campo in self.tabla
+
+    def get(self, campo: str, defecto=None):
+        try:
+            return self.tabla.valor(campo, self.i)
+        except KeyError:
+            return defecto
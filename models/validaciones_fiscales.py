@@ -4,6 +4,7 @@ ReaDesF1.8
 
 NUEVO EN v1.8:
   ✓ Masks vectorizadas para pandas (reemplaza iterrows)
+  ✓ Categorías de concepto por palabra completa (hash + trie, máscara CAT_*)
   ✓ Columnas a tipo 'category' para reducir RAM hasta 70%
   ✓ Fórmulas auditables Excel preservadas en los 3 motores
   ✓ evaluar_deducibilidad_vectorizado() — procesa DataFrame completo
@@ -32,8 +33,18 @@ FUNDAMENTO LEGAL — INSUMOS AGRÍCOLAS RÉGIMEN 612:
 """
 
 import re
+import numpy as np
 import pandas as pd
 
+from models.indice_palabras import IndicePalabras
+from models.catalogo_palabras import CatalogoVivo
+from models.reglas import (
+    En, Comparar, Bandera, Regla, TablaReglas, Primera, Unir, Concat,
+    NO_DEDUCIBLE, NOTA)
+from models.cache_conceptos import (
+    CacheConceptos, firma_categorias, normalizar_concepto, ruta_cache_conceptos)
+from seguridad import ConfiguracionSeguridad
+
 # ══════════════════════════════════════════════════════════════════
 # CONSTANTES FISCALES
 # ══════════════════════════════════════════════════════════════════
@@ -63,148 +74,160 @@ CLAVES_DEDUCCION_PERSONAL = {
     'D10',  # Pagos por servicios educativos (colegiaturas)
 }
 
+# Clave como código completo: antes inicio/espacio/|,;-  y después
+# fin/espacio/|,;.)  → "CD01" o "D011" no cuentan. Una sola regex.
+_RE_CLAVE_PERSONAL = re.compile(
+    r'(?:^|[\s|,;-])(?:%s)(?=$|[\s|,;.)])' % '|'.join(sorted(CLAVES_DEDUCCION_PERSONAL)),
+    re.IGNORECASE)
+
 # ══════════════════════════════════════════════════════════════════
-# SETS DE PALABRAS CLAVE — búsqueda O(1)
+# ÍNDICE DE CATEGORÍAS — palabras completas, una pasada por concepto
+# Palabras sueltas en un hash y frases en un trie de palabras
+# (models/indice_palabras.py); el resultado es una máscara de bits.
+# Las palabras vienen de models/catalogo_palabras.json (+ ajustes del
+# cliente); el índice compilado se carga de disco y se revisa durante
+# la corrida (models/catalogo_palabras.py)
 # ══════════════════════════════════════════════════════════════════
 
-PALABRAS_GASOLINA: set = {
-    'gasolina', 'combustible', 'magna', 'premium',
-    'diesel', 'diésel', 'gasohol', 'gasoil',
-    'nafta', 'petrol', 'gas', 'energético',
-    'turbosina', 'jet fuel', 'bunker',
-    'regular', '32011', '32012', '34006'
+CAT_GASOLINA = 1
+CAT_DULCE    = 2
+CAT_INSUMO   = 4
+CAT_TELECOM  = 8
+CAT_AGRUPADO = 16     # varios productos en un concepto ('a | b | c')
+
+# Categoría del catálogo → bit
+CATEGORIAS_ARCHIVO: dict = {
+    'gasolina': CAT_GASOLINA,
+    'dulce':    CAT_DULCE,
+    'insumo':   CAT_INSUMO,
+    'telecom':  CAT_TELECOM,
 }
 
-PALABRAS_DULCE: set = {
-    'pan', 'roles', 'conchas', 'mantecadas', 'donas', 'panque',
-    'gansito', 'pinguinos', 'submarinos', 'chocorol', 'principe',
-    'pastisetas', 'canelitas', 'polvorones', 'triki', 'duo',
-    'rebanada', 'colchones', 'cuernitos', 'medias noches',
-    'pan blanco', 'pan integral', 'pan molido', 'empanizador',
-    'tostada', 'tostaditas', 'tostado', 'tortillinas', 'salmas',
-    'chocolate', 'bon o bon', 'hershey', 'reese', 'kit kat',
-    'kremas', 'trident',
-    'papas', 'chips', 'sabritas', 'doritos', 'cheetos', 'ruffles',
-    'barcel', 'takis', 'hot nuts', 'cacahuates', 'kiyakis',
-    'runners', 'churrumais', 'tostitos', 'fritos', 'big mix',
-    'galletas', 'oreo', 'emperador', 'marías', 'animalitos',
-    'chokis', 'sponch', 'barrita',
-    'pepsi', 'coca', 'sprite', 'fanta', 'monster', 'gatorade',
-    'ades', 'delsey'
+# Palabras que no dependen del cliente
+CATEGORIAS_FIJAS: dict = {
+    CAT_AGRUPADO: {'|'},
 }
 
-PALABRAS_INSUMO: set = {
-    # Fertilizantes
-    'fertilizante', 'fertilizacion', 'fertilización',
-    'abono', 'abonos', 'abonado',
-    'urea', 'nitrato', 'nitrogeno', 'nitrógeno',
-    'sulfato de amonio', 'amoniaco', 'sulfammo',
-    'nitrofoska', 'nitrabor', 'kan-l', 'uan', 'nitramon', 'nitromax',
-    'fosfato', 'fosforo', 'fósforo',
-    'map', 'dap', 'superfosfato', 'triple super',
-    'potasio', 'potásico', 'cloruro de potasio',
-    'sulfato de potasio', 'sulfato potásico',
-    'npk', 'haifa', 'basacote', 'nutri',
-    'microelementos', 'humatos', 'calcio foliar',
-    'quelatos', 'bioestimulante', 'aminoacidos',
-    'acido humico', 'ácido húmico', 'fulvico',
-    'yara', 'fertimex', 'compo', 'timac', 'mosaic', 'nutrimos', 'agrium',
-    # Semillas
-    'semilla', 'semillas', 'semillero',
-    'esqueje', 'esquejes', 'plantula', 'plántula', 'plantulas',
-    'variedad', 'hibrido', 'híbrido',
-    'semilla de caña', 'punta de caña', 'trocito de caña',
-    'cana semilla', 'caña semilla', 'propagacion', 'propagación',
-    'maiz', 'maíz', 'sorgo', 'frijol',
-    'garbanzo', 'ajonjoli', 'ajonjolí', 'girasol', 'cártamo', 'cartamo',
-    # Herbicidas
-    'herbicida', 'herbicidas', 'maleza', 'deshierbe', 'desherbe',
-    'glifosato', 'roundup', 'atrazina', 'atrazine',
-    '2-4d', '2,4-d', 'amine', 'pendimetalina', 'metribuzin',
-    'diuron', 'diurón', 'hexazinona', 'ametrina', 'ametrine',
-    'faena', 'gesapax', 'velpar', 'karmex', 'harness', 'dual',
-    # Insecticidas
-    'insecticida', 'insecticidas', 'plaguicida', 'plaguicidas',
-    'pesticida', 'pesticidas',
-    'clorpirifos', 'imidacloprid', 'lambda',
-    'cipermetrina', 'deltametrina', 'malatión',
-    'abamectina', 'spinosad', 'bifentrina', 'thiamethoxam', 'acetamiprid',
-    'bacillus', 'beauveria', 'trichoderma', 'metarhizium',
-    'control biologico', 'biol',
-    'lorsban', 'confidor', 'regent', 'karate', 'decis', 'engeo',
-    # Fungicidas
-    'fungicida', 'fungicidas',
-    'mancozeb', 'metalaxil', 'propiconazol', 'tebuconazol',
-    'azoxistrobina', 'iprodiona', 'clorotalonil', 'captan', 'tiofanato',
-    'dithane', 'ridomil', 'tilt', 'folicur', 'amistar', 'rovral',
-    # Agronutrientes
-    'agronutriente', 'agronutrientes', 'estimulante', 'estimulantes',
-    'regulador de crecimiento', 'regulador',
-    'citoquinina', 'auxina', 'giberelina',
-    'ethephon', 'ethrel', 'madurante', 'maduracion', 'maduración',
-    # Insumos de aplicación
-    'coadyuvante', 'adherente', 'surfactante',
-    'aceite agricola', 'aceite agrícola', 'dispersante', 'emulsificante',
-    # Enmiendas
-    'cal agricola', 'cal agrícola', 'calcita', 'dolomita',
-    'yeso agricola', 'yeso agrícola',
-    'azufre agricola', 'azufre agrícola', 'encalado',
-    'enmienda', 'corrector de suelo', 'acondicionador de suelo',
-}
+_catalogo = None
 
-# ══════════════════════════════════════════════════════════════════
-# PATRONES REGEX COMPILADOS — para pandas .str.contains()
-# Se compilan UNA SOLA VEZ al importar el módulo
-# ══════════════════════════════════════════════════════════════════
+def catalogo_conceptos() -> CatalogoVivo:
+    global _catalogo
+    if _catalogo is None:
+        _catalogo = CatalogoVivo(CATEGORIAS_ARCHIVO, CATEGORIAS_FIJAS,
+                                 ConfiguracionSeguridad.CATALOGO_CLIENTE)
+        _catalogo.revisar()
+    return _catalogo
 
-PATRON_GASOLINA: re.Pattern = re.compile(
-    '|'.join(re.escape(p) for p in PALABRAS_GASOLINA), re.IGNORECASE)
-
-PATRON_DULCE: re.Pattern = re.compile(
-    '|'.join(re.escape(p) for p in PALABRAS_DULCE), re.IGNORECASE)
-
-PATRON_INSUMO: re.Pattern = re.compile(
-    '|'.join(re.escape(p) for p in PALABRAS_INSUMO), re.IGNORECASE)
-
-PALABRAS_TELECOM: set = {
-    # Operadoras
-    'telmex', 'telcel', 'att', 'izzi', 'axtel', 'megacable',
-    'totalplay', 'telecomunicaciones', 'telecomunicacion',
-    'telecomunicación', 'telecomunicaciones de mexico',
-    'telefonos de mexico', 'teléfonos de méxico',
-    # Servicios
-    'telefonia', 'telefonía', 'servicio telefonico',
-    'servicio telefónico', 'servicio de telecomunicaciones',
-    'internet y telefonia', 'internet y telefonía',
-    'plan de datos', 'renta mensual telefono',
-    'servicio de internet', 'fibra optica', 'fibra óptica',
-}
+def indice_conceptos() -> IndicePalabras:
+    return catalogo_conceptos().indice
 
-PATRON_TELECOM: re.Pattern = re.compile(
-    '|'.join(re.escape(p) for p in PALABRAS_TELECOM), re.IGNORECASE)
+def clasificar_conceptos(conceptos_lower) -> np.ndarray:
+    """
+    Vectorizado: máscara CAT_* (uint8) por concepto de una Series/array.
+    Uso: bits & CAT_GASOLINA → es gasolina, etc.
+    """
+    return indice_conceptos().buscar_serie(conceptos_lower)
 
 # ══════════════════════════════════════════════════════════════════
-# CACHE — evita re-evaluar conceptos repetidos (openpyxl motor)
+# CACHE — conceptos ya clasificados, en disco entre corridas
+# Compartida por detectar_tipo (openpyxl) y los motores vectorizados
+# (ver models/cache_conceptos.py). Acotada (LRU) y firmada con las
+# palabras del catálogo: si cambian, se vacía sola — también a mitad
+# de corrida, cuando el catálogo se recarga.
 # ══════════════════════════════════════════════════════════════════
 
-_cache_conceptos: dict = {}
+_cache = None
+
+def cache_conceptos() -> CacheConceptos:
+    global _cache
+    catalogo = catalogo_conceptos()
+    if catalogo.revisar() and _cache is not None:
+        # Otras palabras → lo ya clasificado no vale; se conservan los conteos
+        anterior = _cache
+        anterior.guardar()
+        _cache = None
+    else:
+        anterior = None
+    if _cache is None:
+        cfg = ConfiguracionSeguridad
+        _cache = CacheConceptos(
+            firma_categorias(catalogo.categorias),
+            ruta_cache_conceptos() if cfg.USAR_CACHE_CONCEPTOS else None,
+            cfg.CACHE_CONCEPTOS_MAX)
+        if anterior is not None:
+            _cache.aciertos, _cache.nuevos = anterior.aciertos, anterior.nuevos
+    return _cache
+
+def guardar_cache_conceptos() -> None:
+    """Al terminar el motor: baja los pendientes a disco y muestra el resumen."""
+    if _cache is None:
+        return
+    _cache.guardar()
+    total = _cache.aciertos + _cache.nuevos
+    if total:
+        print(f"  🗂️  Conceptos: {_cache.aciertos:,} ya conocidos, "
+              f"{_cache.nuevos:,} nuevos clasificados")
+    _cache.aciertos = _cache.nuevos = 0
+
+def sembrar_cache_conceptos(semilla: dict) -> None:
+    """Proceso de trabajo: caché solo en memoria con lo que sabe el principal."""
+    global _cache
+    _cache = CacheConceptos(firma_categorias(catalogo_conceptos().categorias), None,
+                            ConfiguracionSeguridad.CACHE_CONCEPTOS_MAX, semilla)
+
+def fusionar_cache_conceptos(nuevos: dict, aciertos: int) -> None:
+    """Proceso principal: suma lo que clasificó un proceso de trabajo."""
+    cache = cache_conceptos()
+    for texto, bits in nuevos.items():
+        if texto not in cache:          # otro proceso ya lo trajo
+            cache.agregar(texto, bits)
+    cache.aciertos += aciertos
+
+def clasificar_conceptos_unicos(conceptos: pd.Series) -> tuple:
+    """
+    Como clasificar_conceptos(), pero sobre los conceptos DISTINTOS:
+    un mes repite mucho ('MAGNA', 'DIESEL', el mismo fertilizante).
+
+      factorize → únicos normalizados → caché → índice (solo los nuevos)
+                → bits por código
+
+    Recibe la columna original (sin bajar a minúsculas).
+    Retorna: (bits uint8 por fila, número de conceptos únicos)
+    """
+    codigos, unicos = pd.factorize(conceptos)          # vacíos → -1
+    cache  = cache_conceptos()
+    textos = [normalizar_concepto(u) for u in unicos]
+    bits   = np.zeros(len(textos) + 1, dtype=np.uint8) # código -1 → sin categoría
+    faltan = []
+    for i, texto in enumerate(textos):
+        b = cache.obtener(texto)
+        if b is None:
+            faltan.append(i)
+        else:
+            bits[i] = b
+    if faltan:
+        nuevos = clasificar_conceptos([textos[i] for i in faltan])
+        bits[faltan] = nuevos
+        for i, b in zip(faltan, nuevos.tolist()):
+            cache.agregar(textos[i], b)
+    return bits[codigos], len(unicos)
+
+# (es_gasolina, es_dulce, es_insumo, es_telecom) para cada máscara posible
+_TUPLAS_TIPO = [(bool(b & CAT_GASOLINA), bool(b & CAT_DULCE),
+                 bool(b & CAT_INSUMO),   bool(b & CAT_TELECOM)) for b in range(256)]
 
 def detectar_tipo(concepto_lower: str) -> tuple:
     """
-    Detecta tipo con cache. O(1) si ya fue evaluado.
+    Detecta tipo con cache. O(1) si ya fue evaluado (en esta u otra corrida).
     Retorna: (es_gasolina, es_dulce, es_insumo, es_telecom)
     """
-    if concepto_lower in _cache_conceptos:
-        return _cache_conceptos[concepto_lower]
-
-    gas     = bool(PATRON_GASOLINA.search(concepto_lower))
-    dulce   = bool(PATRON_DULCE.search(concepto_lower))
-    insumo  = bool(PATRON_INSUMO.search(concepto_lower))
-    telecom = bool(PATRON_TELECOM.search(concepto_lower))
-
-    resultado = (gas, dulce, insumo, telecom)
-    _cache_conceptos[concepto_lower] = resultado
-    return resultado
+    texto = normalizar_concepto(concepto_lower)
+    cache = cache_conceptos()
+    bits  = cache.obtener(texto)
+    if bits is None:
+        bits = indice_conceptos().buscar(texto)
+        cache.agregar(texto, bits)
+    return _TUPLAS_TIPO[bits]
 
 def es_gasolina_agrupada(concepto_lower: str) -> bool:
     return '|' in concepto_lower
@@ -222,21 +245,18 @@ def detectar_deduccion_personal(conceptos: str) -> bool:
     """
     if not conceptos:
         return False
-    
-    conceptos_upper = str(conceptos).upper()
-    
-    # Buscar cualquiera de las claves de deducción personal
-    for clave in CLAVES_DEDUCCION_PERSONAL:
-        # Buscar la clave como palabra completa o precedida por separador común
-        # Ej: "D01", " D01", "-D01", "|D01"
-        if clave in conceptos_upper:
-            # Validar que sea la clave completa, no parte de otro código
-            # Por ejemplo, evitar que "CD01" sea detectado como "D01"
-            import re
-            if re.search(r'(\s|^|[|,;-])' + clave + r'(\s|$|[|,;.\)])', conceptos_upper):
-                return True
-    
-    return False
+    return _RE_CLAVE_PERSONAL.search(str(conceptos)) is not None
+
+
+def detectar_deduccion_personal_serie(conceptos) -> np.ndarray:
+    """
+    detectar_deduccion_personal() para una lista/Series completa → bool[n].
+    La regex corre una vez por concepto DISTINTO, no por fila.
+    """
+    cod, unicos = pd.factorize(pd.Series(conceptos, dtype=object))
+    hits = np.fromiter((detectar_deduccion_personal(u) for u in unicos),
+                       dtype=bool, count=len(unicos))
+    return np.append(hits, False)[cod]   # cod -1 (nulo) → último → False
 
 def extraer_codigo(value) -> str:
     if value and '-' in str(value):
@@ -349,152 +369,208 @@ def formulas_auditables(rn: int, CL: dict) -> dict:
     }
 
 # ══════════════════════════════════════════════════════════════════
-# OPTIMIZACIÓN v1.8 — Evaluación vectorizada con MASKS pandas
-# Reemplaza el iterrows() de v1.7 que era el cuello de botella
+# REGLAS DE DEDUCIBILIDAD — UNA sola tabla (ver models/reglas.py)
 #
-# En lugar de procesar fila por fila:
-#   for _, r in df.iterrows():   ← LENTO
-#       evaluar_deducibilidad(r)
+# De esta tabla salen:
+#   • evaluar_deducibilidad_vectorizado() → máscaras numpy (pandas/chunks)
+#   • evaluar_deducibilidad()             → función por fila (openpyxl)
+# y las condiciones con nombre las reusa ESTATUS_REPORTE (Paso 3).
 #
-# Se aplican masks sobre columnas completas:
-#   mask = (df['_forma'] == '01') & (df['Total'] > 2000)  ← RÁPIDO
-#   df.loc[mask, 'Deducible'] = 'NO'
+# Todas las reglas que se cumplan agregan su razón, en este orden;
+# cualquiera marcada NO_DEDUCIBLE vuelve la fila no deducible.
 # ══════════════════════════════════════════════════════════════════
 
+USO_DEDUCIBLE     = En('uso', USOS_DEDUCIBLES)
+USO_PERSONAL      = En('uso', CLAVES_DEDUCCION_PERSONAL)
+METODO_VALIDO     = En('metodo', METODOS_VALIDOS)
+EFECTIVO          = Comparar('forma', '==', '01')
+FORMA_ELECTRONICA = En('forma', FORMAS_ELECTRONICAS)
+FORMA_VALIDA      = En('forma', FORMAS_VALIDAS)
+REG_612           = Comparar('regimen', '==', '612')
+REG_626           = Comparar('regimen', '==', '626')
+REG_TRABAJADO     = En('regimen', REGIMENES_TRABAJADOS)
+MAYOR_LIMITE      = Comparar('total', '>', LIMITE_EFECTIVO)   # "exceda de $2,000"
+GAS               = Bandera('gas')
+INSUMO            = Bandera('insumo')
+AGRUPADA          = Bandera('agrupada')
+
+DED_PERSONAL      = USO_PERSONAL & REG_612     # Art. 147 LISR, solo 612
+GAS_EFECTIVO      = GAS & EFECTIVO
+INSUMO_SOLO       = INSUMO & ~GAS              # gasolina tiene prioridad
+GASTO_NORMAL      = ~GAS & ~INSUMO
+
+REGLAS_DEDUCIBILIDAD = TablaReglas([
+    Regla('uso_invalido', ~USO_DEDUCIBLE & ~DED_PERSONAL, NO_DEDUCIBLE,
+          "Uso CFDI {uso} no deducible"),
+    Regla('metodo_invalido', ~METODO_VALIDO, NO_DEDUCIBLE,
+          "Método {metodo} inválido"),
+
+    # ── Gasolina ─────────────────────────────────────────────────
+    Regla('gas_626_agrupada', GAS_EFECTIVO & REG_626 & AGRUPADA, NOTA,
+          "RESICO (626): Gasolina agrupada efectivo — deducible (facilidad)"),
+    Regla('gas_626_menor', GAS_EFECTIVO & REG_626 & ~AGRUPADA & ~MAYOR_LIMITE, NOTA,
+          "RESICO (626): Gasolina efectivo ≤$2,000 — deducible (facilidad)"),
+    Regla('gas_626_mayor', GAS_EFECTIVO & REG_626 & ~AGRUPADA & MAYOR_LIMITE, NO_DEDUCIBLE,
+          "RESICO (626): Gasolina individual efectivo >$2,000 — NO deducible"),
+    Regla('gas_612', GAS_EFECTIVO & REG_612, NO_DEDUCIBLE,
+          "Régimen 612: Gasolina efectivo NO deducible. Art. 103 LISR + Art. 27 Fracc. III LISR"),
+    Regla('gas_otros', GAS_EFECTIVO & ~REG_626 & ~REG_612, NO_DEDUCIBLE,
+          "Gasolina efectivo NO deducible (Art. 27 Fracc. III LISR)"),
+    Regla('gas_forma_invalida', GAS & ~EFECTIVO & ~FORMA_ELECTRONICA, NO_DEDUCIBLE,
+          "Gasolina: forma de pago {forma} inválida"),
+
+    # ── Insumos agrícolas — Art. 103 LISR + Art. 27 Fracc. III LISR ──
+    Regla('insumo_mayor', INSUMO_SOLO & EFECTIVO & MAYOR_LIMITE, NO_DEDUCIBLE,
+          "Insumo agrícola efectivo >$2,000 NO deducible. "
+          "Art. 103 LISR + Art. 27 Fracc. III LISR. "
+          "Facilidad AGAPES (Art. 74 LISR) NO aplica a Régimen 612"),
+    Regla('insumo_menor', INSUMO_SOLO & EFECTIVO & ~MAYOR_LIMITE, NOTA,
+          "Insumo agrícola efectivo ≤$2,000: deducible. Art. 27 Fracc. III LISR"),
+    Regla('insumo_electronico', INSUMO_SOLO & FORMA_ELECTRONICA, NOTA,
+          "Insumo agrícola pago electrónico: deducible. Art. 27 Fracc. III LISR cumplido"),
+    Regla('insumo_forma_invalida', INSUMO_SOLO & ~EFECTIVO & ~FORMA_ELECTRONICA, NO_DEDUCIBLE,
+          "Insumo agrícola: forma de pago {forma} inválida"),
+
+    # ── Gastos normales ──────────────────────────────────────────
+    Regla('efectivo_mayor', GASTO_NORMAL & EFECTIVO & MAYOR_LIMITE, NO_DEDUCIBLE,
+          "Efectivo >$2,000 NO deducible (Art. 27 Fracc. III LISR)"),
+    Regla('forma_invalida', GASTO_NORMAL & ~FORMA_VALIDA, NO_DEDUCIBLE,
+          "Forma de pago {forma} inválida"),
+
+    # ── Advertencias y deducciones personales (D01-D10) en 612 ───
+    Regla('regimen_externo', ~REG_TRABAJADO, NOTA,
+          "⚠️ Régimen {regimen}: Verificar manualmente"),
+    Regla('ded_personal_efectivo', DED_PERSONAL & EFECTIVO, NO_DEDUCIBLE,
+          "DED PERSONAL NO DEDUCIBLE POR QUE LO PAGA EN EFECTIVO"),
+    Regla('ded_personal', DED_PERSONAL & ~EFECTIVO, NOTA,
+          "DED PERSONAL"),
+])
+
+CAMPOS_DEDUCIBILIDAD = ('uso', 'metodo', 'forma', 'regimen', 'total',
+                        'gas', 'insumo', 'agrupada')
+
+_evaluar_fila = REGLAS_DEDUCIBILIDAD.compilar(CAMPOS_DEDUCIBILIDAD)
+
+
+# ══════════════════════════════════════════════════════════════════
+# ESTATUS DEL REPORTE (Paso 3) — primera regla que se cumpla
+# Mismas condiciones que la tabla de arriba. De aquí salen el estatus
+# calculado (HTML, DIOT, totales) y la fórmula ESTATUS del Excel.
+#
+# Diferencias propias del reporte:
+#   • Forma 99 "Por definir" es válida SOLO con PPD (llega el CP01)
+#   • DED PERSONAL también si el concepto trae la clave D01-D10
+# ══════════════════════════════════════════════════════════════════
+
+USOS_SIN_EFECTOS = {'S01', 'CN0'}
+
+FORMA_VALIDA_REPORTE = FORMA_VALIDA | (Comparar('forma', '==', '99') &
+                                       Comparar('metodo', '==', 'PPD'))
+DED_PERSONAL_REPORTE = REG_612 & (USO_PERSONAL | Bandera('clave_personal'))
+
+_SUB2  = Comparar('sub2',  '>', 0)
+_IVA16 = Comparar('iva16', '>', 0)
+_SUB0  = Comparar('sub0',  '>', 0)
+
+TASA_REPORTE = Primera([
+    (_SUB2 & _IVA16 & Comparar('sub0', '==', 0), '16%'),
+    (_SUB2 & _IVA16 & _SUB0,                     '16 Y 0%'),
+    (Comparar('sub2', '==', 0) & Comparar('iva16', '==', 0) & _SUB0, '0%'),
+], 'NO DEDUCIBLE')
+
+ESTATUS_REPORTE = Primera([
+    (DED_PERSONAL_REPORTE & EFECTIVO, 'DED PERSONAL NO DEDUCIBLE POR QUE LO PAGA EN EFECTIVO'),
+    (DED_PERSONAL_REPORTE,            'DED PERSONAL'),
+    (En('uso', USOS_SIN_EFECTOS),     'NO DEDUCIBLE'),
+    (~USO_DEDUCIBLE | ~METODO_VALIDO | ~FORMA_VALIDA_REPORTE,
+        Unir('ERROR: ', ' | ', [
+            (~USO_DEDUCIBLE,        'USO ({uso}) INVALIDO'),
+            (~METODO_VALIDO,        'METODO ({metodo}) INVALIDO'),
+            (~FORMA_VALIDA_REPORTE, 'FORMA ({forma}) INVALIDA'),
+        ])),
+    # El texto es la opción del reporte; la regla es la de arriba (> $2,000)
+    (EFECTIVO & MAYOR_LIMITE,         'NO DEDUCIBLE: Efectivo >= $2,000'),
+    (Comparar('uso', '==', 'G02'),    'EGRESO'),
+], Concat(Primera([(EFECTIVO, 'EFE ')], 'DED '), TASA_REPORTE))
+
+CAMPOS_ESTATUS = ('uso', 'metodo', 'forma', 'regimen', 'total',
+                  'sub2', 'iva16', 'sub0', 'clave_personal')
+
+estatus_reporte = ESTATUS_REPORTE.compilar(CAMPOS_ESTATUS)
+
+
+# Parámetros de las razones: campo de la plantilla → columna del bloque
+COLUMNAS_PARAMETRO = {'uso': '_uso', 'metodo': '_metodo',
+                      'forma': '_forma', 'regimen': '_regimen'}
+
+# Código de razón → plantilla ('Forma de pago {forma} inválida')
+RAZONES_DEDUCIBILIDAD = REGLAS_DEDUCIBILIDAD.catalogo()
+
+RAZON_CUMPLE = 'Cumple requisitos'
+
+
+def _texto_columna(df: pd.DataFrame, col: str) -> np.ndarray:
+    return df[col].astype(object).fillna('').astype(str).to_numpy(dtype=object)
+
+
+def codificar_campo(campo: str, valores) -> np.ndarray:
+    """Textos de uso/metodo/forma/regimen → códigos int8 de nucleo_deducibilidad."""
+    return REGLAS_DEDUCIBILIDAD.codificar(campo, valores)
+
+
+def nucleo_deducibilidad(uso, metodo, forma, regimen, total, gas, insumo, agrupada) -> tuple:
+    """
+    Núcleo NumPy puro de REGLAS_DEDUCIBILIDAD, sin pandas.
+
+      uso, metodo, forma, regimen  int8    (codificar_campo)
+      total                        float64
+      gas, insumo, agrupada        bool
+
+    Retorna (deducible bool[n], razon_cod uint32[n]).
+    """
+    return REGLAS_DEDUCIBILIDAD.nucleo({
+        'uso': uso, 'metodo': metodo, 'forma': forma, 'regimen': regimen,
+        'total': total, 'gas': gas, 'insumo': insumo, 'agrupada': agrupada,
+    })
+
+
 def evaluar_deducibilidad_vectorizado(df: pd.DataFrame) -> pd.DataFrame:
     """
-    Evalúa deducibilidad de TODO el DataFrame con masks vectorizadas.
-    10-50x más rápido que iterrows().
+    Evalúa deducibilidad de TODO el DataFrame con REGLAS_DEDUCIBILIDAD.
+    Las columnas se bajan a arrays (códigos int8, float64, bool), el
+    núcleo corre sobre NumPy y el resultado se pega al DataFrame una vez.
 
     Requiere columnas previas:
       _regimen, _uso, _metodo, _forma, _es_gas, _es_insumo,
       _es_dulce, _agrupada, Total (numérico)
 
     Agrega columnas:
-      _deducible ('SI'/'NO')
-      _razon     (texto con fundamento)
-    """
-
-    # Inicializar — todos deducibles, sin razón
-    df['_deducible'] = 'SI'
-    df['_razon']     = ''
-
-    total = df['Total'].fillna(0).astype(float)
-    forma = df['_forma'].fillna('').astype(str)
-    uso   = df['_uso'].fillna('').astype(str)
-    met   = df['_metodo'].fillna('').astype(str)
-    reg   = df['_regimen'].fillna('').astype(str)
-
-    # ── MASK 1: Uso CFDI inválido ─────────────────────────────────
-    # Excluir de la regla de invalidez a las deducciones personales si el régimen es 612
-    mask_uso_inv = ~uso.isin(USOS_DEDUCIBLES) & ~(uso.isin(CLAVES_DEDUCCION_PERSONAL) & (reg == '612'))
-    df.loc[mask_uso_inv, '_deducible'] = 'NO'
-    df.loc[mask_uso_inv, '_razon'] += uso[mask_uso_inv].apply(
-        lambda u: f"Uso CFDI {u} no deducible | ")
-
-    # ── MASK 2: Método de pago inválido ──────────────────────────
-    mask_met_inv = ~met.isin(METODOS_VALIDOS)
-    df.loc[mask_met_inv, '_deducible'] = 'NO'
-    df.loc[mask_met_inv, '_razon'] += met[mask_met_inv].apply(
-        lambda m: f"Método {m} inválido | ")
-
-    # ── MASK 3: GASOLINA EFECTIVO ─────────────────────────────────
-    es_gas       = df['_es_gas'].fillna(False)
-    mask_gas_ef  = es_gas & (forma == '01')
-
-    # 3a. Gasolina 626 agrupada (facilidad RESICO) → Deducible
-    mask_gas_626_agrup = mask_gas_ef & (reg == '626') & df['_agrupada'].fillna(False)
-    df.loc[mask_gas_626_agrup, '_razon'] += \
-        "RESICO (626): Gasolina agrupada efectivo — deducible (facilidad) | "
-
-    # 3b. Gasolina 626 ≤$2,000 (facilidad RESICO) → Deducible
-    mask_gas_626_menor = mask_gas_ef & (reg == '626') & ~df['_agrupada'].fillna(False) & (total <= LIMITE_EFECTIVO)
-    df.loc[mask_gas_626_menor, '_razon'] += \
-        "RESICO (626): Gasolina efectivo ≤$2,000 — deducible (facilidad) | "
-
-    # 3c. Gasolina 626 >$2,000 individual → NO deducible
-    mask_gas_626_mayor = mask_gas_ef & (reg == '626') & ~df['_agrupada'].fillna(False) & (total > LIMITE_EFECTIVO)
-    df.loc[mask_gas_626_mayor, '_deducible'] = 'NO'
-    df.loc[mask_gas_626_mayor, '_razon'] += \
-        "RESICO (626): Gasolina individual efectivo >$2,000 — NO deducible | "
-
-    # 3d. Gasolina 612 efectivo → SIEMPRE NO deducible
-    mask_gas_612 = mask_gas_ef & (reg == '612')
-    df.loc[mask_gas_612, '_deducible'] = 'NO'
-    df.loc[mask_gas_612, '_razon'] += \
-        "Régimen 612: Gasolina efectivo NO deducible. Art. 103 LISR + Art. 27 Fracc. III LISR | "
-
-    # 3e. Gasolina otros regímenes efectivo → NO deducible
-    mask_gas_otros = mask_gas_ef & ~reg.isin({'626', '612'})
-    df.loc[mask_gas_otros, '_deducible'] = 'NO'
-    df.loc[mask_gas_otros, '_razon'] += \
-        "Gasolina efectivo NO deducible (Art. 27 Fracc. III LISR) | "
-
-    # ── MASK 4: INSUMOS AGRÍCOLAS ─────────────────────────────────
-    # Art. 103 LISR + Art. 27 Fracc. III LISR
-    es_insumo = df['_es_insumo'].fillna(False)
-
-    # 4a. Insumo efectivo >$2,000 → NO deducible
-    mask_ins_nd = es_insumo & ~es_gas & (forma == '01') & (total > LIMITE_EFECTIVO)
-    df.loc[mask_ins_nd, '_deducible'] = 'NO'
-    df.loc[mask_ins_nd, '_razon'] += \
-        "Insumo agrícola efectivo >$2,000 NO deducible. " \
-        "Art. 103 LISR + Art. 27 Fracc. III LISR. " \
-        "Facilidad AGAPES (Art. 74 LISR) NO aplica a Régimen 612 | "
-
-    # 4b. Insumo efectivo ≤$2,000 → Deducible
-    mask_ins_menor = es_insumo & ~es_gas & (forma == '01') & (total <= LIMITE_EFECTIVO)
-    df.loc[mask_ins_menor, '_razon'] += \
-        "Insumo agrícola efectivo ≤$2,000: deducible. Art. 27 Fracc. III LISR | "
-
-    # 4c. Insumo pago electrónico → Deducible sin límite
-    mask_ins_elec = es_insumo & ~es_gas & forma.isin(FORMAS_ELECTRONICAS)
-    df.loc[mask_ins_elec, '_razon'] += \
-        "Insumo agrícola pago electrónico: deducible. Art. 27 Fracc. III LISR cumplido | "
-
-    # 4d. Insumo forma inválida
-    mask_ins_inv = es_insumo & ~es_gas & ~(forma == '01') & ~forma.isin(FORMAS_ELECTRONICAS)
-    df.loc[mask_ins_inv, '_deducible'] = 'NO'
-    df.loc[mask_ins_inv, '_razon'] += forma[mask_ins_inv].apply(
-        lambda f: f"Insumo agrícola: forma de pago {f} inválida | ")
-
-    # ── MASK 5: GASTOS NORMALES efectivo >$2,000 ──────────────────
-    mask_normal_nd = ~es_gas & ~es_insumo & (forma == '01') & (total > LIMITE_EFECTIVO)
-    df.loc[mask_normal_nd, '_deducible'] = 'NO'
-    df.loc[mask_normal_nd, '_razon'] += \
-        "Efectivo >$2,000 NO deducible (Art. 27 Fracc. III LISR) | "
-
-    # ── MASK 6: Forma de pago inválida (gastos normales) ──────────
-    mask_forma_inv = ~es_gas & ~es_insumo & ~forma.isin(FORMAS_VALIDAS)
-    df.loc[mask_forma_inv, '_deducible'] = 'NO'
-    df.loc[mask_forma_inv, '_razon'] += forma[mask_forma_inv].apply(
-        lambda f: f"Forma de pago {f} inválida | ")
-
-    # ── MASK 7: Regímenes no trabajados — advertencia ─────────────
-    mask_reg_ext = ~reg.isin(REGIMENES_TRABAJADOS)
-    df.loc[mask_reg_ext, '_razon'] += reg[mask_reg_ext].apply(
-        lambda r: f"⚠️ Régimen {r}: Verificar manualmente | ")
-
-    # ── MASK 8: DEDUCCIONES PERSONALES (D01-D10) EN 612 ───────────
-    mask_ded_per = uso.isin(CLAVES_DEDUCCION_PERSONAL) & (reg == '612')
-    mask_ded_per_efectivo = mask_ded_per & (forma == '01')
-    mask_ded_per_ok       = mask_ded_per & (forma != '01')
-
-    df.loc[mask_ded_per_efectivo, '_deducible'] = 'NO'
-    df.loc[mask_ded_per_efectivo, '_razon'] += "DED PERSONAL NO DEDUCIBLE POR QUE LO PAGA EN EFECTIVO | "
-    df.loc[mask_ded_per_ok, '_razon'] += "DED PERSONAL | "
-
-    # ── Limpiar razones vacías ────────────────────────────────────
-    df['_razon'] = df['_razon'].str.rstrip(' |').str.strip()
-    df.loc[df['_razon'] == '', '_razon'] = 'Cumple requisitos'
+      _deducible  (bool)
+      _razon_cod  (uint32, un bit por regla de RAZONES_DEDUCIBILIDAD)
 
+    El texto de la razón NO se arma aquí: razones_deducibilidad() lo
+    materializa al escribir, con _uso/_metodo/_forma/_regimen como
+    parámetros.
+    """
+    def bandera(col):
+        return df[col].fillna(False).to_numpy(dtype=bool)
+
+    cod = {campo: codificar_campo(campo, df[col]) for campo, col in COLUMNAS_PARAMETRO.items()}
+    deducible, razon_cod = nucleo_deducibilidad(
+        cod['uso'], cod['metodo'], cod['forma'], cod['regimen'],
+        df['Total'].fillna(0).to_numpy(dtype=np.float64),
+        bandera('_es_gas'), bandera('_es_insumo'), bandera('_agrupada'))
+    df['_deducible'] = deducible
+    df['_razon_cod'] = razon_cod
     return df
 
 
-# ══════════════════════════════════════════════════════════════════
-# Evaluación fila por fila — usada por motor_openpyxl.py
-# Se mantiene para compatibilidad con el motor openpyxl
-# ══════════════════════════════════════════════════════════════════
+def razones_deducibilidad(df: pd.DataFrame) -> np.ndarray:
+    """Texto de 'Razón No Deducible' desde _razon_cod (uno por código distinto)."""
+    ctx = {campo: _texto_columna(df, COLUMNAS_PARAMETRO[campo])
+           for campo in REGLAS_DEDUCIBILIDAD.parametros}
+    return REGLAS_DEDUCIBILIDAD.razones(df['_razon_cod'].to_numpy(), ctx, RAZON_CUMPLE)
+
 
 def evaluar_deducibilidad(
     uso_cfdi: str, metodo_pg: str, forma_pg: str,
@@ -502,78 +578,49 @@ def evaluar_deducibilidad(
     es_gas: bool, es_insumo: bool, concepto_lower: str
 ) -> tuple:
     """
-    Evaluación fila por fila para motor openpyxl.
+    Evaluación fila por fila para motor openpyxl (misma tabla).
     Retorna: (es_deducible: bool, razones: list[str])
     """
-    es_deducible = True
-    razones      = []
-
-    if uso_cfdi not in USOS_DEDUCIBLES and not (uso_cfdi in CLAVES_DEDUCCION_PERSONAL and regimen == '612'):
-        es_deducible = False
-        razones.append(f"Uso CFDI {uso_cfdi} no deducible")
-
-    if uso_cfdi in CLAVES_DEDUCCION_PERSONAL and regimen == '612':
-        if forma_pg == '01':
-            es_deducible = False
-            razones.append("DED PERSONAL NO DEDUCIBLE POR QUE LO PAGA EN EFECTIVO")
-        else:
-            razones.append("DED PERSONAL")
-
-    if metodo_pg not in METODOS_VALIDOS:
-        es_deducible = False
-        razones.append(f"Método de pago {metodo_pg} inválido")
-
-    if es_gas:
-        if forma_pg == '01':
-            if regimen == '626':
-                if es_gasolina_agrupada(concepto_lower):
-                    nd = concepto_lower.count('|') + 1
-                    razones.append(
-                        f"RESICO (626): {nd} despachos agrupados efectivo — deducible (facilidad)")
-                elif total <= LIMITE_EFECTIVO:
-                    razones.append("RESICO (626): Gasolina efectivo ≤$2,000 — deducible (facilidad)")
-                else:
-                    es_deducible = False
-                    razones.append(
-                        "RESICO (626): Gasolina individual efectivo >$2,000 — NO deducible")
-            elif regimen == '612':
-                es_deducible = False
-                razones.append(
-                    "Régimen 612: Gasolina efectivo NO deducible. "
-                    "Art. 103 LISR + Art. 27 Fracc. III LISR.")
-            else:
-                es_deducible = False
-                razones.append("Gasolina efectivo NO deducible (Art. 27 Fracc. III LISR)")
-        else:
-            if forma_pg not in FORMAS_ELECTRONICAS:
-                es_deducible = False
-                razones.append(f"Gasolina: forma de pago {forma_pg} inválida")
-
-    elif es_insumo:
-        if forma_pg == '01' and total > LIMITE_EFECTIVO:
-            es_deducible = False
-            razones.append(
-                "Insumo agrícola efectivo >$2,000 NO deducible. "
-                "Art. 103 LISR + Art. 27 Fracc. III LISR. "
-                "Facilidad AGAPES (Art. 74 LISR) NO aplica a Régimen 612.")
-        elif forma_pg == '01' and total <= LIMITE_EFECTIVO:
-            razones.append(
-                "Insumo agrícola efectivo ≤$2,000: deducible. Art. 27 Fracc. III LISR.")
-        elif forma_pg in FORMAS_ELECTRONICAS:
-            razones.append(
-                "Insumo agrícola pago electrónico: deducible. Art. 27 Fracc. III LISR cumplido.")
-        else:
-            es_deducible = False
-            razones.append(f"Insumo agrícola: forma de pago {forma_pg} inválida.")
-    else:
-        if forma_pg == '01' and total > LIMITE_EFECTIVO:
-            es_deducible = False
-            razones.append("Efectivo >$2,000 NO deducible (Art. 27 Fracc. III LISR)")
-        elif forma_pg not in FORMAS_VALIDAS:
-            es_deducible = False
-            razones.append(f"Forma de pago {forma_pg} inválida")
-
-    if regimen not in REGIMENES_TRABAJADOS:
-        razones.append(f"⚠️ Régimen {regimen}: Verificar manualmente")
+    return _evaluar_fila(uso_cfdi, metodo_pg, forma_pg, regimen, total,
+                         es_gas, es_insumo, es_gasolina_agrupada(concepto_lower))
+
+
+if __name__ == '__main__':
+    # Micro-benchmark del núcleo:  python -m models.validaciones_fiscales [filas]
+    import sys
+    import time
+
+    n   = int(sys.argv[1]) if len(sys.argv) >= 2 else 300000
+    rng = np.random.default_rng(0)
+    textos = {
+        'uso':     rng.choice(['G01', 'G03', 'S01', 'D01', 'CN0', 'P01'], n).astype(object),
+        'metodo':  rng.choice(['PUE', 'PPD', 'XXX'], n).astype(object),
+        'forma':   rng.choice(['01', '03', '04', '28', '99'], n).astype(object),
+        'regimen': rng.choice(['612', '626', '616'], n).astype(object),
+    }
+    resto = {
+        'total':    rng.uniform(0, 6000, n),
+        'gas':      rng.random(n) < 0.3,
+        'insumo':   rng.random(n) < 0.2,
+        'agrupada': rng.random(n) < 0.05,
+    }
 
-    return es_deducible, razones
+    def medir(f, veces=5):
+        mejor = float('inf')
+        for _ in range(veces):
+            t0 = time.perf_counter()
+            res = f()
+            mejor = min(mejor, time.perf_counter() - t0)
+        return mejor, res
+
+    t_txt, (d1, r1) = medir(lambda: REGLAS_DEDUCIBILIDAD.vectorizar({**textos, **resto}))
+    t_cod, cod      = medir(lambda: {c: codificar_campo(c, v) for c, v in textos.items()})
+    t_nuc, (d2, r2) = medir(lambda: nucleo_deducibilidad(
+        cod['uso'], cod['metodo'], cod['forma'], cod['regimen'], **resto))
+    assert (d1 == d2).all() and (r1 == r2).all()
+
+    print(f"  ⚖️  {n:,} filas · {len(REGLAS_DEDUCIBILIDAD.reglas)} reglas")
+    print(f"  Texto (object + isin)   : {t_txt * 1000:8.1f} ms")
+    print(f"  Códigos int8 + núcleo   : {(t_cod + t_nuc) * 1000:8.1f} ms "
+          f"(codificar {t_cod * 1000:.1f} + núcleo {t_nuc * 1000:.1f})")
+    print(f"  🚀 x{t_txt / (t_cod + t_nuc):.1f} (solo núcleo x{t_txt / t_nuc:.1f})")
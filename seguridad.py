@@ -12,6 +12,18 @@ class ConfiguracionSeguridad:
     MODO_ANONIMIZAR                = False
     CREAR_LOG_AUDITORIA            = True
     LOG_DIRECTORY                  = "logs_auditoria"
+    # Caché de lectura (models/cache_lectura.py): copia LOCAL de los datos
+    # ya parseados para no re-leer el mismo archivo. Mismo cuidado que
+    # los Excel originales — no compartir esta carpeta.
+    USAR_CACHE_LECTURA             = True
+    CACHE_DIRECTORY                = "cache_lectura"
+    CACHE_MAX_MB                   = 1024
+    # Caché de conceptos (models/cache_conceptos.py): texto del concepto
+    # → categoría, en CACHE_DIRECTORY/conceptos.sqlite
+    USAR_CACHE_CONCEPTOS           = True
+    CACHE_CONCEPTOS_MAX            = 100000
+    # Ajustes de palabras clave de un cliente (JSON, ver catalogo_palabras.py)
+    CATALOGO_CLIENTE               = ""
     MOSTRAR_ADVERTENCIA_PRIVACIDAD = True
 
     @staticmethod
@@ -27,6 +39,8 @@ class ConfiguracionSeguridad:
             print("  ✅ MODO ANONIMIZACIÓN ACTIVADO")
         if ConfiguracionSeguridad.CREAR_LOG_AUDITORIA:
             print(f"  📝 Log de auditoría: {ConfiguracionSeguridad.LOG_DIRECTORY}/")
+        if ConfiguracionSeguridad.USAR_CACHE_LECTURA or ConfiguracionSeguridad.USAR_CACHE_CONCEPTOS:
+            print(f"  ⚡ Caché de lectura local: {ConfiguracionSeguridad.CACHE_DIRECTORY}/")
         print("=" * 70)
         r = input("¿Deseas continuar? (SI/NO): ").strip().upper()
         if r not in ['SI', 'S', 'YES', 'Y']:
@@ -35,6 +49,61 @@ class ConfiguracionSeguridad:
         print()
 
 
+# ══════════════════════════════════════════════════════════════════
+# HASH SHA-256 DEL ORIGEN — lo usan la auditoría y la caché de lectura
+# ══════════════════════════════════════════════════════════════════
+
+# (ruta, tamaño, mtime) → hash: el mismo archivo no se lee dos veces
+# en una ejecución (log de inicio + clave de caché)
+_HASHES = {}
+
+
+def _archivos_xml(carpeta: str) -> list:
+    rutas = []
+    for raiz, _, archivos in sorted(os.walk(carpeta)):
+        for nombre in sorted(archivos):
+            if nombre.lower().endswith('.xml'):
+                rutas.append(os.path.join(raiz, nombre))
+    return rutas
+
+
+def _sha256_archivo(ruta: str) -> bytes:
+    h = hashlib.sha256()
+    with open(ruta, 'rb') as f:
+        for bloque in iter(lambda: f.read(1 << 20), b''):
+            h.update(bloque)
+    return h.digest()
+
+
+def hash_sha256(ruta: str) -> str:
+    """
+    SHA-256 del archivo, leído por bloques de 1 MB.
+    Carpeta de XML: hash de (nombre relativo, hash del contenido) en orden.
+    """
+    ruta = os.path.abspath(ruta)
+    if os.path.isdir(ruta):
+        rutas = _archivos_xml(ruta)
+        firma = tuple((p, os.stat(p).st_size, os.stat(p).st_mtime_ns) for p in rutas)
+    else:
+        st    = os.stat(ruta)
+        rutas = None
+        firma = (st.st_size, st.st_mtime_ns)
+    clave = (ruta, firma)
+    if clave in _HASHES:
+        return _HASHES[clave]
+
+    if rutas is None:
+        digest = _sha256_archivo(ruta).hex()
+    else:
+        h = hashlib.sha256()
+        for p in rutas:
+            h.update(os.path.relpath(p, ruta).encode('utf-8'))
+            h.update(_sha256_archivo(p))
+        digest = h.hexdigest()
+    _HASHES[clave] = digest
+    return digest
+
+
 class LogAuditoria:
 
     def __init__(self):
@@ -44,8 +113,7 @@ class LogAuditoria:
 
     def _hash(self, ruta: str) -> str:
         try:
-            with open(ruta, 'rb') as f:
-                return hashlib.sha256(f.read()).hexdigest()
+            return hash_sha256(ruta)
         except:
             return "NO_DISPONIBLE"
 
@@ -1,26 +1,41 @@
+/* ── Datos del reporte ─────────────────────────────────────────
+   generar_html() escribe las filas como JSON por columnas en
+   <script id="datos-reporte">; los textos repetidos (fecha, razón,
+   RFC, método, forma, uso, estatus) vienen una vez en D.catalogos y
+   cada fila guarda su posición. Solo las filas visibles existen en
+   el DOM (scroll virtual): todo el estado vive en estos arrays.
+   ─────────────────────────────────────────────────────────────── */
+const D = JSON.parse(document.getElementById('datos-reporte').textContent);
+const N = D.uuid.length;
+const cat = (campo, i) => D.catalogos[campo][D[campo][i]];
+
+// Python escribe 100.0 y JSON lo trae como 100: mismo texto en los inputs
+const numTxt = v => Number.isInteger(v) ? v.toFixed(1) : String(v);
+
+const original = D.estatus.map(c => D.catalogos.estatus[c]);
+const estatus  = original.slice();                                // valor del <select>
+const est      = D.flt.map(c => D.catalogos.flt[c]);              // data-est (filtros)
+const montos   = [D.sub2.map(numTxt), D.iva16.map(numTxt), D.sub0.map(numTxt)];
+const totales  = new Float64Array(N);                             // SUB2 + IVA16 + SUB0
+const obsTxt   = D.obs.map((o, i) => D.tipo[i] === 1 ? o
+                   : D.tipo[i] === 2 ? 'PPD sin CP01 - siguiente mes' : '-');
+
 /* ── Estado global ────────────────────────────────────────────── */
 let fa = 'todos';
-let dtable;
+const VS = { vista: [], alto: 0, ini: -1, fin: -1, buscar: '', col: 3, asc: true };
+const MARGEN = 12;                  // filas pintadas arriba/abajo de lo visible
 
 const STORE_KEY = 'reaf_cambios_' + document.title.replace(/\s+/g,'_');
 
-/* ── getUUID(): obtiene UUID del <tr> robusto con scrollX ─────── */
-function getUUID(tr) {
-  if (!tr) return '';
-  let uuid = tr.getAttribute('data-uuid') || '';
-  if (!uuid) {
-    const tdUu = tr.querySelector('td.uu[title]');
-    uuid = tdUu ? tdUu.getAttribute('title') : '';
-  }
-  if (!uuid && tr.cells[0]) uuid = tr.cells[0].getAttribute('title') || '';
-  return uuid.trim().toUpperCase();
-}
+const esc = s => String(s).replace(/[&<>"]/g,
+  c => ({ '&':'&amp;', '<':'&lt;', '>':'&gt;', '"':'&quot;' }[c]));
+const aNum = s => parseFloat(String(s).replace(/[^0-9.-]/g, '')) || 0;
 
 /* ── localStorage: guardar / borrar / leer cambios ───────────── */
-function guardarCambio(uuid, estatus) {
+function guardarCambio(uuid, cambio) {
   try {
     const d = JSON.parse(localStorage.getItem(STORE_KEY) || '{}');
-    d[uuid] = estatus;
+    d[uuid] = cambio;
     localStorage.setItem(STORE_KEY, JSON.stringify(d));
   } catch(e) { console.warn('localStorage no disponible', e); }
 }
@@ -36,49 +51,33 @@ function getCambios() {
   catch(e) { return {}; }
 }
 
-/* ── guardarFila(): persiste sub2+iva+sub0+estatus ───────────── */
-function guardarFila(tr) {
-  try {
-    const uuid = getUUID(tr);
-    if (!uuid) return;
-    const inputs = tr.querySelectorAll('.ip');
-    const sel    = tr.querySelector('.se');
-    const s2  = inputs[0] ? inputs[0].value : '';
-    const iva = inputs[1] ? inputs[1].value : '';
-    const s0  = inputs[2] ? inputs[2].value : '';
-    const estatus = sel ? sel.value : '';
-    const data = JSON.parse(localStorage.getItem(STORE_KEY) || '{}');
-    data[uuid] = { sub2: s2, iva: iva, sub0: s0, estatus: estatus };
-    localStorage.setItem(STORE_KEY, JSON.stringify(data));
-  } catch(e) { console.warn('localStorage error', e); }
-}
-
-/* ── restaurarCambios(): restaura sub2+iva+sub0+estatus al cargar */
+/* ── guardarFila(): persiste sub2+iva+sub0+estatus si difiere ── */
+function guardarFila(i) {
+  const uuid = D.uuid[i].trim().toUpperCase();
+  if (!uuid) return;
+  const igual = estatus[i] === original[i] &&
+                montos[0][i] === numTxt(D.sub2[i]) &&
+                montos[1][i] === numTxt(D.iva16[i]) &&
+                montos[2][i] === numTxt(D.sub0[i]);
+  if (igual) borrarCambio(uuid);
+  else guardarCambio(uuid, { sub2: montos[0][i], iva: montos[1][i],
+                             sub0: montos[2][i], estatus: estatus[i] });
+}
+
+/* ── restaurarCambios(): aplica los cambios guardados al modelo ─ */
 function restaurarCambios() {
   const cambios = getCambios();
   if (!Object.keys(cambios).length) return;
-  $(dtable.rows().nodes()).each(function() {
-    const tr   = this;
-    const uuid = getUUID(tr);
-    if (!uuid || !cambios[uuid]) return;
-    const fila   = cambios[uuid];
-    const inputs = tr.querySelectorAll('.ip');
-    if (inputs.length >= 3) {
-      if (fila.sub2 !== undefined) inputs[0].value = fila.sub2;
-      if (fila.iva  !== undefined) inputs[1].value = fila.iva;
-      if (fila.sub0 !== undefined) inputs[2].value = fila.sub0;
-      recalcularTotal(tr,
-        parseFloat(inputs[0].value) || 0,
-        parseFloat(inputs[1].value) || 0,
-        parseFloat(inputs[2].value) || 0);
-    }
-    const sel = tr.querySelector('.se');
-    if (sel && fila.estatus) { sel.value = fila.estatus; ce(sel, false); }
-  });
-  dtable.draw(false);
-  actualizarDiot();
-  actualizarContadores();
-  loadExt();
+  for (let i = 0; i < N; i++) {
+    const fila = cambios[D.uuid[i].trim().toUpperCase()];
+    if (!fila) continue;
+    if (typeof fila === 'string') { cambiarEstatus(i, fila, false); continue; }
+    if (fila.sub2 !== undefined) montos[0][i] = fila.sub2;
+    if (fila.iva  !== undefined) montos[1][i] = fila.iva;
+    if (fila.sub0 !== undefined) montos[2][i] = fila.sub0;
+    calcularTotal(i);
+    if (fila.estatus) cambiarEstatus(i, fila.estatus, false);
+  }
 }
 
 /* ── exportarCambiosCSV(): descarga cambios como CSV de respaldo ─ */
@@ -87,7 +86,10 @@ function exportarCambiosCSV() {
   const keys = Object.keys(cambios);
   if (!keys.length) { alert('No hay cambios guardados.'); return; }
   let csv = 'UUID,ESTATUS_MANUAL\n';
-  keys.forEach(uuid => { csv += uuid + ',' + cambios[uuid] + '\n'; });
+  keys.forEach(uuid => {
+    const c = cambios[uuid];
+    csv += uuid + ',' + (typeof c === 'string' ? c : c.estatus) + '\n';
+  });
   const blob = new Blob([csv], { type: 'text/csv;charset=utf-8;' });
   const url  = URL.createObjectURL(blob);
   const a    = document.createElement('a');
@@ -96,29 +98,23 @@ function exportarCambiosCSV() {
 }
 
 /* ── actualizarDiot(): recalcula DIOT con estatus actuales ──────
-   FIX: usa dtable.rows().nodes() en lugar de $('#tbl tbody tr')
-        para incluir filas de TODAS las páginas, no solo la visible.
+   Recorre el modelo (todas las filas), no el DOM.
    ─────────────────────────────────────────────────────────────── */
 function actualizarDiot() {
   const sec = document.getElementById('diot-section');
   if (!sec || sec.style.display === 'none') return;
 
   const provs = {};
-  $(dtable.rows().nodes()).each(function() {
-    const est = this.getAttribute('data-est') || '';
-    if (!est.startsWith('ded') && !est.startsWith('efe')) return;
-    const cells = this.cells;
-    const razon = cells[4] ? cells[4].innerText.trim() : '';
-    const rfc   = this.getAttribute('data-rfc') || '';
-    if (!rfc) return;
-    const s2  = parseFloat((cells[5]?.querySelector('input')?.value) || 0) || 0;
-    const i16 = parseFloat((cells[6]?.querySelector('input')?.value) || 0) || 0;
-    const s0  = parseFloat((cells[7]?.querySelector('input')?.value) || 0) || 0;
-    const tot = parseFloat(((cells[8]?.innerText || '0').replace(/[^0-9.]/g,''))) || 0;
-    if (!provs[rfc]) provs[rfc] = { razon, rfc, s2:0, i16:0, s0:0, tot:0 };
-    provs[rfc].s2  += s2;  provs[rfc].i16 += i16;
-    provs[rfc].s0  += s0;  provs[rfc].tot += tot;
-  });
+  for (let i = 0; i < N; i++) {
+    const e = est[i];
+    if (!e.startsWith('ded') && !e.startsWith('efe')) continue;
+    const rfc = cat('rfc', i);
+    if (!rfc) continue;
+    if (!provs[rfc]) provs[rfc] = { razon: cat('razon', i).trim(), rfc, s2:0, i16:0, s0:0, tot:0 };
+    const p = provs[rfc];
+    p.s2  += parseFloat(montos[0][i]) || 0;  p.i16 += parseFloat(montos[1][i]) || 0;
+    p.s0  += parseFloat(montos[2][i]) || 0;  p.tot += totales[i];
+  }
 
   const lista = Object.values(provs).sort((a,b) => a.razon.localeCompare(b.razon));
   const fmt   = v => v > 0 ? '$' + v.toFixed(2).replace(/\B(?=(\d{3})+(?!\d))/g,',') : '-';
@@ -127,7 +123,7 @@ function actualizarDiot() {
 
   let rows = lista.map((p,i) =>
     `<tr class="diot-row${i%2===0?' diot-alt':''}">
-      <td class="diot-rs">${p.razon}</td><td class="diot-rfc">${p.rfc}</td>
+      <td class="diot-rs">${esc(p.razon)}</td><td class="diot-rfc">${esc(p.rfc)}</td>
       <td class="diot-num">${fmt(p.s2)}</td><td class="diot-num">${fmt(p.i16)}</td>
       <td class="diot-num">${fmt(p.s0)}</td><td class="diot-tot">${fmt(p.tot)}</td>
     </tr>`
@@ -141,70 +137,175 @@ function actualizarDiot() {
   if (tbody) tbody.innerHTML = rows;
 }
 
-/* ── Filtro por deducibilidad (data-est del <tr>) ─────────────── */
-$.fn.dataTable.ext.search.push(function(settings, data, dataIndex) {
-  if (fa === 'todos') return true;
-  const row = dtable.row(dataIndex).node();
-  const est = (row ? row.getAttribute('data-est') : '') || '';
-  if (fa === 'ded16')       return est === 'ded16' || est === 'ded';
-  if (fa === 'ded0')        return est === 'ded0';
-  if (fa === 'ded160')      return est === 'ded160';
-  if (fa === 'efe')         return est.startsWith('efe');
-  if (fa === 'no-ded')      return est === 'no-ded';
-  if (fa === 'pendiente')   return est === 'pendiente';
-  if (fa === 'egreso')      return est === 'egreso';
-  if (fa === 'complemento') return est === 'complemento';
-  return true;
-});
+/* ── Filtro por deducibilidad (data-est de la fila) ───────────── */
+function pasaFiltro(e) {
+  if (fa === 'todos')       return true;
+  if (fa === 'ded16')       return e === 'ded16' || e === 'ded';
+  if (fa === 'efe')         return e.startsWith('efe');
+  return e === fa;          // ded0, ded160, no-ded, pendiente, egreso, complemento
+}
 
-/* ── Inicialización DataTable ─────────────────────────────────── */
-$(document).ready(function() {
-  dtable = $('#tbl').DataTable({
-    pageLength : 100,
-    lengthMenu : [25, 50, 100, 200, 500],
-    deferRender: true,
-    scrollX    : true,
-    autoWidth  : true,
-    order      : [[3, 'asc']],
-    stateSave  : true,
-    stateDuration: 0,
-    language   : {
-      search     : 'Buscar:',
-      lengthMenu : 'Mostrar _MENU_',
-      info       : '_START_ a _END_ de _TOTAL_',
-      paginate   : { previous: 'Ant', next: 'Sig' },
-      zeroRecords: 'Sin resultados'
-    },
-    columnDefs: [
-      { targets: [0],        width: '25px'  },
-      { targets: [1, 2],     width: '160px' },
-      { targets: [3],        width: '100px' },
-      { targets: [4],        width: '160px' },
-      { targets: [5, 6, 7],  width: '80px'  },
-      { targets: [8],        width: '90px'  },
-      { targets: [9, 10, 11],width: '140px' },
-      { targets: [12],       width: '140px' },
-      { targets: [13],       width: '220px' }
-    ]
-  });
+/* ── Buscador: todas las palabras deben aparecer en la fila ───── */
+function textoFila(i) {
+  return [D.uuid[i], D.rel[i], cat('fecha', i), cat('razon', i), cat('rfc', i),
+          montos[0][i], montos[1][i], montos[2][i], totales[i].toFixed(2),
+          cat('metodo', i), cat('forma', i), cat('uso', i), estatus[i], obsTxt[i]]
+         .join(' ').toLowerCase();
+}
 
-  $('#bq-custom').on('keyup', function() { dtable.search(this.value).draw(); });
-
-  // Inicializar fórmulas visibles en todas las filas al cargar
-  dtable.rows().every(function() {
-    const tr  = this.node();
-    const ins = tr ? tr.querySelectorAll('.ip') : [];
-    if (ins.length >= 3) {
-      recalcularTotal(tr,
-        parseFloat(ins[0].value)||0,
-        parseFloat(ins[1].value)||0,
-        parseFloat(ins[2].value)||0
-      );
+/* ── Orden por columna (clic en el encabezado) ────────────────── */
+const fechaOrden = s => s.split('/').reverse().join('');   // dd/mm/aaaa → aaaammdd
+function claveOrden(col) {
+  switch (col) {
+    case 0:  return i => i;
+    case 1:  return i => D.uuid[i];
+    case 2:  return i => D.rel[i];
+    case 3:  return i => fechaOrden(cat('fecha', i));
+    case 4:  return i => cat('razon', i);
+    case 5: case 6: case 7: return i => parseFloat(montos[col - 5][i]) || 0;
+    case 8:  return i => totales[i];
+    case 9:  return i => cat('metodo', i);
+    case 10: return i => cat('forma', i);
+    case 11: return i => cat('uso', i);
+    case 12: return i => estatus[i];
+    default: return i => obsTxt[i];
+  }
+}
+
+/* ── reconstruirVista(): filtro + búsqueda + orden → VS.vista ─── */
+function reconstruirVista() {
+  const palabras = VS.buscar.split(/\s+/).filter(Boolean);
+  const vista = [];
+  for (let i = 0; i < N; i++) {
+    if (!pasaFiltro(est[i])) continue;
+    if (palabras.length) {
+      const t = textoFila(i);
+      if (!palabras.every(p => t.includes(p))) continue;
     }
+    vista.push(i);
+  }
+  const clave = claveOrden(VS.col);
+  const k = new Map(vista.map(i => [i, clave(i)]));
+  const s = VS.asc ? 1 : -1;
+  vista.sort((a, b) => { const x = k.get(a), y = k.get(b);
+                         return x < y ? -s : x > y ? s : a - b; });
+  VS.vista = vista;
+  document.querySelectorAll('#tbl thead th').forEach((th, c) => {
+    th.classList.toggle('asc',  c === VS.col &&  VS.asc);
+    th.classList.toggle('desc', c === VS.col && !VS.asc);
   });
+  const info = document.getElementById('vs-info');
+  if (info) info.textContent = vista.length === N ? N + ' filas'
+                                                  : vista.length + ' de ' + N + ' filas';
+  pintar(true);
+}
 
+/* ── Una fila (mismas celdas que la tabla original) ───────────── */
+function claseEstatus(i) {
+  if (estatus[i] === original[i]) return 'se ' + cat('css', i);
+  return 'se ' + claseSelect(estatus[i]) + ' changed';
+}
+function opcionesHTML(i) {
+  const v = estatus[i];
+  let h = D.opciones.map(op =>
+    '<option value="' + esc(op) + '"' + (op === v ? ' selected' : '') + '>' + esc(op) + '</option>'
+  ).join('');
+  if (!D.opciones.includes(original[i]))
+    h += '<option value="' + esc(original[i]) + '"' + (original[i] === v ? ' selected' : '') + '>'
+       + esc(original[i]) + '</option>';
+  return h;
+}
+function obsHTML(i) {
+  const t = esc(obsTxt[i]);
+  if (D.tipo[i] === 1) return '<span class="cb" contenteditable="true" title="Clic para editar">' + t + '</span>';
+  if (D.tipo[i] === 2) return '<span class="pb" contenteditable="true">' + t + '</span>';
+  return '<span class="ob-txt" contenteditable="true">' + t + '</span>';
+}
+function filaHTML(i) {
+  const uuid = esc(D.uuid[i]), razon = esc(cat('razon', i));
+  const ip = (k, color) => '<td class="nm"><input type="text" class="ip" style="color:var(--' + color
+                         + ')" value="' + esc(montos[k][i]) + '" oninput="rc(this)"></td>';
+  return '<tr class="fr ' + cat('flt', i) + (D.tipo[i] === 1 ? ' fc' : '') + '" data-i="' + i
+    + '" data-est="' + est[i] + '" data-rfc="' + esc(cat('rfc', i)) + '" data-uuid="' + uuid + '">'
+    + '<td class="nx">' + (i + 1) + '</td>'
+    + '<td class="uu" title="' + uuid + '">' + uuid.toUpperCase() + '</td>'
+    + '<td class="uu" title="' + esc(D.uuid_rel[i]) + '">' + esc(D.rel[i]) + '</td>'
+    + '<td class="fd">' + esc(cat('fecha', i)) + '</td>'
+    + '<td class="rz" title="' + razon + '">' + razon + '</td>'
+    + ip(0, 'az') + ip(1, 'rs') + ip(2, 'vr')
+    + '<td class="tt" title="SUB2 + IVA16 + SUB0 = TOTAL"><b class="tot-val">' + totalTxt(i)
+    + '</b><span class="tot-formula">' + formulaTxt(i) + '</span></td>'
+    + '<td class="mt">' + esc(cat('metodo', i)) + '</td>'
+    + '<td class="mt">' + esc(cat('forma', i)) + '</td>'
+    + '<td class="mt">' + esc(cat('uso', i)) + '</td>'
+    + '<td class="ec"><select class="' + claseEstatus(i) + '" data-original="' + esc(original[i])
+    + '" onchange="ce(this)">' + opcionesHTML(i) + '</select></td>'
+    + '<td class="ob" title="' + esc(obsTxt[i]) + '">' + obsHTML(i) + '</td></tr>';
+}
+
+/* ── pintar(): solo las filas dentro del área visible ─────────── */
+function pintar(forzar = false) {
+  const cont  = document.getElementById('vs');
+  const tbody = document.querySelector('#tbl tbody');
+  if (!cont || !tbody) return;
+  const alto  = VS.alto || 48;
+  const total = VS.vista.length;
+  const ini = Math.max(0, Math.floor(cont.scrollTop / alto) - MARGEN);
+  const fin = Math.min(total, Math.ceil((cont.scrollTop + cont.clientHeight) / alto) + MARGEN);
+  if (!forzar && ini === VS.ini && fin === VS.fin) return;
+  VS.ini = ini; VS.fin = fin;
+
+  const hueco = h => h > 0 ? '<tr class="vs-hueco"><td colspan="14" style="height:' + h + 'px"></td></tr>' : '';
+  let html = hueco(ini * alto);
+  for (let p = ini; p < fin; p++) html += filaHTML(VS.vista[p]);
+  html += hueco((total - fin) * alto);
+  tbody.innerHTML = html;
+
+  // Altura real de una fila (depende de fuentes y zoom): medir una vez
+  if (!VS.alto) {
+    const tr = tbody.querySelector('tr.fr');
+    const h  = tr ? tr.getBoundingClientRect().height : 0;
+    if (h) { VS.alto = h; pintar(true); }
+  }
+}
+
+/* ── Inicialización ───────────────────────────────────────────── */
+$(document).ready(function() {
+  for (let i = 0; i < N; i++) calcularTotal(i);
   restaurarCambios();
+
+  const cont = document.getElementById('vs');
+  let cuadro = 0;
+  cont.addEventListener('scroll', () => {
+    if (!cuadro) cuadro = requestAnimationFrame(() => { cuadro = 0; pintar(); });
+  });
+  window.addEventListener('resize', () => pintar(true));
+
+  document.querySelectorAll('#tbl thead th').forEach((th, c) => {
+    th.addEventListener('click', () => {
+      VS.asc = VS.col === c ? !VS.asc : true;
+      VS.col = c;
+      reconstruirVista();
+    });
+  });
+
+  // OBS editable: el texto vive en el modelo (la fila se vuelve a pintar al hacer scroll)
+  document.querySelector('#tbl tbody').addEventListener('input', function(e) {
+    const ed = e.target.closest('[contenteditable]');
+    const tr = e.target.closest('tr');
+    if (ed && tr) obsTxt[+tr.dataset.i] = ed.textContent;
+  });
+
+  let espera = 0;
+  $('#bq-custom').on('input', function() {
+    const v = this.value;
+    clearTimeout(espera);
+    espera = setTimeout(() => { VS.buscar = v.trim().toLowerCase(); cont.scrollTop = 0; reconstruirVista(); }, 150);
+  });
+
+  reconstruirVista();
   actualizarContadores();
+  loadExt();
 });
 
 /* ── toggleDiot(): mostrar/ocultar DIOT ──────────────────────── */
@@ -228,28 +329,27 @@ function actualizarContadores() {
   let eSub16=0, eIva16=0, eSub0=0;   // efectivo deducible
   let mNod=0, mPen=0;                 // no deducibles y pendientes (sobre TOTAL)
 
-  $(dtable.rows().nodes()).each(function() {
-    const est  = this.getAttribute('data-est') || '';
-    const s2   = parseFloat(String($(this).find('.ip').eq(0).val()).replace(/[^0-9.-]/g, '')) || 0;
-    const i16  = parseFloat(String($(this).find('.ip').eq(1).val()).replace(/[^0-9.-]/g, '')) || 0;
-    const s0   = parseFloat(String($(this).find('.ip').eq(2).val()).replace(/[^0-9.-]/g, '')) || 0;
-    const tds  = $(this).find('td:eq(8)').text() || '0';
-    const tots = parseFloat(tds.replace(/[^0-9.-]/g,'')) || 0;
+  for (let i = 0; i < N; i++) {
+    const e    = est[i];
+    const s2   = aNum(montos[0][i]);
+    const i16  = aNum(montos[1][i]);
+    const s0   = aNum(montos[2][i]);
+    const tots = totales[i];
     tot++;
 
-    if      (est === 'ded16' || est === 'ded') { cnt16++;  dSub16 += s2; dIva16 += i16; }
-    else if (est === 'ded0')                   { cnt0++;   dSub0  += s0; }
-    else if (est === 'ded160')                 { cnt160++; dSub16 += s2; dIva16 += i16; dSub0 += s0; }
-    else if (est === 'efe16')                  { e16++;    eSub16 += s2; eIva16 += i16; }
-    else if (est === 'efe0')                   { e0++;     eSub0  += s0; }
-    else if (est === 'efe160')                 { e160++;   eSub16 += s2; eIva16 += i16; eSub0 += s0; }
-    else if (est === 'no-ded')                 { nod++;    mNod   += tots; }
-    else if (est === 'pendiente')              { pen++;    mPen   += tots; }
-    else if (est === 'egreso')                 { eg++; }
-    else if (est === 'complemento')            { cp++; }
-    else if (est === 'otro-mes')               { tom++; }
-    else if (est === 'mes-ant')                { tma++; }
-  });
+    if      (e === 'ded16' || e === 'ded') { cnt16++;  dSub16 += s2; dIva16 += i16; }
+    else if (e === 'ded0')                 { cnt0++;   dSub0  += s0; }
+    else if (e === 'ded160')               { cnt160++; dSub16 += s2; dIva16 += i16; dSub0 += s0; }
+    else if (e === 'efe16')                { e16++;    eSub16 += s2; eIva16 += i16; }
+    else if (e === 'efe0')                 { e0++;     eSub0  += s0; }
+    else if (e === 'efe160')               { e160++;   eSub16 += s2; eIva16 += i16; eSub0 += s0; }
+    else if (e === 'no-ded')               { nod++;    mNod   += tots; }
+    else if (e === 'pendiente')            { pen++;    mPen   += tots; }
+    else if (e === 'egreso')               { eg++; }
+    else if (e === 'complemento')          { cp++; }
+    else if (e === 'otro-mes')             { tom++; }
+    else if (e === 'mes-ant')              { tma++; }
+  }
 
   const totalSub16 = dSub16 + eSub16;          // SUB16% total (ded + efe)
   const totalIva16 = dIva16 + eIva16;          // IVA acreditable total (ded + efe)
@@ -305,57 +405,67 @@ function ft(t, btn) {
   fa = t;
   document.querySelectorAll('.fls .bf').forEach(b => b.classList.remove('ac'));
   if (btn) btn.classList.add('ac');
-  dtable.draw();
+  document.getElementById('vs').scrollTop = 0;
+  reconstruirVista();
 }
 
-/* ── ce(): color + data-est + localStorage ──────────────────────
-   FIX PRINCIPAL: función única con parámetro guardar=true.
-   La segunda definición anterior (sin guardarCambio) causaba que
-   los cambios del usuario no se persistieran en localStorage.
-   ─────────────────────────────────────────────────────────────── */
-function ce(sel, guardar = true) {
-  const v = sel.value;
-  const o = sel.dataset.original;
-  sel.className = 'se';
-
-  if      (v.includes('COMPLE'))                        sel.classList.add('complemento');
-  else if (v.includes('PEND'))                          sel.classList.add('pendiente');
-  else if (v.includes('OTRO MES'))                      sel.classList.add('otro-mes');
-  else if (v.includes('MES ANTER'))                     sel.classList.add('mes-ant');
-  else if (v.includes('NO DED') || v.includes('ERROR')) sel.classList.add('no-ded');
-  else if (v.includes('EGRESO'))                        sel.classList.add('egreso');
-  else if (v.includes('16 Y 0'))                        sel.classList.add('mix');
-  else if (v.includes('0%') && !v.includes('16'))       sel.classList.add('ded0');
-  else if (v.includes('16%'))                           sel.classList.add('ded16');
-  else                                                  sel.classList.add('no-ded');
-
-  if (v !== o) sel.classList.add('changed');
-  else         sel.classList.remove('changed');
+/* ── Estatus → clase del <select> / data-est ──────────────────── */
+function claseSelect(v) {
+  if      (v.includes('COMPLE'))                        return 'complemento';
+  else if (v.includes('PEND'))                          return 'pendiente';
+  else if (v.includes('OTRO MES'))                      return 'otro-mes';
+  else if (v.includes('MES ANTER'))                     return 'mes-ant';
+  else if (v.includes('NO DED') || v.includes('ERROR')) return 'no-ded';
+  else if (v.includes('EGRESO'))                        return 'egreso';
+  else if (v.includes('16 Y 0'))                        return 'mix';
+  else if (v.includes('0%') && !v.includes('16'))       return 'ded0';
+  else if (v.includes('16%'))                           return 'ded16';
+  return 'no-ded';
+}
+function estDe(v) {
+  if      (v.includes('COMPLE'))                        return 'complemento';
+  else if (v.includes('PEND'))                          return 'pendiente';
+  else if (v.includes('OTRO MES'))                      return 'otro-mes';
+  else if (v.includes('MES ANTER'))                     return 'mes-ant';
+  else if (v.includes('NO DED') || v.includes('ERROR')) return 'no-ded';
+  else if (v.includes('EGRESO'))                        return 'egreso';
+  else if (v.includes('EFE') && v.includes('0%'))       return 'efe0';
+  else if (v.includes('EFE'))                           return 'efe16';
+  else if (v.includes('16 Y 0'))                        return 'ded160';
+  else if (v.includes('0%'))                            return 'ded0';
+  else if (v.includes('DED'))                           return 'ded16';
+  return 'no-ded';
+}
 
+/* ── cambiarEstatus(): modelo + localStorage ──────────────────── */
+function cambiarEstatus(i, v, guardar = true) {
+  estatus[i] = v;
+  est[i]     = v === original[i] ? D.catalogos.flt[D.flt[i]] : estDe(v);
+  if (guardar) guardarFila(i);
+}
+
+/* ── refrescarFila(): total, select y data-est de una fila pintada
+      (sin volver a crear los inputs: no pierden el foco) ─────── */
+function refrescarFila(tr, i) {
+  tr.setAttribute('data-est', est[i]);
+  const totVal = tr.querySelector('.tot-val');
+  const totFrm = tr.querySelector('.tot-formula');
+  if (totVal) totVal.textContent = totalTxt(i);
+  if (totFrm) totFrm.textContent = formulaTxt(i);
+  const sel = tr.querySelector('.se');
+  if (sel) { sel.value = estatus[i]; sel.className = claseEstatus(i); }
+}
+function filaPintada(i) {
+  return document.querySelector('#tbl tbody tr[data-i="' + i + '"]');
+}
+
+/* ── ce(): cambio manual de estatus en el <select> ─────────────── */
+function ce(sel, guardar = true) {
   const tr = sel.closest('tr');
-  if (tr) {
-    let est = 'no-ded';
-    if      (v.includes('COMPLE'))                        est = 'complemento';
-    else if (v.includes('PEND'))                          est = 'pendiente';
-    else if (v.includes('OTRO MES'))                      est = 'otro-mes';
-    else if (v.includes('MES ANTER'))                     est = 'mes-ant';
-    else if (v.includes('NO DED') || v.includes('ERROR')) est = 'no-ded';
-    else if (v.includes('EGRESO'))                        est = 'egreso';
-    else if (v.includes('EFE') && v.includes('0%'))       est = 'efe0';
-    else if (v.includes('EFE'))                           est = 'efe16';
-    else if (v.includes('16 Y 0'))                        est = 'ded160';
-    else if (v.includes('0%'))                            est = 'ded0';
-    else if (v.includes('DED'))                           est = 'ded16';
-    tr.setAttribute('data-est', est);
-
-    if (guardar) {
-      const uuid = (tr.cells[1] ? tr.cells[1].getAttribute('title') || '' : '').trim().toUpperCase();
-      if (uuid) {
-        if (v !== o) guardarCambio(uuid, v);
-        else         borrarCambio(uuid);
-      }
-    }
-  }
+  if (!tr) return;
+  const i = +tr.dataset.i;
+  cambiarEstatus(i, sel.value, guardar);
+  refrescarFila(tr, i);
   actualizarContadores();
 }
 
@@ -366,63 +476,59 @@ function limpiarCambios() {
   location.reload();
 }
 
-/* ── beforeunload: guardar todas las filas al cerrar/recargar ─── */
-window.addEventListener('beforeunload', function() {
-  try {
-    $(dtable.rows().nodes()).each(function() {
-      guardarFila(this);
-    });
-  } catch(e) {}
-});
-
-/* ── recalcularTotal(): SUB2 + IVA16 + SUB0 = TOTAL ───────────── */
-function recalcularTotal(tr, s2, i16, s0) {
-  const total  = Math.round((s2 + i16 + s0) * 100) / 100;
-  const totVal = tr.querySelector('.tot-val');
-  const totFrm = tr.querySelector('.tot-formula');
-  if (totVal) {
-    totVal.textContent = '$' + total.toLocaleString('es-MX', {
-      minimumFractionDigits: 2, maximumFractionDigits: 2
-    });
-  }
-  if (totFrm) {
-    const fmt = v => v % 1 === 0 ? v.toFixed(0) : v.toFixed(2);
-    totFrm.textContent = (s2||i16||s0) ? fmt(s2)+' + '+fmt(i16)+' + '+fmt(s0) : '';
-  }
-  return total;
+/* ── calcularTotal(): SUB2 + IVA16 + SUB0 = TOTAL ─────────────── */
+function calcularTotal(i) {
+  const s2  = parseFloat(montos[0][i]) || 0;
+  const i16 = parseFloat(montos[1][i]) || 0;
+  const s0  = parseFloat(montos[2][i]) || 0;
+  totales[i] = Math.round((s2 + i16 + s0) * 100) / 100;
+  return totales[i];
+}
+function totalTxt(i) {
+  return '$' + totales[i].toLocaleString('es-MX', {
+    minimumFractionDigits: 2, maximumFractionDigits: 2
+  });
+}
+function formulaTxt(i) {
+  const s2  = parseFloat(montos[0][i]) || 0;
+  const i16 = parseFloat(montos[1][i]) || 0;
+  const s0  = parseFloat(montos[2][i]) || 0;
+  const fmt = v => v % 1 === 0 ? v.toFixed(0) : v.toFixed(2);
+  return (s2||i16||s0) ? fmt(s2)+' + '+fmt(i16)+' + '+fmt(s0) : '';
 }
 
-/* ── rc(): recalcular estatus al editar montos ────────────────── */
-function rc(inp) {
-  const tr = inp.closest('tr');
-  if (!tr) return;
-  const ins = tr.querySelectorAll('.ip');
-  if (ins.length < 3) return;
-  const s2  = parseFloat(ins[0].value) || 0;
-  const i16 = parseFloat(ins[1].value) || 0;
-  const s0  = parseFloat(ins[2].value) || 0;
-  const tot = recalcularTotal(tr, s2, i16, s0);
-  guardarFila(tr);
-  const sel = tr.querySelector('.se');
-  if (!sel) return;
-  const forma = (tr.cells[9]?.innerText  || '').trim();
-  const uso   = (tr.cells[10]?.innerText || '').trim();
-  const met   = (tr.cells[8]?.innerText  || '').trim();
-  const fp = forma.substring(0,2);
-  const uc = uso.substring(0,3).toUpperCase();
-  const mc = met.substring(0,3).toUpperCase();
-  if (uc === 'S01') { sel.value = 'NO DEDUCIBLE'; ce(sel); return; }
+/* ── aplicarMontos(): total + estatus sugerido al editar montos ── */
+function aplicarMontos(i) {
+  const tot = calcularTotal(i);
+  guardarFila(i);
+  const s2  = parseFloat(montos[0][i]) || 0;
+  const i16 = parseFloat(montos[1][i]) || 0;
+  const s0  = parseFloat(montos[2][i]) || 0;
+  const fp = cat('forma', i).trim().substring(0,2);
+  const uc = cat('uso', i).trim().substring(0,3).toUpperCase();
+  const mc = cat('metodo', i).trim().substring(0,3).toUpperCase();
+  if (uc === 'S01') { cambiarEstatus(i, 'NO DEDUCIBLE'); return; }
   if (!['G01','G02','G03'].includes(uc) ||
       !['PUE','PPD'].includes(mc)       ||
       !['01','02','03','04','28'].includes(fp)) return;
-  if (fp==='01' && tot>=2000) { sel.value='NO DEDUCIBLE: Efectivo >= $2,000'; ce(sel); return; }
-  if (uc==='G02') { sel.value='EGRESO'; ce(sel); return; }
+  if (fp==='01' && tot>2000) { cambiarEstatus(i, 'NO DEDUCIBLE: Efectivo >= $2,000'); return; }
+  if (uc==='G02') { cambiarEstatus(i, 'EGRESO'); return; }
   let suf = 'NO DEDUCIBLE';
   if      (s2>0 && i16>0 && s0===0) suf='16%';
   else if (s2>0 && i16>0 && s0>0)  suf='16 Y 0%';
   else if (s2===0 && i16===0 && s0>0) suf='0%';
-  sel.value = (fp==='01' ? 'EFE ' : 'DED ') + suf;
-  ce(sel);
+  cambiarEstatus(i, (fp==='01' ? 'EFE ' : 'DED ') + suf);
+}
+
+/* ── rc(): recalcular al editar montos en la fila ─────────────── */
+function rc(inp) {
+  const tr = inp.closest('tr');
+  if (!tr) return;
+  const i = +tr.dataset.i;
+  tr.querySelectorAll('.ip').forEach((x, k) => { montos[k][i] = x.value; });
+  aplicarMontos(i);
+  refrescarFila(tr, i);
+  actualizarContadores();
 }
 
 /* ── Extras Módulos (Nómina y Depreciación) ───────────────────── */
@@ -482,6 +588,26 @@ function calcExtTotals() {
   if(document.getElementById('tot-dep-total')) document.getElementById('tot-dep-total').textContent = fmt(dTot);
 }
 
+/* ── Pegado desde Excel (Ctrl+V) y deshacer (Ctrl+Z) ───────────
+   Tabla principal: el pegado va al modelo por posición en la vista
+   (puede cubrir filas que aún no están pintadas). Nómina y
+   depreciación: directo a los inputs.
+   ─────────────────────────────────────────────────────────────── */
+const COL_MONTO = { 5: 0, 6: 1, 7: 2 };   // td → montos[k]
+const COL_ESTATUS = 12;
+
+function asignarCelda(i, col, val) {
+  if (col in COL_MONTO) {
+    montos[COL_MONTO[col]][i] = val;
+    aplicarMontos(i);
+  } else if (col === COL_ESTATUS) {
+    cambiarEstatus(i, val);
+  }
+}
+function leerCelda(i, col) {
+  return col in COL_MONTO ? montos[COL_MONTO[col]][i] : estatus[i];
+}
+
 let pasteHistory = [];
 document.addEventListener('keydown', function(e) {
   if (e.ctrlKey && e.key === 'z' && pasteHistory.length > 0) {
@@ -489,13 +615,18 @@ document.addEventListener('keydown', function(e) {
     if (!isIp) {
       e.preventDefault();
       const lastState = pasteHistory.pop();
+      let principal = false;
       lastState.forEach(item => {
         if (item.el) {
           item.el.value = item.oldVal;
           item.el.dispatchEvent(new Event('input', { bubbles: true }));
           item.el.dispatchEvent(new Event('change', { bubbles: true }));
+        } else {
+          asignarCelda(item.fila, item.col, item.oldVal);
+          principal = true;
         }
       });
+      if (principal) { pintar(true); actualizarContadores(); }
     }
   }
 });
@@ -520,25 +651,44 @@ document.addEventListener('paste', function(e) {
   const td = target.closest('td');
   if (!tbody || !tr || !td) return;
 
-  const startRowIdx = Array.from(tbody.children).indexOf(tr);
   const startColIdx = Array.from(tr.children).indexOf(td);
-  
-  let tblType = 'main';
-  if (tbody.id === 'tbody-nom' || (isExtTbl && isExtTbl.id === 'tbl-nom')) tblType = 'nom';
-  else if (tbody.id === 'tbody-dep' || (isExtTbl && isExtTbl.id === 'tbl-dep')) tblType = 'dep';
-
   const historyItem = [];
 
+  if (isMainTbl) {
+    const inicio = VS.vista.indexOf(+tr.dataset.i);
+    rows.forEach((rowCells, rOffset) => {
+      if (rowCells.length === 1 && rowCells[0].trim() === '') return;
+      const i = VS.vista[inicio + rOffset];
+      if (i === undefined) return;
+      rowCells.forEach((cellData, cOffset) => {
+        const col = startColIdx + cOffset;
+        if (!(col in COL_MONTO) && col !== COL_ESTATUS) return;
+        let val = cellData.trim();
+        // como el <select>: solo acepta una de sus opciones
+        if (col === COL_ESTATUS && !D.opciones.includes(val) && val !== original[i]) return;
+        if (col in COL_MONTO) val = val.replace(/[^0-9A-Za-z. ,\/ñÑáéíóúÁÉÍÓÚ-]/g, '');
+        historyItem.push({ fila: i, col: col, oldVal: leerCelda(i, col) });
+        asignarCelda(i, col, val);
+      });
+    });
+    pintar(true);
+    actualizarContadores();
+    if (historyItem.length > 0) pasteHistory.push(historyItem);
+    return;
+  }
+
+  const startRowIdx = Array.from(tbody.children).indexOf(tr);
+  const tblType = isExtTbl.id === 'tbl-nom' ? 'nom' : 'dep';
+
   rows.forEach((rowCells, rOffset) => {
     if (rowCells.length === 1 && rowCells[0].trim() === '') return;
-    
+
     if (tblType === 'nom' && rowCells.length >= 11 && rowCells[7].trim() === '' && rowCells[8].trim() === '') {
         rowCells.splice(7, 2);
     }
-    
+
     let targetRow = tbody.children[startRowIdx + rOffset];
     if (!targetRow) {
-      if (tblType === 'main') return;
       const clone = tbody.rows[0].cloneNode(true);
       clone.querySelectorAll('input, select').forEach(inp => inp.value = '');
       clone.querySelectorAll('.ext-sum, .ext-tot').forEach(inp => inp.textContent = '$0.00');
@@ -565,7 +715,6 @@ document.addEventListener('paste', function(e) {
   if (historyItem.length > 0) pasteHistory.push(historyItem);
 });
 
-
 function saveExt() {
   calcExtTotals();
   const data = { nom: [], dep: [] };
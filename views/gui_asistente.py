@@ -123,7 +123,7 @@ def mostrar_asistente_gui():
         return outer, bar, inner
 
     # ── 1. ARCHIVO ────────────────────────────────────────────────
-    _section_label(frame_main, "1", "ARCHIVO EXCEL A PROCESAR", C_ROSA)
+    _section_label(frame_main, "1", "ARCHIVO EXCEL O CARPETA XML", C_ROSA)
 
     card_f, bar_f, inner_f = _card(frame_main, C_BORDER)
 
@@ -137,7 +137,9 @@ def mostrar_asistente_gui():
     def select_file():
         ruta = filedialog.askopenfilename(
             title="Seleccionar Excel",
-            filetypes=[("Excel", "*.xlsx *.xls *.xlsm")])
+            filetypes=[("Excel", "*.xlsx *.xls *.xlsm"),
+                       ("CSV", "*.csv *.txt"),
+                       ("Parquet / Arrow", "*.parquet *.pq *.arrow *.ipc *.feather")])
         if ruta:
             resultado['file_path'] = ruta
             file_var.set(f"📂  {os.path.basename(ruta)}")
@@ -145,11 +147,27 @@ def mostrar_asistente_gui():
             bar_f.config(bg=C_VERDE)
             card_f.config(bg=C_VERDE)
 
-    tk.Button(frame_main, text="BUSCAR ARCHIVO",
+    def select_folder():
+        ruta = filedialog.askdirectory(title="Seleccionar carpeta con XML CFDI")
+        if ruta:
+            resultado['file_path'] = ruta
+            file_var.set(f"🧾  {os.path.basename(os.path.normpath(ruta))}  (XML)")
+            lbl_file.config(fg=C_VERDE)
+            bar_f.config(bg=C_VERDE)
+            card_f.config(bg=C_VERDE)
+
+    frame_btns_f = tk.Frame(frame_main, bg=C_BG)
+    frame_btns_f.pack(anchor="e", pady=(5,0))
+    tk.Button(frame_btns_f, text="CARPETA XML",
+              font=F_BTN, bg=C_AZUL, fg="#FFF",
+              activebackground="#0046CC", activeforeground="#FFF",
+              relief="flat", cursor="hand2", padx=14, pady=6,
+              command=select_folder).pack(side="left", padx=(0,6))
+    tk.Button(frame_btns_f, text="BUSCAR ARCHIVO",
               font=F_BTN, bg=C_ROSA, fg="#FFF",
               activebackground="#CC1F5F", activeforeground="#FFF",
               relief="flat", cursor="hand2", padx=14, pady=6,
-              command=select_file).pack(anchor="e", pady=(5,0))
+              command=select_file).pack(side="left")
 
     # ── 2. PERIODO ────────────────────────────────────────────────
     _section_label(frame_main, "2", "PERIODO DEL REPORTE", C_AMARILLO)
@@ -393,7 +411,7 @@ def mostrar_asistente_gui():
     def on_iniciar():
         if not resultado['file_path']:
             _dialogo_aviso("Atención",
-                           "Selecciona un archivo Excel primero.")
+                           "Selecciona un archivo Excel o una carpeta de XML primero.")
             return
         if _dialogo_confirmar("Confirmación LFPDPPP",
             "Sus datos se procesarán localmente\nsin uso de internet.\n\n"